@@ -0,0 +1,149 @@
+"""
+Local stand-ins for the SageMaker runtime and the Vanna vector store so the
+LLM paths can be exercised without AWS credentials or a hosted model.
+"""
+import io
+import json
+import random
+import re
+import threading
+import time
+from typing import Callable
+
+from vanna.base import VannaBase
+
+from sagemaker_llm import SageMakerLLM
+
+# Questions with known-good SQL against Chinook.sqlite, for canned_llama_response
+CHINOOK_QUESTIONS = {
+    "How many artists are there?": "SELECT COUNT(*) AS artists FROM Artist",
+    "Which 10 artists have the most albums?": "SELECT ar.Name, COUNT(al.AlbumId) AS albums FROM Artist ar JOIN Album al ON al.ArtistId = ar.ArtistId GROUP BY ar.ArtistId ORDER BY albums DESC LIMIT 10",
+    "What are the total sales per country?": "SELECT BillingCountry, SUM(Total) AS sales FROM Invoice GROUP BY BillingCountry ORDER BY sales DESC",
+    "What are the monthly sales?": "SELECT strftime('%Y-%m', InvoiceDate) AS month, SUM(Total) AS sales FROM Invoice GROUP BY month ORDER BY month",
+    "Which genres have the most tracks?": "SELECT g.Name, COUNT(*) AS tracks FROM Track t JOIN Genre g ON g.GenreId = t.GenreId GROUP BY g.GenreId ORDER BY tracks DESC",
+    "Who are the top 5 customers by spend?": "SELECT c.FirstName, c.LastName, SUM(i.Total) AS spend FROM Customer c JOIN Invoice i ON i.CustomerId = c.CustomerId GROUP BY c.CustomerId ORDER BY spend DESC LIMIT 5",
+    "List all tracks with their album and artist": "SELECT t.Name AS track, al.Title AS album, ar.Name AS artist FROM Track t JOIN Album al ON al.AlbumId = t.AlbumId JOIN Artist ar ON ar.ArtistId = al.ArtistId",
+    "What is the average track length per media type?": "SELECT m.Name, AVG(t.Milliseconds) / 1000.0 AS seconds FROM Track t JOIN MediaType m ON m.MediaTypeId = t.MediaTypeId GROUP BY m.MediaTypeId",
+}
+
+
+def canned_llama_response(payload: dict) -> str:
+    """
+    Answers like Llama 3 would for the prompts SageMakerLLM sends: SQL in a code fence for the
+    CHINOOK_QUESTIONS, a numbered list for follow-up questions, and a short title otherwise.
+    """
+    last = payload["messages"][-1]["content"]
+    if "follow-up questions" in last:
+        return "\n".join(f"{i}. {question}" for i, question in enumerate(list(CHINOOK_QUESTIONS)[:5], start=1))
+    if "title" in last:
+        return "Chinook sales overview"
+    sql = CHINOOK_QUESTIONS.get(last.strip(), "SELECT * FROM Artist LIMIT 10")
+    return f"Here is the SQL query:\n\n```sql\n{sql}\n```"
+
+
+def lognormal(median: float, sigma: float = 0.25) -> Callable[[], float]:
+    """
+    A latency distribution for FakeSageMakerRuntime: log-normal around `median` seconds, with the long
+    right tail real endpoints show. sigma=0 always returns the median.
+    """
+    return lambda: median * random.lognormvariate(0, sigma) if sigma else median
+
+
+class FakeTokenizer:
+    """
+    Counts whitespace-separated words, so token counting works without transformers installed.
+    """
+    def encode(self, text: str, **kwargs) -> list[str]:
+        return text.split()
+
+
+class FakeSageMakerRuntime:
+    """
+    Mimics the parts of the boto3 'sagemaker-runtime' client used by SageMakerLLM.
+
+    Args:
+        response: The canned completion, or a callable that builds one from the request payload.
+        ttft: Seconds before the first token is produced (prefill), or a callable sampling it (see lognormal).
+        token_latency: Seconds between subsequent tokens (decode), or a callable sampling it.
+    """
+    def __init__(self, response="SELECT * FROM Artist LIMIT 10;", ttft=0.5, token_latency=0.02):
+        self.response = response
+        self.ttft = ttft if callable(ttft) else lambda: ttft
+        self.token_latency = token_latency if callable(token_latency) else lambda: token_latency
+        self.invocations = 0
+        self._lock = threading.Lock()
+
+    def _completion(self, body: str) -> str:
+        with self._lock:
+            self.invocations += 1
+        return self.response(json.loads(body)) if callable(self.response) else self.response
+
+    def invoke_endpoint(self, EndpointName, ContentType, Body, **kwargs):
+        completion = self._completion(Body)
+        time.sleep(self.ttft() + self.token_latency() * len(re.findall(r"\S+\s*", completion)))
+        data = {"choices": [{"message": {"role": "assistant", "content": completion}}]}
+        return {"Body": io.BytesIO(json.dumps(data).encode("utf-8"))}
+
+    def invoke_endpoint_with_response_stream(self, EndpointName, ContentType, Body, **kwargs):
+        completion = self._completion(Body)
+
+        def events():
+            time.sleep(self.ttft())
+            for i, token in enumerate(re.findall(r"\S+\s*", completion)):
+                if i:
+                    time.sleep(self.token_latency())
+                chunk = {"choices": [{"delta": {"content": token}}]}
+                line = f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+                # Split each line across two PayloadParts, as the real endpoint may
+                yield {"PayloadPart": {"Bytes": line[:len(line) // 2]}}
+                yield {"PayloadPart": {"Bytes": line[len(line) // 2:]}}
+            yield {"PayloadPart": {"Bytes": b"data: [DONE]\n\n"}}
+
+        return {"Body": events()}
+
+
+class StubVectorStore(VannaBase):
+    """
+    A vector store that returns no training data, for benchmarking the LLM path in isolation.
+    """
+    def __init__(self, config=None):
+        VannaBase.__init__(self, config=config)
+
+    def generate_embedding(self, data: str, **kwargs) -> list:
+        return []
+
+    def get_similar_question_sql(self, question: str, **kwargs) -> list:
+        return []
+
+    def get_related_ddl(self, question: str, **kwargs) -> list:
+        return []
+
+    def get_related_documentation(self, question: str, **kwargs) -> list:
+        return []
+
+    def add_question_sql(self, question: str, sql: str, **kwargs) -> str:
+        return ""
+
+    def add_ddl(self, ddl: str, **kwargs) -> str:
+        return ""
+
+    def add_documentation(self, documentation: str, **kwargs) -> str:
+        return ""
+
+    def get_training_data(self, **kwargs):
+        return None
+
+    def remove_training_data(self, id: str, **kwargs) -> bool:
+        return False
+
+
+class BenchVanna(StubVectorStore, SageMakerLLM):
+    """
+    SageMakerLLM over the stub vector store. Pass {"client": FakeSageMakerRuntime(...)} in the config
+    to avoid calling AWS, and {"fake_tokenizer": True} to count tokens without transformers.
+    """
+    def __init__(self, config=None):
+        StubVectorStore.__init__(self, config=config)
+        SageMakerLLM.__init__(self, config=config)
+        if config.get("fake_tokenizer"):
+            self._tokenizer = FakeTokenizer()
@@ -0,0 +1,216 @@
+"""
+Drives the Flask routes end to end against Chinook.sqlite, with a fake SageMaker endpoint and the
+stub vector store, and reports throughput, latency percentiles, memory growth and cache hit rates.
+
+Each simulated user asks a question and then follows the UI: generate_sql, run_sql, load_question
+and generate_followup_questions. Questions are drawn from a small pool so repeats exercise the caches.
+
+    python -m benchmarks.load --concurrency 8 --sessions 200 --ttft 0.3 --output run.json
+    python -m benchmarks.load --compare run.json  # print the change against an earlier run
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from werkzeug.serving import make_server
+
+from custom_vanna_flask import CustomVannaFlaskApp
+from llm_cache import MemoryResponseCache
+
+from .fakes import CHINOOK_QUESTIONS, BenchVanna, FakeSageMakerRuntime, canned_llama_response, lognormal
+
+ROUTES = ("generate_sql", "run_sql", "load_question", "generate_followup_questions")
+
+
+def rss_bytes() -> int:
+    # Current resident set size on Linux; peak RSS elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (FileNotFoundError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(latencies: list[float], errors: int) -> dict:
+    if not latencies:
+        return {"count": 0, "errors": errors}
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "mean": statistics.fmean(latencies),
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99)),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {route: [] for route in ROUTES + ("session",)}
+        self.errors = {route: 0 for route in ROUTES + ("session",)}
+        self._lock = threading.Lock()
+
+    def requests(self) -> int:
+        return sum(len(self.latencies[route]) + self.errors[route] for route in ROUTES)
+
+    def add(self, route: str, seconds: float, ok: bool):
+        with self._lock:
+            if ok:
+                self.latencies[route].append(seconds)
+            else:
+                self.errors[route] += 1
+
+
+def run_session(base_url: str, question: str, recorder: Recorder, local: threading.local):
+    # One HTTP session per worker thread, so connections are reused like a browser would
+    if not hasattr(local, "session"):
+        local.session = requests.Session()
+
+    def call(route: str, **params) -> dict | None:
+        start = time.perf_counter()
+        try:
+            response = local.session.get(f"{base_url}/api/v0/{route}", params=params, timeout=120)
+            body = response.json()
+            ok = response.ok and body.get("type") != "error"
+        except (requests.RequestException, ValueError):
+            body, ok = None, False
+        recorder.add(route, time.perf_counter() - start, ok)
+        return body if ok else None
+
+    start = time.perf_counter()
+    generated = call("generate_sql", question=question)
+    ok = generated is not None and generated.get("type") == "sql"
+    if ok:
+        id = generated["id"]
+        ok = call("run_sql", id=id) is not None
+        ok = ok and call("load_question", id=id) is not None
+        ok = ok and call("generate_followup_questions", id=id) is not None
+    recorder.add("session", time.perf_counter() - start, ok)
+
+
+def drive(base_url: str, questions: list[str], concurrency: int) -> tuple[Recorder, float]:
+    """
+    Replays one session per question against a running server, `concurrency` sessions at a time.
+
+    Returns:
+        tuple: The recorded latencies and the elapsed seconds.
+    """
+    recorder, local = Recorder(), threading.local()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda question: run_session(base_url, question, recorder, local), questions))
+    return recorder, time.perf_counter() - start
+
+
+def sample_questions(sessions: int, distinct: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    pool = list(CHINOOK_QUESTIONS)[:distinct]
+    return [rng.choice(pool) for _ in range(sessions)]
+
+
+def run(args) -> dict:
+    client = FakeSageMakerRuntime(
+        response=canned_llama_response,
+        ttft=lognormal(args.ttft, args.sigma),
+        token_latency=args.token_latency,
+    )
+    vn = BenchVanna(config={
+        "endpoint_name": "fake-endpoint",
+        "client": client,
+        "fake_tokenizer": True,
+        "temperature": args.temperature,
+        "response_cache": MemoryResponseCache(max_entries=1024) if args.response_cache else None,
+    })
+    vn.log = lambda message, title="Info": None
+    vn.connect_to_sqlite(args.database)
+
+    app = CustomVannaFlaskApp(vn=vn, debug=False, allow_llm_to_run_sql=True, static_folder="client")
+    server = make_server("127.0.0.1", 0, app.flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    questions = sample_questions(args.sessions, args.distinct_questions, args.seed)
+    rss_start = rss_bytes()
+    recorder, elapsed = drive(base_url, questions, args.concurrency)
+    rss_end = rss_bytes()
+    server.shutdown()
+
+    return {
+        "commit": git_commit(),
+        "config": vars(args),
+        "elapsed": elapsed,
+        "requests_per_second": recorder.requests() / elapsed,
+        "sessions_per_second": args.sessions / elapsed,
+        "llm_invocations": client.invocations,
+        "routes": {route: summarize(recorder.latencies[route], recorder.errors[route]) for route in recorder.latencies},
+        "memory": {"rss_start": rss_start, "rss_end": rss_end, "rss_growth": rss_end - rss_start},
+        "caches": {
+            "results": app.cache.stats() if hasattr(app.cache, "stats") else None,
+            "llm_responses": vn.response_cache.stats() if vn.response_cache is not None else None,
+            "sql": vn.sql_engine.stats(),
+        },
+    }
+
+
+def compare(current: dict, baseline: dict):
+    print(f"requests/s: {baseline['requests_per_second']:.1f} -> {current['requests_per_second']:.1f}")
+    for route, stats in current["routes"].items():
+        before = baseline["routes"].get(route, {})
+        for key in ("p50", "p95", "p99"):
+            if key in stats and key in before:
+                change = (stats[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+                print(f"{route} {key}: {before[key] * 1000:.1f}ms -> {stats[key] * 1000:.1f}ms ({change:+.1f}%)")
+    growth = current["memory"]["rss_growth"] - baseline["memory"]["rss_growth"]
+    print(f"rss growth: {growth / 1024 / 1024:+.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--distinct-questions", type=int, default=len(CHINOOK_QUESTIONS))
+    parser.add_argument("--ttft", type=float, default=0.3, help="Median seconds to the first token")
+    parser.add_argument("--sigma", type=float, default=0.25, help="Log-normal spread of the time to first token")
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--temperature", type=float, default=0, help="At 0 every prompt is cached, otherwise only SQL and follow-up prompts")
+    parser.add_argument("--no-response-cache", dest="response_cache", action="store_false")
+    parser.add_argument("--database", default="Chinook.sqlite")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="An earlier JSON report to compare this run against")
+    args = parser.parse_args()
+
+    # vn.log is silenced above, but some of vanna's Flask routes still print; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Measures top-k lookup latency of the local vector store on random embeddings, with a brute-force
+scan and (when hnswlib is installed) the HNSW index, and the recall of the index against the scan.
+
+    python -m benchmarks.retrieval --rows 100000 --dim 384 --k 10 --queries 200
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from local_vector_store import Collection, hnswlib
+
+
+def percentile(samples: list[float], q: float) -> float:
+    return float(np.percentile(samples, q))
+
+
+def time_queries(collection: Collection, queries: np.ndarray, k: int, exact: bool) -> tuple[list, list[float]]:
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(collection.search(query, k, exact=exact)[0])
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.rows, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    collection = Collection("bench", args.dim, ann_threshold=args.rows)
+    start = time.perf_counter()
+    collection.add([str(i) for i in range(args.rows)], [""] * args.rows, vectors)
+    print(f"added {args.rows} rows in {time.perf_counter() - start:.2f}s")
+
+    exact, latencies = time_queries(collection, queries, args.k, exact=True)
+    print(f"brute force: p50={percentile(latencies, 50) * 1000:.2f}ms p99={percentile(latencies, 99) * 1000:.2f}ms")
+
+    start = time.perf_counter()
+    collection.search(queries, args.k, exact=True)
+    print(f"brute force, batched: {(time.perf_counter() - start) / args.queries * 1000:.2f}ms per query")
+
+    if hnswlib is None:
+        print("hnswlib is not installed, skipping the HNSW index")
+        return
+
+    start = time.perf_counter()
+    collection.search(queries[0], args.k)
+    print(f"built HNSW index in {time.perf_counter() - start:.2f}s")
+    approximate, latencies = time_queries(collection, queries, args.k, exact=False)
+    print(f"hnsw: p50={percentile(latencies, 50) * 1000:.2f}ms p99={percentile(latencies, 99) * 1000:.2f}ms")
+
+    recall = statistics.mean(
+        len({row for row, _ in a} & {row for row, _ in e}) / len(e) for a, e in zip(approximate, exact)
+    )
+    print(f"hnsw recall@{args.k}: {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
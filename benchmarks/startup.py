@@ -0,0 +1,79 @@
+"""
+Measures how long a fresh process takes to become ready to serve, with lazy startup
+(tokenizer and client built on first use), with --warmup (built before serving), and with
+the eager constructor SageMakerLLM used to have as a baseline: boto3 and transformers imported
+up front, and a new client and tokenizer built in every instance's __init__.
+
+    python -m benchmarks.startup --runs 3 [--tokenizer-path /models/llama3-tokenizer]
+
+Each run is a new interpreter so import costs are included. The "second_instance" column
+shows that additional SageMakerLLM instances in the same process reuse the shared tokenizer and client.
+
+Without --tokenizer-path a whitespace FakeTokenizer stands in for the Llama 3 tokenizer (whose hub
+repository is gated), so the tokenizer's load time is left out of every mode.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+SNIPPET = """
+import json, time
+start = time.perf_counter()
+if {mode!r} == "eager":
+    import boto3
+    if {tokenizer_path!r} is not None:
+        from transformers import AutoTokenizer
+from benchmarks.fakes import BenchVanna
+imported = time.perf_counter()
+config = {{"endpoint_name": "fake-endpoint", "tokenizer_path": {tokenizer_path!r}, "fake_tokenizer": {tokenizer_path!r} is None,
+          "aws_access_key_id": "fake", "aws_secret_access_key": "fake"}}
+
+def instance():
+    vn = BenchVanna(config=config)
+    vn.log = lambda message, title="Info": None
+    if {mode!r} == "eager":
+        # What the constructor did before startup was made lazy: nothing shared between instances
+        vn._smr = boto3.client("sagemaker-runtime", region_name=vn.region_name,
+                               aws_access_key_id="fake", aws_secret_access_key="fake")
+        if {tokenizer_path!r} is not None:
+            vn._tokenizer = AutoTokenizer.from_pretrained({tokenizer_path!r}, local_files_only=True)
+    elif {mode!r} == "warmup":
+        vn.warmup()
+    return vn
+
+vn = instance()
+ready = time.perf_counter()
+second = instance()
+done = time.perf_counter()
+print(json.dumps({{"import": imported - start, "ready": ready - start, "second_instance": done - ready}}))
+"""
+
+MODES = ["eager", "lazy", "warmup"]
+
+
+def run(mode: str, tokenizer_path: str | None) -> dict:
+    code = SNIPPET.format(mode=mode, tokenizer_path=tokenizer_path)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--tokenizer-path", default=None, help="A local tokenizer directory. Defaults to a fake tokenizer")
+    args = parser.parse_args()
+
+    if args.tokenizer_path is None:
+        print("No --tokenizer-path: using FakeTokenizer, so tokenizer load time is not measured")
+    for mode in MODES:
+        results = [run(mode, args.tokenizer_path) for _ in range(args.runs)]
+        summary = {key: statistics.median(r[key] for r in results) for key in results[0]}
+        print(f"{mode:>6}: " + "  ".join(f"{key}={value:.3f}s" for key, value in summary.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Compares the latency a user waits for before seeing any output with the blocking
+submit_prompt and with submit_prompt_stream, against a local fake endpoint.
+
+    python -m benchmarks.ttft --ttft 0.5 --token-latency 0.02 --runs 5
+"""
+import argparse
+import statistics
+import time
+
+from .fakes import BenchVanna, FakeSageMakerRuntime
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ttft", type=float, default=0.5)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    client = FakeSageMakerRuntime(ttft=args.ttft, token_latency=args.token_latency)
+    vn = BenchVanna(config={"endpoint_name": "fake-endpoint", "client": client, "fake_tokenizer": True})
+    vn.log = lambda message, title="Info": None
+    prompt = [vn.user_message("How many artists are there?")]
+
+    blocking, first_token, streamed = [], [], []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        vn.submit_prompt(prompt)
+        blocking.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i, _token in enumerate(vn.submit_prompt_stream(prompt)):
+            if i == 0:
+                first_token.append(time.perf_counter() - start)
+        streamed.append(time.perf_counter() - start)
+
+    print(f"blocking first output: p50={statistics.median(blocking):.3f}s")
+    print(f"streaming first token: p50={statistics.median(first_token):.3f}s")
+    print(f"streaming full response: p50={statistics.median(streamed):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Chart recommendations for query results that don't need the LLM, and a compact figure encoding.
+
+recommend_chart picks a chart from the result's dtypes and cardinality for the common shapes (a
+measure over time, a measure per category, shares of a few categories, one or two numeric columns).
+It returns None for anything else, which is left to the LLM's Plotly code.
+
+build_figure encodes the chart as Plotly data and layout whose traces refer to shared columns by name
+instead of repeating the values, with long series downsampled to `max_points`. Plotly.svelte expands
+the columns back into the traces before plotting.
+"""
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+SHARE_WORDS = re.compile(r"\b(share|shares|percent|percentage|proportion|breakdown|distribution|split)\b", re.IGNORECASE)
+ID_COLUMN = re.compile(r"(^id$|_id$|[a-z]Id$)")
+TIME_COLUMN = re.compile(r"(date|time|day|week|month|quarter|year|period)", re.IGNORECASE)
+
+
+def _is_text(series: pd.Series) -> bool:
+    return pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype) or isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def _as_time(series: pd.Series) -> pd.Series | None:
+    """
+    Returns the column as datetimes if it holds dates (SQLite returns them as ISO strings), else None.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series
+    if _is_text(series) and TIME_COLUMN.search(str(series.name)):
+        sample = series.dropna().head(50)
+        parsed = pd.to_datetime(sample, errors="coerce", format="ISO8601")
+        if len(sample) and parsed.notna().all():
+            return pd.to_datetime(series, errors="coerce", format="ISO8601")
+    return None
+
+
+def _is_year(series: pd.Series) -> bool:
+    return (
+        pd.api.types.is_integer_dtype(series.dtype)
+        and re.search(r"year", str(series.name), re.IGNORECASE) is not None
+        and series.between(1800, 2200).all()
+    )
+
+
+def recommend_chart(df: pd.DataFrame, question: str | None = None, top_n: int = 20) -> dict | None:
+    """
+    Recommends a chart for a query result from its columns alone.
+
+    Args:
+        df: The query result.
+        question: The question that was asked; asking for shares turns a bar chart of a few categories into a pie.
+        top_n: Bar charts show at most this many categories, the largest first.
+
+    Returns:
+        dict: {"kind": "line" | "bar" | "pie" | "scatter" | "histogram", "x": ..., "y": [...], ...},
+        or None if the result is better left to the LLM.
+    """
+    if len(df) < 2 or df.columns.duplicated().any():
+        return None
+
+    times, categories, measures = [], [], []
+    for column in df.columns:
+        series = df[column]
+        if _as_time(series) is not None or _is_year(series):
+            times.append(column)
+        elif pd.api.types.is_bool_dtype(series.dtype):
+            categories.append(column)
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            # Keys are labels, not quantities
+            (categories if ID_COLUMN.search(str(column)) else measures).append(column)
+        elif _is_text(series):
+            categories.append(column)
+        else:
+            return None
+
+    if len(times) == 1 and measures and len(categories) <= 1:
+        if not categories:
+            return {"kind": "line", "x": times[0], "y": measures[:5]}
+        if len(measures) == 1 and df[categories[0]].nunique() <= 10:
+            return {"kind": "line", "x": times[0], "y": measures, "color": categories[0]}
+        return None
+
+    if times:
+        return None
+
+    if len(categories) == 1 and measures:
+        category = categories[0]
+        if len(measures) > 3:
+            return None
+        distinct = df[category].nunique()
+        if (
+            len(measures) == 1 and distinct <= 8 and distinct == len(df)
+            and question is not None and SHARE_WORDS.search(question)
+            and (df[measures[0]] >= 0).all()
+        ):
+            return {"kind": "pie", "x": category, "y": measures}
+        if distinct != len(df):
+            # Repeated categories would need aggregating first
+            return None
+        return {"kind": "bar", "x": category, "y": measures, "top_n": top_n}
+
+    if not categories and len(measures) == 2:
+        return {"kind": "scatter", "x": measures[0], "y": measures[1:]}
+
+    if not categories and len(measures) == 1:
+        return {"kind": "histogram", "x": measures[0], "y": []}
+
+    return None
+
+
+def _encode(values) -> list:
+    """
+    Converts a column to a JSON-ready list: NaN and infinities become None, dates become ISO strings and
+    floats are rounded to 6 significant digits.
+    """
+    series = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        midnight = (series.dropna().dt.normalize() == series.dropna()).all()
+        text = series.dt.strftime("%Y-%m-%d" if midnight else "%Y-%m-%dT%H:%M:%S")
+        return [None if pd.isna(value) else value for value in text]
+    if pd.api.types.is_float_dtype(series.dtype):
+        array = series.to_numpy(dtype=float)
+        finite = np.abs(array[np.isfinite(array)])
+        magnitude = int(math.floor(math.log10(finite.max()))) if finite.size and finite.max() > 0 else 0
+        array = np.round(array, max(0, 5 - magnitude))
+        return [value if math.isfinite(value) else None for value in array.tolist()]
+    if pd.api.types.is_integer_dtype(series.dtype) and not series.isna().any():
+        return series.to_numpy().tolist()
+    return [
+        None if pd.isna(value) or (isinstance(value, float) and not math.isfinite(value)) else value
+        for value in series.tolist()
+    ]
+
+
+def downsample(y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Returns the indices of the points to keep from a series: the minimum and maximum of each of
+    max_points / 2 equal buckets, so peaks and dips survive. Series that fit are kept whole.
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(max_points // 2, 1)
+    size = math.ceil(n / buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(buckets, size)
+    missing = np.isnan(blocks)
+    # All-NaN buckets (the padding at the end, or gaps in the data) fall back to their first point
+    lows = np.where(missing, np.inf, blocks).argmin(axis=1)
+    highs = np.where(missing, -np.inf, blocks).argmax(axis=1)
+    offsets = np.arange(buckets) * size
+    keep = np.unique(np.concatenate([offsets + lows, offsets + highs, [0, n - 1]]))
+    return keep[keep < n]
+
+
+def build_figure(df: pd.DataFrame, spec: dict, max_points: int = 2000) -> dict:
+    """
+    Builds the figure for a recommend_chart spec in the compact encoding:
+
+        {"columns": {name: [values]}, "data": [trace with "columns": {attribute: name}], "layout": {...}}
+
+    Args:
+        df: The query result.
+        spec: A recommendation from recommend_chart.
+        max_points: Line and scatter traces longer than this are downsampled.
+
+    Returns:
+        dict: The encoded figure, ready for json.dumps.
+    """
+    kind, x, ys = spec["kind"], spec["x"], spec["y"]
+    columns, data = {}, []
+    layout = {"xaxis": {"title": {"text": str(x)}}, "yaxis": {"title": {"text": ", ".join(map(str, ys))}}}
+
+    def add_column(name: str, values) -> str:
+        columns[name] = _encode(values)
+        return name
+
+    if kind == "line":
+        frame = df.copy()
+        time = _as_time(frame[x])
+        if time is not None:
+            frame[x] = time
+        frame = frame.sort_values(x, kind="stable")
+        groups = list(frame.groupby(spec["color"], sort=True)) if spec.get("color") else [(None, frame)]
+        per_series = max(max_points // (len(ys) * len(groups)), 2)
+        for group, part in groups:
+            suffix = "" if group is None else f" ({group})"
+            # Every series of a group keeps the same points, so they share one x column
+            keep = np.unique(np.concatenate([downsample(part[y].to_numpy(dtype=float), per_series) for y in ys]))
+            x_name = add_column(f"{x}{suffix}", part[x].iloc[keep])
+            for y in ys:
+                y_name = add_column(f"{y}{suffix}", part[y].iloc[keep])
+                data.append({"type": "scatter", "mode": "lines", "name": f"{y}{suffix}", "columns": {"x": x_name, "y": y_name}})
+        layout["showlegend"] = len(data) > 1
+
+    elif kind == "bar":
+        frame = df
+        if len(frame) > spec["top_n"]:
+            frame = frame.nlargest(spec["top_n"], ys[0])
+            layout["title"] = {"text": f"Top {spec['top_n']} of {len(df)} by {ys[0]}"}
+        add_column(str(x), frame[x].astype(str))
+        for y in ys:
+            data.append({"type": "bar", "name": str(y), "columns": {"x": str(x), "y": add_column(str(y), frame[y])}})
+        layout["barmode"] = "group"
+        layout["showlegend"] = len(ys) > 1
+
+    elif kind == "pie":
+        data.append({
+            "type": "pie",
+            "columns": {"labels": add_column(str(x), df[x].astype(str)), "values": add_column(str(ys[0]), df[ys[0]])},
+        })
+        layout = {}
+
+    elif kind == "scatter":
+        frame = df[[x, ys[0]]].dropna()
+        if len(frame) > max_points:
+            # Spread over the whole result rather than the first rows
+            frame = frame.iloc[np.linspace(0, len(frame) - 1, max_points).astype(int)]
+            layout["title"] = {"text": f"{max_points} of {len(df)} points"}
+        data.append({"type": "scatter", "mode": "markers", "columns": {"x": add_column(str(x), frame[x]), "y": add_column(str(ys[0]), frame[ys[0]])}})
+
+    elif kind == "histogram":
+        # Binned here so only the bin counts are shipped
+        values = df[x].dropna().to_numpy(dtype=float)
+        counts, edges = np.histogram(values, bins="auto" if len(values) > 1 else 1)
+        counts, edges = counts[:200], edges[:201]
+        data.append({
+            "type": "bar",
+            "columns": {"x": add_column("bin", (edges[:-1] + edges[1:]) / 2), "y": add_column("count", counts)},
+            "width": float(edges[1] - edges[0]) if len(edges) > 1 else None,
+        })
+        layout["yaxis"] = {"title": {"text": "count"}}
+
+    else:
+        raise ValueError(f"Unknown chart kind {kind}")
+
+    return {"columns": columns, "data": data, "layout": layout}
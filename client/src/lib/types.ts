@@ -12,12 +12,15 @@ export type Page =
 export type MessageContents =
     | { type: 'user_question', question: string }
     | { type: 'question_list', questions: string[], header: string, selected: string | null }
-    | { type: 'sql', text: string, id: string }
-    | { type: 'df', df: string, id: string }
+    | { type: 'sql', text: string, id: string, streamed?: boolean, conversation_id?: string | null, warnings?: string[] }
+    | { type: 'sql_stream', text: string }
+    | { type: 'df', df: string, id: string, total_rows?: number, fixed_sql?: string | null }
     | { type: 'plotly_figure', fig: string, id: string }
     | { type: 'error', error: string }
-    | { type: 'question_cache', id: string, question: string, sql: string, df: string, fig: string, followup_questions: string[] }
+    | { type: 'question_cache', id: string, question: string, sql: string, df: string, total_rows?: number, fig: string, followup_questions: string[] }
     | { type: 'question_history', questions: QuestionLink[] }
+    | { type: 'conversation_list', conversations: ConversationLink[], offset: number, limit: number, total: number }
+    | { type: 'conversation', id: string, title: string | null, turns: ConversationTurn[] }
     | { type: 'user_sql' }
 
 export type Method =
@@ -29,6 +32,20 @@ export interface QuestionLink {
     id: string
 }
 
+export interface ConversationLink {
+    id: string,
+    title: string | null,
+    turns: number,
+    updated: number
+}
+
+export interface ConversationTurn {
+    question_id: string | null,
+    question: string,
+    sql: string | null,
+    created: number
+}
+
 export interface Config {
     allow_run_sql: boolean;
     logo: string;
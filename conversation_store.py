@@ -0,0 +1,328 @@
+"""
+Conversations (a title, a rolling summary and the question/SQL turns) persisted in SQLite, so chats
+survive restarts and are shared by every worker process using the same file.
+
+Writes are queued and applied by a background thread in batches, so requests never wait on disk.
+Recently used conversations are kept in memory, which is what history windows are built from; reads
+that go to disk (listing and loading chats) first wait for the queued writes. Worker processes sharing
+the file reload a conversation when another process has written to it since (see owner).
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore:
+    """
+    Args:
+        path: The SQLite database file.
+        keep_turns: Turns kept verbatim in history windows. Older turns are folded into the summary.
+        cache_size: Conversations kept in memory.
+        flush_interval: Longest time, in seconds, a write waits in the queue.
+        max_batch: Writes applied per transaction.
+    """
+    def __init__(
+            self,
+            path: str = "conversations.sqlite",
+            keep_turns: int = 6,
+            cache_size: int = 256,
+            flush_interval: float = 0.5,
+            max_batch: int = 256,
+        ):
+        self.path = path
+        self.keep_turns = keep_turns
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.writes = 0
+        self.batches = 0
+        self.failed_writes = 0
+
+        self._cache: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+
+        # Reads and the writer thread use separate connections; WAL lets them run concurrently
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, user_key TEXT NOT NULL, title TEXT, summary TEXT, summarized INTEGER NOT NULL DEFAULT 0, "
+            "created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS conversations_user ON conversations (user_key, updated)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, question_id TEXT, question TEXT NOT NULL, sql TEXT, "
+            "created REAL NOT NULL, PRIMARY KEY (conversation_id, seq))"
+        )
+        self._read_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-writer", daemon=True)
+        self._writer.start()
+
+    def start(self, user_key: str, title: str | None = None) -> str:
+        """
+        Creates a conversation and returns its id.
+        """
+        id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._remember(id, {"user_key": user_key, "title": title, "summary": None, "summarized": 0, "turns": [], "updated": now})
+        self._enqueue(
+            "INSERT INTO conversations (id, user_key, title, summarized, created, updated) VALUES (?, ?, ?, 0, ?, ?)",
+            (id, user_key, title, now, now),
+        )
+        return id
+
+    def add_turn(self, conversation_id: str, question: str, sql: str | None, question_id: str | None = None):
+        conversation = self._conversation(conversation_id)
+        if conversation is None:
+            raise KeyError(conversation_id)
+        now = time.time()
+        with self._lock:
+            seq = conversation["summarized"] + len(conversation["turns"])
+            conversation["turns"].append({"question_id": question_id, "question": question, "sql": sql, "created": now})
+            conversation["updated"] = now
+        self._enqueue(
+            "INSERT OR REPLACE INTO turns (conversation_id, seq, question_id, question, sql, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (conversation_id, seq, question_id, question, sql, now),
+        )
+        self._enqueue("UPDATE conversations SET updated = ? WHERE id = ?", (now, conversation_id))
+
+    def update_sql(self, conversation_id: str, question_id: str, sql: str):
+        """
+        Replaces the SQL of the turn asked as question_id, e.g. after it was fixed, so later history windows
+        carry the SQL that worked.
+        """
+        conversation = self._conversation(conversation_id)
+        if conversation is not None:
+            with self._lock:
+                for turn in conversation["turns"]:
+                    if turn["question_id"] == question_id:
+                        turn["sql"] = sql
+        self._enqueue("UPDATE turns SET sql = ? WHERE conversation_id = ? AND question_id = ?", (sql, conversation_id, question_id))
+
+    def set_title(self, conversation_id: str, title: str):
+        conversation = self._conversation(conversation_id)
+        if conversation is not None:
+            with self._lock:
+                conversation["title"] = title
+        self._enqueue("UPDATE conversations SET title = ? WHERE id = ?", (title, conversation_id))
+
+    def owner(self, conversation_id: str) -> str | None:
+        """
+        Returns the user_key the conversation belongs to, or None if there is no such conversation. This is
+        the first call for each question, so it also picks up turns other processes have added.
+        """
+        conversation = self._conversation(conversation_id, refresh=True)
+        return conversation["user_key"] if conversation is not None else None
+
+    def turns_to_summarize(self, conversation_id: str) -> tuple[str | None, list[dict]]:
+        """
+        Returns the current summary and the turns that have fallen out of the verbatim window but are not
+        in the summary yet. The list is empty when there is nothing to fold in.
+        """
+        conversation = self._conversation(conversation_id)
+        if conversation is None:
+            return None, []
+        with self._lock:
+            overflow = max(len(conversation["turns"]) - self.keep_turns, 0)
+            return conversation["summary"], conversation["turns"][:overflow]
+
+    def set_summary(self, conversation_id: str, summary: str, folded: int):
+        """
+        Replaces the summary with one that also covers the first `folded` turns of the verbatim window.
+        """
+        conversation = self._conversation(conversation_id)
+        if conversation is None:
+            return
+        with self._lock:
+            conversation["summary"] = summary
+            conversation["summarized"] += folded
+            del conversation["turns"][:folded]
+            summarized = conversation["summarized"]
+        self._enqueue("UPDATE conversations SET summary = ?, summarized = ? WHERE id = ?", (summary, summarized, conversation_id))
+
+    def history(self, conversation_id: str) -> list[dict]:
+        """
+        Returns the conversation as chat messages, oldest first: the summary of older turns (if any) as a
+        question and answer, then each recent turn's question and SQL.
+        """
+        conversation = self._conversation(conversation_id)
+        if conversation is None:
+            return []
+        with self._lock:
+            messages = []
+            if conversation["summary"]:
+                messages.append({"role": "user", "content": "Summarize our conversation so far."})
+                messages.append({"role": "assistant", "content": conversation["summary"]})
+            for turn in conversation["turns"][-self.keep_turns:]:
+                messages.append({"role": "user", "content": turn["question"]})
+                messages.append({"role": "assistant", "content": turn["sql"] or ""})
+            return messages
+
+    def list_conversations(self, user_key: str, offset: int = 0, limit: int = 20) -> tuple[list[dict], int]:
+        """
+        Returns one page of the user's conversations, most recently updated first, and the total number.
+        """
+        self.flush()
+        with self._read_lock:
+            total = self.conn.execute("SELECT COUNT(*) FROM conversations WHERE user_key = ?", (user_key,)).fetchone()[0]
+            rows = self.conn.execute(
+                "SELECT c.id, c.title, c.updated, (SELECT COUNT(*) FROM turns t WHERE t.conversation_id = c.id) "
+                "FROM conversations c WHERE c.user_key = ? ORDER BY c.updated DESC LIMIT ? OFFSET ?",
+                (user_key, limit, offset),
+            ).fetchall()
+        return [{"id": id, "title": title, "updated": updated, "turns": turns} for id, title, updated, turns in rows], total
+
+    def get_conversation(self, conversation_id: str) -> dict | None:
+        """
+        Returns the whole conversation, with every turn including the summarized ones.
+        """
+        self.flush()
+        with self._read_lock:
+            row = self.conn.execute(
+                "SELECT user_key, title, summary, created, updated FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            turns = self.conn.execute(
+                "SELECT question_id, question, sql, created FROM turns WHERE conversation_id = ? ORDER BY seq", (conversation_id,)
+            ).fetchall()
+        user_key, title, summary, created, updated = row
+        return {
+            "id": conversation_id,
+            "user_key": user_key,
+            "title": title,
+            "summary": summary,
+            "created": created,
+            "updated": updated,
+            "turns": [{"question_id": qid, "question": question, "sql": sql, "created": at} for qid, question, sql, at in turns],
+        }
+
+    def flush(self, timeout: float | None = 30):
+        """
+        Waits until every write queued so far is on disk.
+        """
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            cached = len(self._cache)
+        return {"cached": cached, "queued": self._queue.qsize(), "writes": self.writes, "batches": self.batches, "failed_writes": self.failed_writes}
+
+    def close(self):
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=30)
+        with self._read_lock:
+            self.conn.close()
+
+    def _remember(self, id: str, conversation: dict):
+        # Called with the lock held
+        self._cache[id] = conversation
+        self._cache.move_to_end(id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _conversation(self, conversation_id: str, refresh: bool = False) -> dict | None:
+        with self._lock:
+            conversation = self._cache.get(conversation_id)
+            if conversation is not None:
+                self._cache.move_to_end(conversation_id)
+        if conversation is not None and refresh:
+            with self._read_lock:
+                row = self.conn.execute("SELECT updated, summarized FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            # This process's own writes may still be queued, in which case the copy in memory is newer
+            if row is not None and (row[0] > conversation["updated"] or row[1] > conversation["summarized"]):
+                conversation = None
+        if conversation is not None:
+            return conversation
+
+        # Not used recently by this process, or changed by another: load the summary and the turns after it
+        self.flush()
+        with self._read_lock:
+            row = self.conn.execute(
+                "SELECT user_key, title, summary, summarized, updated FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            user_key, title, summary, summarized, updated = row
+            turns = self.conn.execute(
+                "SELECT question_id, question, sql, created FROM turns WHERE conversation_id = ? AND seq >= ? ORDER BY seq",
+                (conversation_id, summarized),
+            ).fetchall()
+        conversation = {
+            "user_key": user_key,
+            "title": title,
+            "summary": summary,
+            "summarized": summarized,
+            "turns": [{"question_id": qid, "question": question, "sql": sql, "created": at} for qid, question, sql, at in turns],
+            "updated": updated,
+        }
+        with self._lock:
+            self._remember(conversation_id, conversation)
+        return conversation
+
+    def _enqueue(self, statement: str, parameters: tuple):
+        self._queue.put((statement, parameters))
+
+    def _write_each(self, conn: sqlite3.Connection, writes: list[tuple]):
+        for statement, parameters in writes:
+            try:
+                conn.execute(statement, parameters)
+                self.writes += 1
+            except sqlite3.Error:
+                self.failed_writes += 1
+                logger.exception("Conversation store write failed: %s", statement)
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            # Collect what arrives shortly after, unless someone is waiting on a flush
+            while len(batch) < self.max_batch and isinstance(batch[-1], tuple):
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            writes = [item for item in batch if isinstance(item, tuple)]
+            if writes:
+                try:
+                    conn.execute("BEGIN")
+                    for statement, parameters in writes:
+                        conn.execute(statement, parameters)
+                    conn.execute("COMMIT")
+                    self.writes += len(writes)
+                    self.batches += 1
+                except sqlite3.Error:
+                    try:
+                        conn.execute("ROLLBACK")
+                    except sqlite3.Error as e:
+                        # e.g. BEGIN itself failed, so there is no transaction to roll back
+                        logger.warning("Conversation store rollback failed: %s", e)
+                    # One bad write mustn't take the rest of the batch with it
+                    self._write_each(conn, writes)
+
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if None in batch:
+                conn.close()
+                return
@@ -1,9 +1,15 @@
 from vanna.base import VannaBase
-from vanna.flask import Cache, MemoryCache, VannaFlaskAPI
+from vanna.flask import Cache, VannaFlaskAPI
 from vanna.flask.auth import AuthInterface, NoAuth
+import contextlib
+import json
+import logging
 import os
+import tempfile
+import threading
 from abc import ABC, abstractmethod
 from functools import wraps
+from typing import Iterator
 
 import flask
 import requests
@@ -11,14 +17,33 @@ from flasgger import Swagger
 from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_sock import Sock
 
+from charts import build_figure, recommend_chart
+from conversation_store import ConversationStore
+from llm_router import RateLimitExceeded
+from metrics import registry
+from prefetch import Prefetcher
+from result_cache import BoundedCache
 from sagemaker_llm import SageMakerLLM
+from sql_repair import SQLRepairer
+from tracing import tracer
+from training_ingest import IngestJobs, items_from_jsonl, items_from_schema, items_from_sql
+
+logger = logging.getLogger(__name__)
+
+# Largest page /api/v0/df_page will return, and rows read per database round trip when streaming downloads
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK_SIZE = 5000
+# Points per chart before line and scatter charts are downsampled
+CHART_MAX_POINTS = 2000
+# Largest page /api/v0/conversations will return
+MAX_CONVERSATIONS_PAGE = 100
 
 #TODO: overload routes: load_question
 class CustomVannaFlaskApp(VannaFlaskAPI):
     def __init__(
         self,
         vn: SageMakerLLM,
-        cache: Cache = MemoryCache(),
+        cache: Cache | None = None,
         auth: AuthInterface = NoAuth(),
         debug=True,
         allow_llm_to_see_data=False,
@@ -34,6 +59,9 @@ class CustomVannaFlaskApp(VannaFlaskAPI):
         chart=False,
         redraw_chart=True,
         auto_fix_sql=True,
+        auto_fix_attempts=3,
+        auto_fix_timeout=30.0,
+        sql_fix_log_path=None,
         ask_results_correct=True,
         followup_questions=True,
         summarization=False,
@@ -41,13 +69,16 @@ class CustomVannaFlaskApp(VannaFlaskAPI):
         index_html_path=None,
         assets_folder=None,
         static_folder=None,
+        prefetch_questions=0,
+        prefetch_budget=30,
+        conversation_store: ConversationStore | None = None,
     ):
         """
         Expose a Flask app that can be used to interact with a Vanna instance.
 
         Args:
             vn: The Vanna instance to interact with.
-            cache: The cache to use. Defaults to MemoryCache, which uses an in-memory cache. You can also pass in a custom cache that implements the Cache interface.
+            cache: The cache to use. Defaults to a new BoundedCache, which keeps results in memory up to a byte budget and spills large DataFrames to disk. You can also pass in a custom cache that implements the Cache interface.
             auth: The authentication method to use. Defaults to NoAuth, which doesn't require authentication. You can also pass in a custom authentication method that implements the AuthInterface interface.
             debug: Show the debug console. Defaults to True.
             allow_llm_to_see_data: Whether to allow the LLM to see data. Defaults to False.
@@ -64,20 +95,31 @@ class CustomVannaFlaskApp(VannaFlaskAPI):
             chart: Whether to show the chart output in the UI. Defaults to True.
             redraw_chart: Whether to allow redrawing the chart. Defaults to True.
             auto_fix_sql: Whether to allow auto-fixing SQL errors. Defaults to True.
+            auto_fix_attempts: LLM calls per auto-fix. Defaults to 3.
+            auto_fix_timeout: Seconds an auto-fix may take before it gives up. Defaults to 30.
+            sql_fix_log_path: A file successful fixes are appended to, for promoting into training data. Defaults to None.
             ask_results_correct: Whether to ask the user if the results are correct. Defaults to True.
             followup_questions: Whether to show followup questions. Defaults to True.
             summarization: Whether to show summarization. Defaults to True.
             index_html_path: Path to the index.html. Defaults to None, which will use the default index.html
             assets_folder: The location where you'd like to serve the static assets from. Defaults to None, which will use hardcoded Python variables.
+            prefetch_questions: How many suggested and follow-up questions to generate SQL for in the background, before they are clicked. Defaults to 0, which turns prefetching off.
+            prefetch_budget: How many prefetches one user may start per hour. Defaults to 30.
+            conversation_store: Where conversations are kept. With one, questions asked with a conversation_id are answered in the context of that conversation's earlier turns, and chats can be listed and reloaded. Defaults to None, which answers every question on its own.
 
         Returns:
             None
         """
+        if cache is None:
+            cache = BoundedCache()
         super().__init__(vn, cache, auth, debug, allow_llm_to_see_data, chart)
 
         self.flask_app.view_functions['generate_sql'] = self.requires_auth(self.generate_sql_with_context)
         self.flask_app.view_functions['run_sql'] = self.requires_auth(self.requires_cache(["sql"])(self.run_sql_if_allowed))
         self.flask_app.view_functions['load_question'] = self.requires_auth(self.requires_cache(["question","sql"], optional_fields=["df", "summary", "fig_json", "followup_questions"])(self.load_question))
+        self.flask_app.view_functions['get_question_history'] = self.requires_auth(self.get_question_history)
+        self.flask_app.view_functions['generate_plotly_figure'] = self.requires_auth(self.requires_cache(["df", "question", "sql"])(self.generate_plotly_figure))
+        self.flask_app.view_functions['fix_sql'] = self.requires_auth(self.requires_cache(["question", "sql"])(self.fix_sql))
 
         # Control the behavior by passing it to config and using config to control svelte client
         # Also override the run_sql route and prevent it from running if allow_llm_to_run_sql is False
@@ -108,6 +150,81 @@ class CustomVannaFlaskApp(VannaFlaskAPI):
         if static_folder:
             self.flask_app.static_folder = static_folder
 
+        self.conversations = conversation_store
+        # Bulk training uploads are ingested in the background and polled by job id
+        self.ingest_jobs = IngestJobs(vn)
+        # Failed SQL is fixed on the server, from the context cached under the question's id
+        self.repairer = SQLRepairer(vn, max_attempts=auto_fix_attempts, time_budget=auto_fix_timeout, log_path=sql_fix_log_path)
+        # Conversations whose summary is being updated, so each is only summarized by one thread at a time
+        self._summarizing = set()
+        self._summarizing_lock = threading.Lock()
+
+        # API requests in flight in this process; prefetches only start when there are none
+        self.active_requests = 0
+        self._active_lock = threading.Lock()
+        self.prefetcher = None
+        if prefetch_questions:
+            self.prefetcher = Prefetcher(
+                self.cache,
+                generate_sql=lambda question, user_key: self.generate_checked_sql(question, owner=user_key),
+                run_sql=self.run_validated_sql if allow_llm_to_run_sql else None,
+                is_sql_valid=lambda sql: self.vn.is_sql_valid(sql=sql),
+                is_idle=lambda: self.active_requests == 0,
+                top_n=prefetch_questions,
+                budget=prefetch_budget,
+            )
+
+        # Every API request is the root span of its trace
+        @self.flask_app.before_request
+        def start_trace():
+            if request.path.startswith("/api/"):
+                flask.g.trace = tracer.span("request", path=request.path, method=request.method)
+                flask.g.trace.__enter__()
+                flask.g.tenant = self.tenant_scope(self.auth.get_user(request))
+                flask.g.tenant.__enter__()
+                with self._active_lock:
+                    self.active_requests += 1
+
+        @self.flask_app.teardown_request
+        def end_trace(error=None):
+            tenant = flask.g.pop("tenant", None)
+            if tenant is not None:
+                tenant.__exit__(None, None, None)
+            trace = flask.g.pop("trace", None)
+            if trace is not None:
+                trace.__exit__(None, None, None)
+                with self._active_lock:
+                    self.active_requests -= 1
+
+        # Suggested and follow-up questions are the likely next clicks, so their SQL is prefetched
+        @self.flask_app.after_request
+        def prefetch_candidates(response):
+            if self.prefetcher is None or not response.is_json or response.status_code != 200:
+                return response
+            data = response.get_json(silent=True)
+            if isinstance(data, dict) and data.get("type") == "sql_bundle":
+                data = data.get("followup_questions")
+            if isinstance(data, dict) and data.get("type") == "question_list" and data.get("questions"):
+                self.prefetcher.schedule(self.user_key(self.auth.get_user(request)), data["questions"])
+            return response
+
+        @self.flask_app.errorhandler(RateLimitExceeded)
+        def rate_limited(e):
+            return jsonify({"type": "error", "error": f"Too many requests, please try again shortly. {e}"})
+
+        @self.flask_app.route("/metrics", methods=["GET"])
+        def metrics():
+            return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+        @self.flask_app.route("/api/v0/slow_requests", methods=["GET"])
+        @self.requires_auth
+        def slow_requests(user: any):
+            return jsonify({
+                "type": "slow_requests",
+                "threshold": tracer.slow_threshold,
+                "requests": list(tracer.slow_requests),
+            })
+
         @self.flask_app.route("/auth/login", methods=["POST"])
         def login():
             return self.auth.login_handler(flask.request)
@@ -135,13 +252,452 @@ class CustomVannaFlaskApp(VannaFlaskAPI):
             data = request.json
             question = data.get('question')
 
-            context = self.vn.get_context(question)
+            # With the id of an asked question, this is the context its SQL was generated from
+            context = self.question_context(data.get('id'), question)
 
             return jsonify({
                 "type": "context",
                 "context": context
             })
 
+        @self.flask_app.route("/api/v0/generate_sql_stream", methods=["GET"])
+        @self.requires_auth
+        def generate_sql_stream(user: any):
+            """
+            Stream the SQL generation as server-sent events
+            ---
+            parameters:
+              - name: question
+                in: query
+                type: string
+                required: true
+            responses:
+              200:
+                description: A text/event-stream of token events followed by a final sql or text event. When the
+                  LLM runs intermediate SQL to see the data, an intermediate_sql event separates the tokens of
+                  its two responses. The final SQL is validated (and repaired, with auto_fix_sql) first, so it
+                  may differ from the streamed tokens; its validation warnings are sent with it.
+            """
+            question = flask.request.args.get("question")
+            if question is None:
+                return jsonify({"type": "error", "error": "No question provided"})
+
+            user_key = self.user_key(user)
+            conversation_id, chat_history = self.open_conversation(user, flask.request.args.get("conversation_id"))
+
+            def events():
+                # The body is streamed after the request span has ended, so it is traced as its own root span
+                with tracer.span("generate_sql_stream", question=question), self.tenant_scope(user):
+                    try:
+                        for event in self.answer_question(user_key, question, conversation_id, chat_history, stream=True):
+                            yield f"data: {json.dumps(event)}\n\n"
+                    except Exception as e:
+                        yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+
+            return Response(
+                events(),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        @self.flask_app.route("/api/v0/generate_sql_bundle", methods=["GET"])
+        @self.requires_auth
+        def generate_sql_bundle(user: any):
+            """
+            Generate the SQL, followup questions and chat title for a question in one request
+            ---
+            parameters:
+              - name: question
+                in: query
+                type: string
+                required: true
+            responses:
+              200:
+                schema:
+                  type: object
+                  properties:
+                    type:
+                      type: string
+                      default: sql_bundle
+                    id:
+                      type: string
+                    sql:
+                      type: object
+                    followup_questions:
+                      type: object
+                    title:
+                      type: string
+            """
+            question = flask.request.args.get("question")
+            if question is None:
+                return jsonify({"type": "error", "error": "No question provided"})
+
+            user_key = self.user_key(user)
+            conversation_id, chat_history = self.open_conversation(user, flask.request.args.get("conversation_id"))
+            answer = {}
+
+            def generate_sql() -> str:
+                # The turn is recorded below, once the bundle's title is known
+                answer.update(list(self.answer_question(user_key, question, conversation_id, chat_history, record=False))[-1])
+                return answer["text"]
+
+            bundle = self.vn.generate_sql_bundle(
+                question=question,
+                allow_llm_to_see_data=self.allow_llm_to_see_data,
+                chat_history=chat_history,
+                generate_sql=generate_sql,
+            )
+            id = answer["id"]
+            self.cache.set(id=id, field="followup_questions", value=bundle["followup_questions"])
+            self.cache.set(id=id, field="title", value=bundle["title"])
+            self.record_turn(conversation_id, chat_history, id, question, bundle["sql"], title=bundle["title"])
+
+            return jsonify(
+                {
+                    "type": "sql_bundle",
+                    "id": id,
+                    "conversation_id": conversation_id,
+                    "sql": answer,
+                    "followup_questions": {
+                        "type": "question_list",
+                        "id": id,
+                        "questions": bundle["followup_questions"],
+                        "header": "Here are some potential followup questions:",
+                    },
+                    "title": bundle["title"],
+                }
+            )
+
+        @self.flask_app.route("/api/v0/df_page", methods=["GET"])
+        @self.requires_auth
+        @self.requires_cache(["df"])
+        def df_page(user: any, id: str, df):
+            """
+            Get one page of a cached result without re-running the SQL
+            ---
+            parameters:
+              - name: id
+                in: query
+                type: string
+                required: true
+              - name: offset
+                in: query
+                type: integer
+              - name: limit
+                in: query
+                type: integer
+              - name: sort
+                in: query
+                type: string
+                description: A column name, prefixed with - to sort descending
+            responses:
+              200:
+                schema:
+                  type: object
+                  properties:
+                    type:
+                      type: string
+                      default: df_page
+                    df:
+                      type: object
+                    total_rows:
+                      type: integer
+            """
+            offset = max(flask.request.args.get("offset", 0, type=int), 0)
+            limit = min(max(flask.request.args.get("limit", 10, type=int), 1), MAX_PAGE_SIZE)
+            sort = flask.request.args.get("sort")
+
+            if sort:
+                column = sort.lstrip("-")
+                if column not in df.columns:
+                    return jsonify({"type": "error", "error": f"Unknown sort column {column}"})
+                ascending = not sort.startswith("-")
+                try:
+                    df = df.sort_values(column, ascending=ascending, kind="stable")
+                except TypeError:
+                    # A column mixing types (e.g. numbers and strings) can't be compared, so it sorts as text
+                    df = df.sort_values(column, ascending=ascending, kind="stable", key=lambda values: values.astype(str))
+
+            return jsonify(
+                {
+                    "type": "df_page",
+                    "id": id,
+                    "df": df.iloc[offset:offset + limit].to_json(orient="records", date_format="iso"),
+                    "offset": offset,
+                    "limit": limit,
+                    "sort": sort,
+                    "total_rows": len(df),
+                }
+            )
+
+        @self.flask_app.route("/api/v0/download_stream", methods=["GET"])
+        @self.requires_auth
+        @self.requires_cache(["sql"])
+        def download_stream(user: any, id: str, sql: str):
+            """
+            Stream the full result of the SQL as CSV or NDJSON, reading rows from the database in chunks
+            ---
+            parameters:
+              - name: id
+                in: query
+                type: string
+                required: true
+              - name: format
+                in: query
+                type: string
+                enum: [csv, ndjson]
+            responses:
+              200:
+                description: The streamed file
+            """
+            format = flask.request.args.get("format", "csv")
+            if format not in ("csv", "ndjson"):
+                return jsonify({"type": "error", "error": f"Unsupported format {format}"})
+            if not self.allow_llm_to_run_sql:
+                return jsonify({"type": "error", "error": "LLM is not allowed to run SQL queries."})
+
+            run_sql_chunks = getattr(self.vn, "run_sql_chunks", None)
+            if run_sql_chunks is None:
+                return jsonify({"type": "error", "error": "The connected database does not support streaming results."})
+
+            def rows():
+                for i, chunk in enumerate(run_sql_chunks(sql, chunk_size=STREAM_CHUNK_SIZE)):
+                    if format == "csv":
+                        yield chunk.to_csv(index=False, header=i == 0)
+                    elif len(chunk):
+                        yield chunk.to_json(orient="records", lines=True, date_format="iso").rstrip("\n") + "\n"
+
+            return Response(
+                flask.stream_with_context(rows()),
+                mimetype="text/csv" if format == "csv" else "application/x-ndjson",
+                headers={"Content-disposition": f"attachment; filename={id}.{format}"},
+            )
+
+        @self.flask_app.route("/api/v0/sql_stats", methods=["GET"])
+        @self.requires_auth
+        def sql_stats(user: any):
+            engine = getattr(self.vn, "sql_engine", None)
+            return jsonify({
+                "type": "sql_stats",
+                "stats": engine.stats() if engine is not None else None,
+            })
+
+        @self.flask_app.route("/api/v0/cache_stats", methods=["GET"])
+        @self.requires_auth
+        def cache_stats(user: any):
+            stats = getattr(self.cache, "stats", None)
+            return jsonify({
+                "type": "cache_stats",
+                "stats": stats() if stats is not None else None,
+            })
+
+        @self.flask_app.route("/api/v0/llm_cache_stats", methods=["GET"])
+        @self.requires_auth
+        def llm_cache_stats(user: any):
+            response_cache = self.vn.response_cache
+            question_cache = self.vn.question_cache
+            return jsonify({
+                "type": "llm_cache_stats",
+                "response_cache": response_cache.stats() if response_cache is not None else None,
+                "question_cache": question_cache.stats() if question_cache is not None else None,
+            })
+
+        @self.flask_app.route("/api/v0/prefetch_stats", methods=["GET"])
+        @self.requires_auth
+        def prefetch_stats(user: any):
+            return jsonify({
+                "type": "prefetch_stats",
+                "stats": self.prefetcher.stats() if self.prefetcher is not None else None,
+            })
+
+        @self.flask_app.route("/api/v0/llm_router_stats", methods=["GET"])
+        @self.requires_auth
+        def llm_router_stats(user: any):
+            router = getattr(self.vn, "router", None)
+            return jsonify({
+                "type": "llm_router_stats",
+                "stats": router.stats() if router is not None else None,
+            })
+
+        @self.flask_app.route("/api/v0/conversations", methods=["GET"])
+        @self.requires_auth
+        def list_conversations(user: any):
+            """
+            List the user's conversations, most recent first
+            ---
+            parameters:
+              - name: offset
+                in: query
+                type: integer
+              - name: limit
+                in: query
+                type: integer
+            responses:
+              200:
+                schema:
+                  type: object
+                  properties:
+                    type:
+                      type: string
+                      default: conversation_list
+                    conversations:
+                      type: array
+                    total:
+                      type: integer
+            """
+            if self.conversations is None:
+                return jsonify({"type": "error", "error": "Conversations are not being stored."})
+
+            offset = max(flask.request.args.get("offset", 0, type=int), 0)
+            limit = min(max(flask.request.args.get("limit", 20, type=int), 1), MAX_CONVERSATIONS_PAGE)
+            conversations, total = self.conversations.list_conversations(self.user_key(user), offset=offset, limit=limit)
+
+            return jsonify(
+                {
+                    "type": "conversation_list",
+                    "conversations": conversations,
+                    "offset": offset,
+                    "limit": limit,
+                    "total": total,
+                }
+            )
+
+        @self.flask_app.route("/api/v0/conversation", methods=["GET"])
+        @self.requires_auth
+        def get_conversation(user: any):
+            """
+            Get one of the user's conversations with all of its turns
+            ---
+            parameters:
+              - name: id
+                in: query
+                type: string
+                required: true
+            responses:
+              200:
+                schema:
+                  type: object
+                  properties:
+                    type:
+                      type: string
+                      default: conversation
+                    id:
+                      type: string
+                    title:
+                      type: string
+                    turns:
+                      type: array
+            """
+            if self.conversations is None:
+                return jsonify({"type": "error", "error": "Conversations are not being stored."})
+
+            conversation = self.conversations.get_conversation(flask.request.args.get("id", ""))
+            if conversation is None or conversation["user_key"] != self.user_key(user):
+                return jsonify({"type": "error", "error": "No such conversation"})
+
+            return jsonify(
+                {
+                    "type": "conversation",
+                    "id": conversation["id"],
+                    "title": conversation["title"],
+                    "turns": conversation["turns"],
+                }
+            )
+
+        @self.flask_app.route("/api/v0/conversation_stats", methods=["GET"])
+        @self.requires_auth
+        def conversation_stats(user: any):
+            return jsonify({
+                "type": "conversation_stats",
+                "stats": self.conversations.stats() if self.conversations is not None else None,
+            })
+
+        @self.flask_app.route("/api/v0/sql_fixes", methods=["GET"])
+        @self.requires_auth
+        def sql_fixes(user: any):
+            return jsonify({
+                "type": "sql_fixes",
+                "fixes": self.repairer.list_fixes(owner=self.user_key(user)),
+                "stats": self.repairer.stats(),
+            })
+
+        @self.flask_app.route("/api/v0/promote_sql_fix", methods=["POST"])
+        @self.requires_auth
+        def promote_sql_fix(user: any):
+            """
+            Add a successful auto-fix to the training data as a question/SQL pair
+            ---
+            parameters:
+              - name: id
+                in: body
+                type: string
+                required: true
+            responses:
+              200:
+                schema:
+                  type: object
+                  properties:
+                    type:
+                      type: string
+                      default: sql_fix_promoted
+                    id:
+                      type: string
+            """
+            fix = self.repairer.get((request.json or {}).get("id", ""), owner=self.user_key(user))
+            if fix is None:
+                return jsonify({"type": "error", "error": "No such fix"})
+
+            try:
+                training_id = self.vn.train(question=fix["question"], sql=fix["sql"])
+            except Exception as e:
+                logger.exception("Promoting SQL fix %s failed", fix["id"])
+                return jsonify({"type": "error", "error": str(e)})
+            self.repairer.mark_promoted(fix["id"])
+
+            return jsonify({"type": "sql_fix_promoted", "id": fix["id"], "training_id": training_id})
+
+        @self.flask_app.route("/api/v0/train_bulk", methods=["POST"])
+        @self.requires_auth
+        def train_bulk(user: any):
+            """
+            Loads many training items at once: an uploaded .sql or .jsonl file, or source=schema
+            to introspect the connected database. The items are ingested in the background; poll
+            /api/v0/train_bulk_status with the returned job id for progress.
+            """
+            source = request.form.get("source")
+            upload = request.files.get("file")
+            if source is None and upload is not None:
+                source = "jsonl" if upload.filename.endswith(".jsonl") else "sql"
+
+            if source == "schema":
+                items, cleanup = items_from_schema(vn), None
+            elif source in ("sql", "jsonl") and upload is not None:
+                # The upload is gone once the request ends, so it is spooled to disk for the job to read
+                fd, path = tempfile.mkstemp(suffix=f".{source}")
+                with os.fdopen(fd, "wb") as f:
+                    upload.save(f)
+                items, cleanup = self.read_training_file(path, source), lambda: os.remove(path)
+            else:
+                return jsonify({"type": "error", "error": "Upload a .sql or .jsonl file, or pass source=schema"})
+
+            job_id = self.ingest_jobs.submit(items, owner=self.user_key(user), cleanup=cleanup)
+            return jsonify({"type": "ingest_job", "id": job_id, "status": "queued"})
+
+        @self.flask_app.route("/api/v0/train_bulk_status", methods=["GET"])
+        @self.requires_auth
+        def train_bulk_status(user: any):
+            job = self.ingest_jobs.get(request.args.get("id", ""))
+            if job is None or job["owner"] != self.user_key(user):
+                return jsonify({"type": "error", "error": "No such ingest job"})
+
+            return jsonify({
+                "type": "ingest_job",
+                "id": job["id"],
+                "status": job["status"],
+                "stats": job["stats"],
+                "error": job["error"],
+            })
+
         # Proxy the /vanna.svg file to the remote server
         @self.flask_app.route("/vanna.svg")
         def proxy_vanna_svg():
@@ -186,6 +742,55 @@ class CustomVannaFlaskApp(VannaFlaskAPI):
                 }
             )
 
+        @self.flask_app.route("/api/v0/generate_followup_questions_stream", methods=["GET"])
+        @self.requires_auth
+        @self.requires_cache(["question", "sql"], optional_fields=["df"])
+        def generate_followup_questions_stream(user: any, id: str, question, sql, df):
+            """
+            Stream the followup questions as server-sent events
+            ---
+            parameters:
+              - name: id
+                in: query
+                type: string
+                required: true
+            responses:
+              200:
+                description: A text/event-stream of followup_question events, one per question, followed by a
+                  final question_list event
+            """
+            user_key = self.user_key(user)
+
+            def events():
+                with tracer.span("generate_followup_questions_stream", id=id), self.tenant_scope(user):
+                    followup_questions = []
+                    try:
+                        for followup_question in self.vn.generate_followup_questions_stream(question=question, sql=sql, df=df):
+                            followup_questions.append(followup_question)
+                            yield f"data: {json.dumps({'type': 'followup_question', 'id': id, 'text': followup_question})}\n\n"
+                            if len(followup_questions) == 5:
+                                break
+                    except Exception as e:
+                        yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+                        return
+
+                    self.cache.set(id=id, field="followup_questions", value=followup_questions)
+                    # The response is not JSON, so prefetch_candidates does not see these
+                    if self.prefetcher is not None and followup_questions:
+                        self.prefetcher.schedule(user_key, followup_questions)
+                    yield "data: " + json.dumps({
+                        "type": "question_list",
+                        "id": id,
+                        "questions": followup_questions,
+                        "header": "Here are some potential followup questions:",
+                    }) + "\n\n"
+
+            return Response(
+                events(),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
     # @self.flask_app.route("/api/v0/generate_sql", methods=["GET"])
     def generate_sql_with_context(self, user: any):
         """
@@ -212,40 +817,273 @@ class CustomVannaFlaskApp(VannaFlaskAPI):
                     type: string
         """
         question = flask.request.args.get("question")
-        print("THE GENERATE SQL ROUTE IS DEFINITELY BEING OVERRIDDEN")
         if question is None:
             return jsonify({"type": "error", "error": "No question provided"})
 
-        id = self.cache.generate_id(question=question)
-        sql = self.vn.generate_sql(question=question, allow_llm_to_see_data=self.allow_llm_to_see_data)
-        self.cache.set(id=id, field="question", value=question)
-        self.cache.set(id=id, field="sql", value=sql)
-        # self.cache.set(id=id, field="context", value=context)
+        conversation_id, chat_history = self.open_conversation(user, flask.request.args.get("conversation_id"))
+        # Without streaming, the answer is the only event
+        return jsonify(list(self.answer_question(self.user_key(user), question, conversation_id, chat_history))[-1])
 
-        if self.vn.is_sql_valid(sql=sql):
-            return jsonify(
-                {
-                    "type": "sql",
-                    "id": id,
-                    "text": sql,
-                }
-            )
+    def answer_question(
+            self,
+            user_key: str,
+            question: str,
+            conversation_id: str | None,
+            chat_history: list | None,
+            stream: bool = False,
+            record: bool = True,
+        ) -> Iterator[dict]:
+        """
+        Answers a question for the generate_sql, generate_sql_stream and generate_sql_bundle routes: from
+        the user's prefetch of it if there is one, otherwise by generating the SQL and validating (and with
+        auto_fix_sql repairing) it. The answer is cached and, unless `record` is False, added to the
+        conversation.
+
+        Yields the token and intermediate_sql events of a streamed generation, then the answer's sql_message.
+        """
+        prefetched = self.claim_prefetch(user_key, question, chat_history)
+        if prefetched is not None:
+            id, sql = prefetched
         else:
-            return jsonify(
-                {
-                    "type": "text",
-                    "id": id,
-                    "text": sql,
-                }
-            )
-    
+            id = self.cache.generate_id(question=question)
+            if stream:
+                # A question cache hit needs no context, so with one configured the context is only
+                # retrieved if a repair needs it
+                context = self.question_context(id, question) if self.vn.question_cache is None else None
+                for event in self.vn.generate_sql_stream(
+                    question=question, context=context, chat_history=chat_history, allow_llm_to_see_data=self.allow_llm_to_see_data
+                ):
+                    if event["type"] in ("sql", "text"):
+                        sql = event["text"]
+                    else:
+                        yield {**event, "id": id}
+                # The streamed SQL is validated, and repaired if need be, before it is stored or sent
+                sql = self.check_generated_sql(question, sql, chat_history=chat_history, id=id, owner=user_key)
+            else:
+                sql = self.generate_checked_sql(question, chat_history=chat_history, id=id, owner=user_key)
+
+            self.cache.set(id=id, field="question", value=question)
+            self.cache.set(id=id, field="sql", value=sql)
+        if record:
+            self.record_turn(conversation_id, chat_history, id, question, sql)
+        yield self.sql_message(id, sql, conversation_id)
+
+
+    def generate_checked_sql(self, question: str, chat_history: list | None = None, id: str | None = None, owner: str | None = None) -> str:
+        # Retrieved here so a repair can reuse it. A question cache hit needs no context, so with one
+        # configured the context is only retrieved if a repair needs it
+        context = self.question_context(id, question) if self.vn.question_cache is None else None
+        sql = self.vn.generate_sql(
+            question=question, chat_history=chat_history, context=context, allow_llm_to_see_data=self.allow_llm_to_see_data
+        )
+        return self.check_generated_sql(question, sql, chat_history=chat_history, id=id, owner=owner)
+
+    def check_generated_sql(self, question: str, sql: str, chat_history: list | None = None, id: str | None = None, owner: str | None = None) -> str:
+        """
+        Validates freshly generated SQL and, with auto_fix_sql, repairs it if it references unknown tables or
+        columns, before the client tries to run it. Returns the SQL to use.
+        """
+        if self.vn.is_sql_valid(sql=sql) and self.config["auto_fix_sql"]:
+            validation = self.vn.validate_sql(sql)
+            if not validation.valid:
+                repaired = self.repairer.repair(
+                    question,
+                    sql,
+                    "\n".join(validation.errors),
+                    context=self.question_context(id, question),
+                    check=self.check_sql,
+                    chat_history=chat_history,
+                    owner=owner,
+                )
+                if repaired is not None:
+                    sql = repaired[0]
+        return sql
+
+    def sql_message(self, id: str, sql: str, conversation_id: str | None = None) -> dict:
+        # The response to a generated question: SQL with its validation warnings, or the LLM's text if it isn't SQL
+        if not self.vn.is_sql_valid(sql=sql):
+            return {"type": "text", "id": id, "text": sql, "conversation_id": conversation_id}
+        return {"type": "sql", "id": id, "text": sql, "warnings": self.vn.validate_sql(sql).warnings, "conversation_id": conversation_id}
+
+    def question_context(self, id: str | None, question: str) -> dict:
+        """
+        Returns the get_context result for a question, retrieved once per question id and kept in the cache.
+        """
+        context = self.cache.get(id=id, field="context") if id else None
+        if context is None:
+            context = self.vn.get_context(question)
+            if id:
+                self.cache.set(id=id, field="context", value=context)
+        return context
+
+    def check_sql(self, sql: str) -> str:
+        validation = self.vn.validate_sql(sql)
+        if not validation.valid:
+            raise ValueError("\n".join(validation.errors))
+        return sql
+
+    def repair_cached_sql(self, id: str, sql: str, error: str, check, owner: str | None = None) -> tuple | None:
+        """
+        Repairs the SQL cached under id. A fix replaces it in the cache and in the question's conversation.
+
+        Returns:
+            tuple: The fixed SQL and what check returned for it, or None if it couldn't be fixed.
+        """
+        question = self.cache.get(id=id, field="question")
+        if question is None:
+            return None
+        repaired = self.repairer.repair(question, sql, error, context=self.question_context(id, question), check=check, owner=owner)
+        if repaired is None:
+            return None
+
+        self.cache.set(id=id, field="sql", value=repaired[0])
+        conversation_id = self.cache.get(id=id, field="conversation_id")
+        if conversation_id is not None and self.conversations is not None:
+            self.conversations.update_sql(conversation_id, id, repaired[0])
+        return repaired
+
+    def run_validated_sql(self, sql: str):
+        validation = self.vn.validate_sql(sql)
+        if not validation.valid:
+            raise ValueError("\n".join(validation.errors))
+        return self.vn.run_sql(sql=sql)
+
+    @staticmethod
+    def read_training_file(path: str, source: str):
+        with open(path, encoding="utf-8") as f:
+            yield from items_from_sql(f) if source == "sql" else items_from_jsonl(f)
+
+    @staticmethod
+    def user_key(user: any) -> str:
+        # Anonymous users (NoAuth) are told apart by address
+        return json.dumps(user, sort_keys=True, default=str) if user else flask.request.remote_addr or ""
+
+    def tenant_scope(self, user: any):
+        # Routes the LLM calls made for this user to their tenant's endpoints, if the Vanna instance has a router
+        router = getattr(self.vn, "router", None)
+        return router.using(router.tenant_for(user)) if router is not None else contextlib.nullcontext()
+
+    def requires_cache(self, required_fields, optional_fields=[]):
+        # vanna's version reads every required field twice (once to check it, once to pass it), and each read
+        # of a SQLiteCache unpickles the value, e.g. the whole result frame; this one reads each field once
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                id = request.args.get("id")
+                if id is None:
+                    id = (request.get_json(silent=True) or {}).get("id")
+                    if id is None:
+                        return jsonify({"type": "error", "error": "No id provided"})
+
+                field_values = {}
+                for field in required_fields:
+                    field_values[field] = self.cache.get(id=id, field=field)
+                    if field_values[field] is None:
+                        return jsonify({"type": "error", "error": f"No {field} found"})
+                for field in optional_fields:
+                    field_values[field] = self.cache.get(id=id, field=field)
+
+                return f(*args, **field_values, id=id, **kwargs)
+
+            return decorated
+
+        return decorator
+
+    def claim_prefetch(self, user_key: str, question: str, chat_history: list | None = None) -> tuple[str, str] | None:
+        """
+        Returns the cache id and SQL prefetched for this question, or None if it has to be generated.
+        Prefetches are generated without a conversation, so they don't answer questions asked within one.
+        """
+        if self.prefetcher is None:
+            return None
+        if chat_history:
+            # The conversation has still moved on, so the user's pending prefetches are dropped
+            self.prefetcher.cancel(user_key)
+            return None
+        id = self.prefetcher.claim(user_key, question)
+        sql = self.cache.get(id=id, field="sql") if id is not None else None
+        return (id, sql) if sql is not None else None
+
+    def open_conversation(self, user: any, conversation_id: str | None) -> tuple[str | None, list | None]:
+        """
+        Returns the conversation a question belongs to and its history window. Questions without a
+        conversation_id (or with one the user doesn't own) start a new conversation.
+
+        Returns:
+            tuple: (conversation_id, chat_history), or (None, None) if conversations aren't stored.
+        """
+        if self.conversations is None:
+            return None, None
+        user_key = self.user_key(user)
+        if conversation_id and self.conversations.owner(conversation_id) == user_key:
+            return conversation_id, self.conversations.history(conversation_id)
+        return self.conversations.start(user_key), []
+
+    def record_turn(self, conversation_id: str | None, chat_history: list | None, id: str, question: str, sql: str, title: str | None = None):
+        """
+        Adds a question and its SQL to the conversation. The first turn gives the conversation its title,
+        and turns that leave the history window are summarized, both in the background.
+        """
+        if conversation_id is None:
+            return
+        self.conversations.add_turn(conversation_id, question=question, sql=sql, question_id=id)
+        # Lets a later fix of this SQL reach the conversation
+        self.cache.set(id=id, field="conversation_id", value=conversation_id)
+
+        if not chat_history:
+            if title is not None:
+                self.conversations.set_title(conversation_id, title)
+            else:
+                self.vn.llm_pool.submit(tracer.wrap(self._title_conversation), conversation_id, question)
+
+        if not self.conversations.turns_to_summarize(conversation_id)[1]:
+            return
+        with self._summarizing_lock:
+            if conversation_id in self._summarizing:
+                return
+            self._summarizing.add(conversation_id)
+        self.vn.llm_pool.submit(tracer.wrap(self._summarize_conversation), conversation_id)
+
+    def _title_conversation(self, conversation_id: str, question: str):
+        try:
+            self.conversations.set_title(conversation_id, self.vn.generate_chat_title([self.vn.user_message(question)]).strip().strip('"'))
+        except Exception as e:
+            logger.warning("Chat title for conversation %s failed: %s", conversation_id, e)
+
+    def _summarize_conversation(self, conversation_id: str):
+        try:
+            summary, turns = self.conversations.turns_to_summarize(conversation_id)
+            if turns:
+                self.conversations.set_summary(conversation_id, self.vn.summarize_conversation(summary, turns), folded=len(turns))
+        except Exception as e:
+            # The turns stay in the window and are summarized with the next ones
+            logger.warning("Summary of conversation %s failed: %s", conversation_id, e)
+        finally:
+            with self._summarizing_lock:
+                self._summarizing.discard(conversation_id)
+
+    # @self.flask_app.route("/api/v0/fix_sql", methods=["POST"])
+    def fix_sql(self, user: any, id: str, question: str, sql: str):
+        error = (flask.request.json or {}).get("error")
+        if error is None:
+            return jsonify({"type": "error", "error": "No error provided"})
+
+        repaired = self.repair_cached_sql(id, sql, error, check=self.check_sql, owner=self.user_key(user))
+        if repaired is None:
+            return jsonify({"type": "error", "error": f"The SQL could not be fixed automatically. {error}"})
+
+        return jsonify(
+            {
+                "type": "sql",
+                "id": id,
+                "text": repaired[0],
+            }
+        )
 
     # @self.flask_app.route("/api/v0/run_sql", methods=["GET"])
     def run_sql_if_allowed(self, user: any, id: str, sql: str):
         # If we allow server to not write sql
-        print('IS ALLOWED TO RUN SQL: ', self.allow_llm_to_run_sql)
         if not self.allow_llm_to_run_sql:
-            print("GOT HERE")
             return jsonify({"type": "error", "error": "LLM is not allowed to run SQL queries."})
         
         # We will use this later if we are trying to allow read/write to SQL
@@ -258,7 +1096,22 @@ class CustomVannaFlaskApp(VannaFlaskAPI):
                     }
                 )
 
-            df = self.vn.run_sql(sql=sql)
+            # The first run of a prefetched question was done in the background
+            fixed_sql = None
+            df = self.cache.get(id=id, field="prefetched_df")
+            if df is not None:
+                self.cache.set(id=id, field="prefetched_df", value=None)
+            else:
+                try:
+                    df = self.run_validated_sql(sql)
+                except Exception as e:
+                    repaired = (
+                        self.repair_cached_sql(id, sql, str(e), check=self.run_validated_sql, owner=self.user_key(user))
+                        if self.config["auto_fix_sql"] else None
+                    )
+                    if repaired is None:
+                        raise
+                    fixed_sql, df = repaired
 
             self.cache.set(id=id, field="df", value=df)
 
@@ -267,16 +1120,64 @@ class CustomVannaFlaskApp(VannaFlaskAPI):
                     "type": "df",
                     "id": id,
                     "df": df.head(10).to_json(orient='records', date_format='iso'),
+                    "total_rows": len(df),
+                    "truncated": df.attrs.get("truncated", False),
                     "should_generate_chart": self.chart and self.vn.should_generate_chart(df),
+                    "fixed_sql": fixed_sql,
                 }
             )
         except Exception as e:
             return jsonify({"type": "sql_error", "error": str(e)})
         
+    def generate_plotly_figure(self, user: any, id: str, df, question, sql):
+        chart_instructions = flask.request.args.get('chart_instructions')
+
+        try:
+            # Common result shapes are charted without the LLM, in the compact encoding Plotly.svelte expands
+            spec = recommend_chart(df, question) if not chart_instructions else None
+            fig_json = None
+            if spec is not None:
+                with tracer.span("chart", kind=spec["kind"], source="rules") as span:
+                    try:
+                        fig_json = json.dumps(build_figure(df, spec, max_points=CHART_MAX_POINTS), allow_nan=False)
+                    except Exception as e:
+                        # The LLM's Plotly code below gets the chart instead
+                        logger.warning("Rule-based %s chart failed, falling back to the LLM: %s", spec["kind"], e)
+                        span.set_attribute("error", str(e))
+            if fig_json is None:
+                with tracer.span("chart", source="llm"):
+                    code = self.cache.get(id=id, field="plotly_code") if not chart_instructions else None
+                    if code is None:
+                        if chart_instructions:
+                            question = f"{question}. When generating the chart, use these special instructions: {chart_instructions}"
+                        code = self.vn.generate_plotly_code(
+                            question=question,
+                            sql=sql,
+                            df_metadata=f"Running df.dtypes gives:\n {df.dtypes}",
+                        )
+                        self.cache.set(id=id, field="plotly_code", value=code)
+                    fig_json = self.vn.get_plotly_figure(plotly_code=code, df=df, dark_mode=False).to_json()
+
+            self.cache.set(id=id, field="fig_json", value=fig_json)
+
+            return jsonify(
+                {
+                    "type": "plotly_figure",
+                    "id": id,
+                    "fig": fig_json,
+                }
+            )
+        except Exception as e:
+            logger.exception("Chart for question %s failed", id)
+            return jsonify({"type": "error", "error": str(e)})
+
+    def get_question_history(self, user: any):
+        # Prefetched questions are cached without a question field until they are clicked
+        questions = [entry for entry in self.cache.get_all(field_list=["question"]) if entry["question"] is not None]
+        return jsonify({"type": "question_history", "questions": questions})
+
     def load_question(self, user: any, id: str, question, sql, df, fig_json, summary, followup_questions):
         try:
-            print(type(df))
-            print(df)
             return jsonify(
                 {
                     "type": "question_cache",
@@ -284,6 +1185,7 @@ class CustomVannaFlaskApp(VannaFlaskAPI):
                     "question": question,
                     "sql": sql,
                     "df": df.head(10).to_json(orient="records", date_format="iso") if df is not None else df,
+                    "total_rows": len(df) if df is not None else 0,
                     "fig": fig_json,
                     "followup_questions": followup_questions,
                     "summary": summary,
@@ -0,0 +1,128 @@
+import pandas as pd
+
+from prompt_budget import TokenCounter
+
+
+class DataFrameSummarizer:
+    """
+    Describes a query result for an LLM prompt within a token budget, instead of pasting the whole
+    frame with to_markdown().
+
+    Results that fit in the budget are included in full. Larger ones are described by their row count,
+    each column's dtype, null count and statistics (min/max/mean for numbers and dates, distinct count and
+    most common values otherwise), and the first and last rows. Statistics are computed column-wise with
+    pandas; distinct values of frames over `sketch_rows` rows are estimated from a sample and marked "~".
+    If the description is still over budget, samples shrink first, then columns are dropped.
+
+    Args:
+        counter: The TokenCounter for the target model. Without one, tokens are estimated as chars / 4.
+        max_tokens: The token budget for one summary.
+        sample_rows: Rows shown from each end of a large frame.
+        top_values: Most common values listed per non-numeric column.
+        max_cell_chars: Longer cell values are cut to this length in samples.
+        sketch_rows: Frames with more rows are sampled to this many rows for distinct values.
+        max_full_cells: Frames with more cells are always summarized rather than rendered in full.
+    """
+    def __init__(
+            self,
+            counter: TokenCounter | None = None,
+            max_tokens: int = 1500,
+            sample_rows: int = 5,
+            top_values: int = 5,
+            max_cell_chars: int = 60,
+            sketch_rows: int = 100000,
+            max_full_cells: int = 500,
+        ):
+        self.counter = counter
+        self.max_tokens = max_tokens
+        self.sample_rows = sample_rows
+        self.top_values = top_values
+        self.max_cell_chars = max_cell_chars
+        self.sketch_rows = sketch_rows
+        self.max_full_cells = max_full_cells
+
+    def count(self, text: str) -> int:
+        return self.counter.count(text) if self.counter is not None else len(text) // 4
+
+    def summarize(self, df: pd.DataFrame, max_tokens: int | None = None) -> str:
+        """
+        Returns the frame in full if it fits in the budget, otherwise a summary that does.
+        """
+        max_tokens = max_tokens or self.max_tokens
+        # A cheap size check first, so large frames are never rendered whole
+        if df.size <= self.max_full_cells:
+            full = self._clip(df).to_markdown(index=False)
+            if self.count(full) <= max_tokens:
+                return full
+
+        columns = self._describe_columns(df)
+        sample_rows = self.sample_rows
+        while True:
+            summary = self._render(df, columns, sample_rows)
+            if self.count(summary) <= max_tokens:
+                return summary
+            if sample_rows > 0:
+                sample_rows //= 2
+            elif len(columns) > 1:
+                columns = columns[:len(columns) // 2]
+            else:
+                return summary[:max_tokens * 4]
+
+    def _clip(self, df: pd.DataFrame) -> pd.DataFrame:
+        frame = df.set_axis(range(df.shape[1]), axis=1)
+        for position in frame.select_dtypes(include=["object", "string"]).columns:
+            values = frame[position].astype(str)
+            long = frame[position].notna() & (values.str.len() > self.max_cell_chars)
+            frame[position] = frame[position].mask(long, values.str.slice(0, self.max_cell_chars) + "…")
+        return frame.set_axis(df.columns, axis=1)
+
+    def _describe_columns(self, df: pd.DataFrame) -> list[str]:
+        # Joins often repeat column names, so columns are looked up by position
+        frame = df.set_axis(range(df.shape[1]), axis=1)
+        nulls = frame.isna().sum()
+        numeric = frame.select_dtypes(include="number")
+        numeric_stats = numeric.agg(["min", "max", "mean"]) if numeric.shape[1] else pd.DataFrame()
+        dates = frame.select_dtypes(include="datetime")
+        date_stats = dates.agg(["min", "max"]) if dates.shape[1] else pd.DataFrame()
+
+        other = frame.drop(columns=list(numeric.columns) + list(dates.columns))
+        approximate = len(other) > self.sketch_rows
+        if approximate:
+            other = other.sample(self.sketch_rows, random_state=0)
+        try:
+            distinct = other.nunique()
+        except TypeError:
+            # Unhashable values such as lists
+            distinct = other.astype(str).nunique()
+
+        descriptions = []
+        for position, column in enumerate(df.columns):
+            text = f"- {column} ({frame[position].dtype}), {nulls[position]} nulls"
+            if position in numeric_stats.columns:
+                stats = numeric_stats[position]
+                text += f", min {stats['min']:.6g}, max {stats['max']:.6g}, mean {stats['mean']:.6g}"
+            elif position in date_stats.columns:
+                text += f", from {date_stats[position]['min']} to {date_stats[position]['max']}"
+            elif position in distinct.index:
+                counts = other[position].astype(str).value_counts().head(self.top_values)
+                top = ", ".join(f"{value[:self.max_cell_chars]!r} ({count})" for value, count in counts.items())
+                if approximate:
+                    text += f", ~{distinct[position]} distinct, most common in a sample of {len(other)}: {top}"
+                else:
+                    text += f", {distinct[position]} distinct, most common: {top}"
+            descriptions.append(text)
+        return descriptions
+
+    def _render(self, df: pd.DataFrame, columns: list[str], sample_rows: int) -> str:
+        lines = [f"{len(df)} rows, {df.shape[1]} columns:"] + columns
+        if len(columns) < df.shape[1]:
+            lines.append(f"- ... and {df.shape[1] - len(columns)} more columns")
+
+        if sample_rows > 0:
+            shown = df.iloc[:, :len(columns)]
+            if len(df) <= 2 * sample_rows:
+                lines += ["", "All rows:", self._clip(shown).to_markdown(index=False)]
+            else:
+                lines += ["", f"First {sample_rows} rows:", self._clip(shown.head(sample_rows)).to_markdown(index=False)]
+                lines += ["", f"Last {sample_rows} rows:", self._clip(shown.tail(sample_rows)).to_markdown(index=False)]
+        return "\n".join(lines)
@@ -0,0 +1,42 @@
+"""
+Production serving: gunicorn -c gunicorn.conf.py "server:create_app()"
+
+Every setting can be overridden from the environment (or on the command line):
+    WEB_CONCURRENCY   worker processes (default: one per CPU)
+    THREADS           request threads per worker; threads wait on the LLM, processes use the cores
+    BIND              address to listen on (default 0.0.0.0:8084)
+    TIMEOUT           seconds a request may take before its worker is restarted
+    GRACEFUL_TIMEOUT  seconds in-flight requests get to finish on SIGTERM or a reload
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8084")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("THREADS", 8))
+# LLM calls and streamed downloads routinely take tens of seconds
+timeout = int(os.getenv("TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Workers share cached results through one SQLite file, so any worker can answer load_question,
+# run_sql, etc. for an id another worker created
+os.environ.setdefault("RESULT_CACHE_PATH", "result_cache.sqlite")
+# Conversations are kept in another shared file, so a chat can continue on any worker
+os.environ.setdefault("CONVERSATION_STORE_PATH", "conversations.sqlite")
+# Forked workers must not inherit a tokenizer thread pool
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def on_starting(server):
+    # Load the tokenizer once in the master process; forked workers share its memory instead of each
+    # loading their own. Clients, thread pools and database connections are still created per worker.
+    if os.getenv("PRELOAD_TOKENIZER", "1") != "1":
+        return
+    from sagemaker_llm import get_tokenizer
+
+    try:
+        get_tokenizer("meta-llama/Meta-Llama-3-8B-Instruct", os.getenv("TOKENIZER_PATH"))
+    except Exception as e:
+        server.log.warning(f"Could not preload the tokenizer, workers will load it themselves: {e}")
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+
+# Numbers (years, limits, ids) and quoted values, which change the SQL without changing the embedding much
+LITERAL = re.compile(r"'[^']*'|\"[^\"]*\"|\d+(?:\.\d+)?")
+
+
+def canonical_key(payload: dict) -> str:
+    """
+    Hashes a request payload so that equivalent payloads map to the same key regardless of dict ordering.
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache(ABC):
+    """
+    Cache of LLM responses keyed on canonical_key(payload), with LRU and TTL eviction.
+
+    Args:
+        max_entries: The number of responses kept before the least recently used one is evicted.
+        ttl: Seconds a response stays valid. None keeps responses until they are evicted.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: float | None = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, payload: dict) -> str | None:
+        with self._lock:
+            value = self._get(canonical_key(payload), time.time())
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, payload: dict, value: str):
+        with self._lock:
+            self._set(canonical_key(payload), value, time.time())
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": self._size(),
+            }
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    @abstractmethod
+    def _get(self, key: str, now: float) -> str | None:
+        pass
+
+    @abstractmethod
+    def _set(self, key: str, value: str, now: float):
+        pass
+
+    @abstractmethod
+    def _size(self) -> int:
+        pass
+
+
+class MemoryResponseCache(ResponseCache):
+    """
+    In-process response cache. Entries are lost when the process exits.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: float | None = 3600):
+        super().__init__(max_entries, ttl)
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, value = entry
+        if self._expired(created, now):
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value, now):
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _size(self):
+        return len(self._entries)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    On-disk response cache, so responses survive restarts and can be shared by processes on the same host.
+
+    Args:
+        path: The SQLite database file to store responses in.
+    """
+    def __init__(self, path: str = "llm_cache.sqlite", max_entries: int = 10000, ttl: float | None = 86400):
+        super().__init__(max_entries, ttl)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def _get(self, key, now):
+        row = self.conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        if self._expired(created, now):
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.evictions += 1
+            return None
+        self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return value
+
+    def _set(self, key, value, now):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, value, now, now),
+        )
+        overflow = self._size() - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+
+    def _size(self):
+        return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class QuestionCache:
+    """
+    Near-duplicate question tier: reuses the SQL generated for an earlier question whose embedding
+    is at least `threshold` cosine-similar to the new one.
+
+    Embeddings barely move when a number or a quoted value changes ("top 5 customers in 2021" and
+    "... in 2022"), but the SQL does, so a similar question only counts as a match if it also has the
+    same literals. Questions that are equal after normalization always match.
+
+    Args:
+        embed: Turns a question into an embedding vector.
+        threshold: Minimum cosine similarity for a cached question to count as a match.
+        max_entries: The number of questions kept before the oldest one is evicted.
+    """
+    def __init__(self, embed: Callable[[str], list], threshold: float = 0.95, max_entries: int = 1024):
+        self.embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # A ring of max_entries slots; _slots maps a normalized question to its slot
+        self._questions: list[str | None] = [None] * max_entries
+        self._sql: list[str | None] = [None] * max_entries
+        self._vectors: np.ndarray | None = None
+        self._slots: dict[str, int] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        return " ".join(question.lower().split()).rstrip("?.! ")
+
+    @staticmethod
+    def literals(question: str) -> list[str]:
+        """
+        The numbers and quoted values in a question, in order.
+        """
+        return [match.group(0).lower() for match in LITERAL.finditer(question)]
+
+    def _vector(self, question: str) -> np.ndarray | None:
+        embedding = self.embed(question)
+        if embedding is None or len(embedding) == 0:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, question: str) -> str | None:
+        key = self.normalize(question)
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is not None:
+                self.hits += 1
+                return self._sql[slot]
+
+        vector = self._vector(question)
+        literals = self.literals(question)
+        with self._lock:
+            if vector is None or self._vectors is None or len(vector) != self._vectors.shape[1]:
+                self.misses += 1
+                return None
+            scores = self._vectors @ vector
+            # Empty slots score 0, so they never pass a positive threshold
+            for slot in np.argsort(-scores):
+                if scores[slot] < self.threshold or self._questions[slot] is None:
+                    break
+                if self.literals(self._questions[slot]) == literals:
+                    self.hits += 1
+                    return self._sql[slot]
+            self.misses += 1
+            return None
+
+    def set(self, question: str, sql: str):
+        key = self.normalize(question)
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is not None:
+                self._sql[slot] = sql
+                return
+
+        vector = self._vector(question)
+        if vector is None:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            elif len(vector) != self._vectors.shape[1]:
+                return
+            if key in self._slots:
+                # Set by another thread meanwhile
+                self._sql[self._slots[key]] = sql
+                return
+
+            slot = self._next
+            self._next = (self._next + 1) % self.max_entries
+            evicted = self._questions[slot]
+            if evicted is not None:
+                del self._slots[self.normalize(evicted)]
+            self._questions[slot] = question
+            self._sql[slot] = sql
+            self._vectors[slot] = vector
+            self._slots[key] = slot
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._slots),
+            }
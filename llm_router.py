@@ -0,0 +1,282 @@
+"""
+Routes LLM calls to per-tenant SageMaker endpoints and models, with per-tenant concurrency and
+token-rate limits, coalescing of identical in-flight prompts and failover between endpoints when
+one is throttling.
+
+    router = LLMRouter({
+        "default": {"endpoints": ["llama3-8b-a", "llama3-8b-b"], "max_concurrency": 8},
+        "acme": {"endpoints": ["acme-llama3-70b"], "model": "meta-llama/Meta-Llama-3-70B-Instruct",
+                 "max_concurrency": 4, "tokens_per_minute": 200000},
+    })
+    vn = MyVanna(config={..., "router": router})
+
+The tenant of a call is taken from the current context (see LLMRouter.using), which the Flask app
+sets from the logged-in user for every request.
+"""
+import contextvars
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, TypeVar
+
+from llm_cache import canonical_key
+from metrics import registry
+
+T = TypeVar("T")
+
+# SageMaker error codes (and HTTP statuses) that mean "try again later", rather than a bad request
+THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "ModelNotReadyException", "ServiceUnavailable"}
+THROTTLING_STATUSES = {429, 503}
+
+_current_tenant: contextvars.ContextVar[str | None] = contextvars.ContextVar("vanna_tenant", default=None)
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a tenant's call could not be admitted within the router's wait_timeout.
+    """
+
+
+def is_throttling(error: Exception) -> bool:
+    response = getattr(error, "response", None) or {}
+    code = response.get("Error", {}).get("Code")
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return code in THROTTLING_CODES or status in THROTTLING_STATUSES
+
+
+class Tenant:
+    """
+    The endpoints, model and limits of one tenant.
+
+    Args:
+        name: The tenant name.
+        endpoints: SageMaker endpoint names, the primary first. Throttled calls move on to the next one.
+        model: The model id sent in the payload. None keeps the SageMakerLLM's model.
+        max_concurrency: Calls of this tenant in flight at once.
+        tokens_per_minute: Prompt and completion tokens this tenant may use per minute. None is unlimited.
+    """
+    def __init__(
+            self,
+            name: str,
+            endpoints: list[str],
+            model: str | None = None,
+            max_concurrency: int = 8,
+            tokens_per_minute: int | None = None,
+        ):
+        if not endpoints:
+            raise ValueError(f"Tenant {name} needs at least one endpoint")
+        self.name = name
+        self.endpoints = list(endpoints)
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        # A token bucket holding up to a minute's worth of tokens
+        self.tokens = float(tokens_per_minute or 0)
+        self.refilled = time.monotonic()
+        self.lock = threading.Lock()
+        self.counts = {"calls": 0, "coalesced": 0, "throttled": 0, "failovers": 0, "rejected": 0, "in_flight": 0}
+        self.queue_time = registry.histogram(
+            "vanna_llm_queue_seconds", "Time LLM calls wait for their tenant's concurrency and token limits", tenant=name
+        )
+
+    def _refill(self, now: float):
+        # Called with the lock held
+        rate = self.tokens_per_minute / 60
+        self.tokens = min(float(self.tokens_per_minute), self.tokens + (now - self.refilled) * rate)
+        self.refilled = now
+
+    def take_tokens(self, tokens: int, deadline: float) -> bool:
+        """
+        Waits until the bucket has `tokens` (or is full, for calls larger than a minute's worth), then takes them.
+        """
+        if self.tokens_per_minute is None:
+            return True
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                needed = min(tokens, self.tokens_per_minute)
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return True
+                wait = (needed - self.tokens) / (self.tokens_per_minute / 60)
+            if now + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    def charge(self, tokens: int):
+        """
+        Takes tokens used after the fact, e.g. the completion. The bucket may go negative, which delays later calls.
+        """
+        if self.tokens_per_minute is None:
+            return
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+
+    def count(self, key: str, n: int = 1):
+        with self.lock:
+            self.counts[key] += n
+
+
+class LLMRouter:
+    """
+    Args:
+        tenants: Tenant name to Tenant keyword arguments. Must include `default_tenant`.
+        default_tenant: Used for calls without a tenant, and tenants that aren't configured.
+        tenant_of: Maps an auth user to a tenant name. Defaults to the user's "tenant" key.
+        retries: Attempts per call across all endpoints when they throttle.
+        backoff: Seconds before the first retry; doubled on every retry, with jitter, up to max_backoff.
+        max_backoff: The longest wait between attempts.
+        wait_timeout: Seconds a call may wait for its tenant's limits before RateLimitExceeded is raised.
+    """
+    def __init__(
+            self,
+            tenants: dict[str, dict],
+            default_tenant: str = "default",
+            tenant_of: Callable[[any], str | None] | None = None,
+            retries: int = 4,
+            backoff: float = 0.5,
+            max_backoff: float = 8.0,
+            wait_timeout: float = 60.0,
+        ):
+        if default_tenant not in tenants:
+            raise ValueError(f"The default tenant {default_tenant} must be configured")
+        self.tenants = {name: Tenant(name, **options) for name, options in tenants.items()}
+        self.default_tenant = default_tenant
+        self.tenant_of = tenant_of or (lambda user: user.get("tenant") if isinstance(user, dict) else None)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.wait_timeout = wait_timeout
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "LLMRouter":
+        """
+        Loads the tenants from a JSON file shaped like the `tenants` argument.
+        """
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    def tenant_for(self, user: any) -> str:
+        name = self.tenant_of(user)
+        return name if name in self.tenants else self.default_tenant
+
+    @contextmanager
+    def using(self, tenant: str):
+        """
+        Routes the LLM calls made in this context (and in work it hands to tracer.wrap'ed threads) for `tenant`.
+        """
+        token = _current_tenant.set(tenant)
+        try:
+            yield self.tenants.get(tenant, self.tenants[self.default_tenant])
+        finally:
+            try:
+                _current_tenant.reset(token)
+            except ValueError:
+                # Exited from a different context than it was entered in, e.g. a streamed Flask response
+                _current_tenant.set(None)
+
+    def current(self) -> Tenant:
+        return self.tenants.get(_current_tenant.get(), self.tenants[self.default_tenant])
+
+    def model_for(self, default: str) -> str:
+        return self.current().model or default
+
+    @contextmanager
+    def admit(self, prompt_tokens: int):
+        """
+        Holds one of the current tenant's concurrency slots and takes the prompt's tokens from its budget.
+
+        Raises:
+            RateLimitExceeded: If the tenant's limits didn't allow the call within wait_timeout.
+        """
+        tenant = self.current()
+        start = time.monotonic()
+        deadline = start + self.wait_timeout
+        if not tenant.semaphore.acquire(timeout=self.wait_timeout):
+            tenant.count("rejected")
+            raise RateLimitExceeded(f"Tenant {tenant.name} has {tenant.max_concurrency} LLM calls in flight")
+        try:
+            if not tenant.take_tokens(prompt_tokens, deadline):
+                tenant.count("rejected")
+                raise RateLimitExceeded(f"Tenant {tenant.name} is over {tenant.tokens_per_minute} tokens per minute")
+            tenant.queue_time.observe(time.monotonic() - start)
+            tenant.count("calls")
+            tenant.count("in_flight")
+            try:
+                yield tenant
+            finally:
+                tenant.count("in_flight", -1)
+        finally:
+            tenant.semaphore.release()
+
+    def failover(self, invoke: Callable[[str], T]) -> T:
+        """
+        Calls invoke(endpoint) on the current tenant's endpoints in turn while they throttle, backing off
+        exponentially between attempts. Other errors are raised straight away.
+        """
+        tenant = self.current()
+        for attempt in range(self.retries):
+            endpoint = tenant.endpoints[attempt % len(tenant.endpoints)]
+            try:
+                return invoke(endpoint)
+            except Exception as e:
+                if not is_throttling(e) or attempt == self.retries - 1:
+                    raise
+                tenant.count("throttled")
+                if len(tenant.endpoints) > 1:
+                    tenant.count("failovers")
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def submit(self, payload: dict, prompt_tokens: int, invoke: Callable[[str], tuple[str, int]]) -> str:
+        """
+        Makes one non-streaming call for the current tenant. Identical payloads the same tenant already has
+        in flight share that call's result instead of invoking the endpoint again. Tenants never share calls,
+        even on the same endpoints, so each is charged and limited for its own requests.
+
+        Args:
+            payload: The request payload, used as the coalescing key.
+            prompt_tokens: Counted against the tenant's token rate before the call.
+            invoke: Calls an endpoint and returns the completion and its token count.
+        """
+        tenant = self.current()
+        key = canonical_key({"tenant": tenant.name, "endpoints": tenant.endpoints, "payload": payload})
+        with self._lock:
+            leader = self._inflight.get(key)
+            if leader is None:
+                future = self._inflight[key] = Future()
+        if leader is not None:
+            tenant.count("coalesced")
+            return leader.result()
+
+        try:
+            with self.admit(prompt_tokens) as tenant:
+                content, response_tokens = self.failover(invoke)
+                tenant.charge(response_tokens)
+            future.set_result(content)
+            return content
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        stats = {}
+        for name, tenant in self.tenants.items():
+            with tenant.lock:
+                stats[name] = {
+                    **tenant.counts,
+                    "endpoints": tenant.endpoints,
+                    "tokens_available": tenant.tokens if tenant.tokens_per_minute is not None else None,
+                }
+        return stats
@@ -0,0 +1,357 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+from vanna.base import VannaBase
+from vanna.utils import deterministic_uuid
+
+try:
+    import hnswlib
+except ImportError:  # Optional: collections are searched by brute force without it
+    hnswlib = None
+
+
+class HashingEmbedder:
+    """
+    A dependency-free embedding: hashed word and character-trigram counts, L2-normalized.
+    Good enough to find near-identical questions and the tables a question names; pass a real
+    embedding model as `embedding_function` for semantic matches.
+
+    Args:
+        dim: The embedding dimension.
+    """
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        words = re.findall(r"\w+", text.lower())
+        trigrams = [word[i:i + 3] for word in words for i in range(max(len(word) - 2, 1))]
+        return words + trigrams
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += 1.0 if value & (1 << 63) else -1.0
+        return vectors
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class Collection:
+    """
+    Normalized embeddings and their documents for one kind of training data.
+
+    Persisted rows are memory-mapped from `{path}/{name}.npy`; rows added since the last save are held
+    in memory and searched as a second block. Removed rows are masked out until the next save compacts them.
+    Adds and removes made with journal=True are appended to `{path}/{name}.journal`, which is replayed on
+    load, so persisting them costs the size of the change rather than a rewrite of the whole matrix. The
+    journal is folded into the matrix by save(), and automatically once it outgrows `compact_rows` and
+    the saved matrix.
+    With hnswlib installed and at least `ann_threshold` rows, searches use an HNSW index instead of a full scan.
+    """
+    def __init__(self, name: str, dim: int, path: str | None = None, ann_threshold: int = 50000, compact_rows: int = 10000):
+        self.name = name
+        self.dim = dim
+        self.path = path
+        self.ann_threshold = ann_threshold
+        self.compact_rows = compact_rows
+        self.journal_rows = 0
+        self.ids: list[str] = []
+        self.documents: list[str] = []
+        self.rows: dict[str, int] = {}
+        self.base = np.zeros((0, dim), dtype=np.float32)
+        self.extra: list[np.ndarray] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.ann = None
+        self.lock = threading.RLock()
+        if path is not None and os.path.exists(self._file("npy")):
+            self._load()
+        elif path is not None and os.path.exists(self._file("journal")):
+            self._replay()
+
+    def _file(self, extension: str) -> str:
+        return os.path.join(self.path, f"{self.name}.{extension}")
+
+    def _load(self):
+        with open(self._file("json")) as f:
+            stored = json.load(f)
+        self.ids, self.documents = stored["ids"], stored["documents"]
+        self.rows = {id: row for row, id in enumerate(self.ids)}
+        self.base = np.load(self._file("npy"), mmap_mode="r")
+        self.extra = []
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.ann = None
+        self.journal_rows = 0
+        if os.path.exists(self._file("journal")):
+            self._replay()
+
+    def _replay(self):
+        with open(self._file("journal")) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A write cut short by a crash; everything before it is intact
+                    break
+                if "remove" in entry:
+                    self.remove(entry["remove"])
+                else:
+                    vectors = np.frombuffer(base64.b64decode(entry["vectors"]), dtype=np.float32).reshape(-1, self.dim)
+                    self.add(entry["ids"], entry["documents"], vectors)
+                self.journal_rows += len(entry.get("ids", entry.get("remove", [])))
+
+    def _journal(self, entry: dict, rows: int):
+        if self.path is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file("journal"), "a") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_rows += rows
+        if self.journal_rows > max(self.compact_rows, len(self.base)):
+            self.save()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _blocks(self) -> list[tuple[int, np.ndarray]]:
+        blocks, offset = [(0, self.base)], len(self.base)
+        for block in self.extra:
+            blocks.append((offset, block))
+            offset += len(block)
+        return blocks
+
+    def add(self, ids: list[str], documents: list[str], vectors: np.ndarray, journal: bool = False):
+        vectors = normalize(vectors)
+        # An id repeated within the batch keeps its last occurrence, as if the rows were added one by one
+        last = {id: i for i, id in enumerate(ids)}
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            ids, documents, vectors = [ids[i] for i in keep], [documents[i] for i in keep], vectors[keep]
+        with self.lock:
+            # Re-adding an id replaces it
+            self.remove([id for id in ids if id in self.rows])
+            start = len(self.ids)
+            self.ids.extend(ids)
+            self.documents.extend(documents)
+            self.rows.update({id: start + i for i, id in enumerate(ids)})
+            self.extra.append(vectors)
+            self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+            if self.ann is not None:
+                self.ann.resize_index(len(self.ids))
+                self.ann.add_items(vectors, np.arange(start, start + len(ids)))
+            if journal:
+                entry = {"ids": ids, "documents": documents, "vectors": base64.b64encode(vectors.tobytes()).decode("ascii")}
+                self._journal(entry, len(ids))
+
+    def remove(self, ids: list[str], journal: bool = False) -> int:
+        with self.lock:
+            removed = []
+            for id in ids:
+                row = self.rows.pop(id, None)
+                if row is None:
+                    continue
+                self.alive[row] = False
+                if self.ann is not None:
+                    self.ann.mark_deleted(row)
+                removed.append(id)
+            if journal and removed:
+                self._journal({"remove": removed}, len(removed))
+            return len(removed)
+
+    def _build_ann(self):
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.init_index(max_elements=max(len(self.ids), 1), ef_construction=200, M=16)
+        for offset, block in self._blocks():
+            if len(block):
+                index.add_items(np.asarray(block), np.arange(offset, offset + len(block)))
+        for row in np.flatnonzero(~self.alive):
+            index.mark_deleted(int(row))
+        self.ann = index
+
+    def search(self, queries: np.ndarray, k: int, exact: bool = False) -> list[list[tuple[int, float]]]:
+        """
+        Finds the k most similar rows for each query by cosine similarity.
+
+        Returns:
+            list: For each query, (row, score) pairs with the best match first.
+        """
+        queries = normalize(np.atleast_2d(queries))
+        with self.lock:
+            k = min(k, len(self))
+            if k == 0:
+                return [[] for _ in queries]
+
+            if not exact and hnswlib is not None and len(self) >= self.ann_threshold:
+                if self.ann is None:
+                    self._build_ann()
+                # ef bounds the candidate list; it has to be at least k
+                self.ann.set_ef(max(64, 2 * k))
+                labels, distances = self.ann.knn_query(queries, k=k)
+                return [[(int(row), 1.0 - float(d)) for row, d in zip(l, ds)] for l, ds in zip(labels, distances)]
+
+            scores = np.concatenate([np.asarray(block) @ queries.T for _, block in self._blocks()], axis=0)
+            scores[~self.alive] = -np.inf
+            top = np.argpartition(-scores, k - 1, axis=0)[:k]
+            results = []
+            for q in range(len(queries)):
+                rows = top[:, q][np.argsort(-scores[top[:, q], q])]
+                results.append([(int(row), float(scores[row, q])) for row in rows])
+            return results
+
+    def search_documents(self, query: np.ndarray, k: int) -> list[str]:
+        """
+        Returns the documents of the k rows most similar to one query, best match first. Rows are
+        renumbered when the journal is compacted, so they are resolved to documents under the same lock
+        as the search.
+        """
+        with self.lock:
+            return [self.documents[row] for row, _ in self.search(query, k)[0]]
+
+    def items(self) -> list[tuple[str, str]]:
+        with self.lock:
+            return [(id, self.documents[row]) for id, row in self.rows.items()]
+
+    def save(self):
+        """
+        Compacts removed rows away and writes the collection to disk, then memory-maps it again. The
+        journal is emptied, since everything in it is now in the matrix.
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            live = np.flatnonzero(self.alive)
+            matrix = np.concatenate([np.asarray(block) for _, block in self._blocks()], axis=0)[live]
+            os.makedirs(self.path, exist_ok=True)
+            np.save(self._file("tmp.npy"), matrix)
+            with open(self._file("tmp.json"), "w") as f:
+                json.dump({"ids": [self.ids[i] for i in live], "documents": [self.documents[i] for i in live]}, f)
+            os.replace(self._file("tmp.npy"), self._file("npy"))
+            os.replace(self._file("tmp.json"), self._file("json"))
+            # Replaying a journal left behind by a crash here would only re-apply what was saved
+            if os.path.exists(self._file("journal")):
+                os.remove(self._file("journal"))
+            self._load()
+
+
+class LocalVectorStore(VannaBase):
+    """
+    A vector store that keeps training data in local NumPy matrices instead of a hosted service.
+
+    Config:
+        path: Directory to persist collections in. None keeps everything in memory.
+        embedding_function: Maps a list of strings to a 2D array of embeddings. Defaults to HashingEmbedder.
+        n_results: Results per lookup, overridable with n_results_sql / n_results_ddl / n_results_documentation.
+        ann_threshold: Collections with at least this many rows use an HNSW index when hnswlib is installed.
+        autosave: Persist every add and remove by appending it to the collection's journal. Bulk loaders
+            can instead pass journal=False to the batch methods and call save() once they are done.
+    """
+    def __init__(self, config=None):
+        VannaBase.__init__(self, config=config)
+        if config is None:
+            config = {}
+
+        self.embedding_function: Callable[[list[str]], np.ndarray] = config.get("embedding_function", HashingEmbedder())
+        self.n_results_sql = config.get("n_results_sql", config.get("n_results", 10))
+        self.n_results_ddl = config.get("n_results_ddl", config.get("n_results", 10))
+        self.n_results_documentation = config.get("n_results_documentation", config.get("n_results", 10))
+        self.autosave = config.get("autosave", True)
+
+        dim = np.asarray(self.embedding_function(["dimension probe"])).shape[1]
+        path = config.get("path")
+        ann_threshold = config.get("ann_threshold", 50000)
+        self.collections = {
+            name: Collection(name, dim, path=path, ann_threshold=ann_threshold)
+            for name in ("sql", "ddl", "documentation")
+        }
+
+    def generate_embedding(self, data: str, **kwargs) -> list[float]:
+        return normalize(self.embedding_function([data]))[0].tolist()
+
+    def _add(self, name: str, ids: list[str], documents: list[str], texts: list[str], journal: bool | None = None):
+        if not ids:
+            return
+        journal = self.autosave if journal is None else journal
+        self.collections[name].add(ids, documents, self.embedding_function(texts), journal=journal)
+
+    def _query(self, name: str, question: str, k: int) -> list[str]:
+        return self.collections[name].search_documents(self.embedding_function([question]), k)
+
+    def add_question_sql(self, question: str, sql: str, **kwargs) -> str:
+        document = json.dumps({"question": question, "sql": sql}, ensure_ascii=False)
+        id = deterministic_uuid(document) + "-sql"
+        self._add("sql", [id], [document], [question])
+        return id
+
+    def add_ddl(self, ddl: str, **kwargs) -> str:
+        id = deterministic_uuid(ddl) + "-ddl"
+        self._add("ddl", [id], [ddl], [ddl])
+        return id
+
+    def add_documentation(self, documentation: str, **kwargs) -> str:
+        id = deterministic_uuid(documentation) + "-doc"
+        self._add("documentation", [id], [documentation], [documentation])
+        return id
+
+    def add_question_sql_batch(self, pairs: list[tuple[str, str]], journal: bool | None = None) -> list[str]:
+        """
+        Adds many question/SQL pairs with a single embedding call and a single write. `journal` overrides
+        autosave for this call only; a caller passing False is expected to call save() itself.
+        """
+        documents = [json.dumps({"question": q, "sql": s}, ensure_ascii=False) for q, s in pairs]
+        ids = [deterministic_uuid(document) + "-sql" for document in documents]
+        self._add("sql", ids, documents, [q for q, _ in pairs], journal=journal)
+        return ids
+
+    def add_ddl_batch(self, ddl_list: list[str], journal: bool | None = None) -> list[str]:
+        ids = [deterministic_uuid(ddl) + "-ddl" for ddl in ddl_list]
+        self._add("ddl", ids, ddl_list, ddl_list, journal=journal)
+        return ids
+
+    def add_documentation_batch(self, documentation_list: list[str], journal: bool | None = None) -> list[str]:
+        ids = [deterministic_uuid(documentation) + "-doc" for documentation in documentation_list]
+        self._add("documentation", ids, documentation_list, documentation_list, journal=journal)
+        return ids
+
+    def get_similar_question_sql(self, question: str, **kwargs) -> list:
+        return [json.loads(document) for document in self._query("sql", question, self.n_results_sql)]
+
+    def get_related_ddl(self, question: str, **kwargs) -> list:
+        return self._query("ddl", question, self.n_results_ddl)
+
+    def get_related_documentation(self, question: str, **kwargs) -> list:
+        return self._query("documentation", question, self.n_results_documentation)
+
+    def get_training_data(self, **kwargs) -> pd.DataFrame:
+        records = []
+        for id, document in self.collections["sql"].items():
+            pair = json.loads(document)
+            records.append({"id": id, "question": pair["question"], "content": pair["sql"], "training_data_type": "sql"})
+        for id, document in self.collections["ddl"].items():
+            records.append({"id": id, "question": None, "content": document, "training_data_type": "ddl"})
+        for id, document in self.collections["documentation"].items():
+            records.append({"id": id, "question": None, "content": document, "training_data_type": "documentation"})
+        return pd.DataFrame(records, columns=["id", "question", "content", "training_data_type"])
+
+    def remove_training_data(self, id: str, **kwargs) -> bool:
+        suffixes = {"-sql": "sql", "-ddl": "ddl", "-doc": "documentation"}
+        name = next((name for suffix, name in suffixes.items() if id.endswith(suffix)), None)
+        return name is not None and bool(self.collections[name].remove([id], journal=self.autosave))
+
+    def save(self):
+        for collection in self.collections.values():
+            collection.save()
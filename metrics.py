@@ -0,0 +1,98 @@
+import bisect
+import threading
+
+# Seconds; roughly the Prometheus client defaults, extended for slow queries and LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    A thread-safe cumulative histogram in the shape Prometheus expects.
+
+    Args:
+        name: The metric name.
+        description: One line describing what is measured.
+        buckets: Upper bounds of the buckets, in increasing order. +Inf is implied.
+    """
+    def __init__(self, name: str, description: str = "", buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in.
+        """
+        with self._lock:
+            if self.count == 0:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+            return float("inf")
+
+    def stats(self) -> dict:
+        with self._lock:
+            cumulative, seen = {}, 0
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                seen += count
+                cumulative["+Inf" if bound == float("inf") else str(bound)] = seen
+            return {"count": self.count, "sum": self.sum, "buckets": cumulative}
+
+
+class Registry:
+    """
+    The histograms served on /metrics. Histograms sharing a name differ by their labels.
+    """
+    def __init__(self):
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, description: str = "", buckets: tuple = DEFAULT_BUCKETS, **labels) -> Histogram:
+        """
+        Returns the histogram for a name and set of labels, creating it on first use.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(name, description, buckets)
+            return self.histograms[key]
+
+    def render(self) -> str:
+        """
+        Renders every histogram in the Prometheus text exposition format.
+        """
+        with self._lock:
+            items = sorted(self.histograms.items(), key=lambda item: item[0])
+
+        lines, described = [], set()
+        for (name, labels), histogram in items:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {histogram.description}")
+                lines.append(f"# TYPE {name} histogram")
+            stats = histogram.stats()
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            prefix = label_text + "," if label_text else ""
+            for bound, count in stats["buckets"].items():
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{name}_sum{suffix} {stats['sum']}")
+            lines.append(f"{name}_count{suffix} {stats['count']}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
@@ -0,0 +1,226 @@
+"""
+Speculative SQL generation for the questions a user is likely to click next (suggested and follow-up
+questions), so the click is answered from the result cache instead of a cold LLM round trip.
+"""
+import contextvars
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable
+
+import pandas as pd
+from vanna.flask import Cache
+
+from tracing import tracer
+
+
+class Prefetch:
+    """
+    One scheduled question. `stale` is set when the user's conversation moves on, which stops the work
+    at the next step if it has already started. `claimed` is set when the user clicks the question while
+    the work is running, so it stops waiting for the server to become idle.
+    """
+    def __init__(self, question: str, id: str):
+        self.question = question
+        self.id = id
+        self.stale = threading.Event()
+        self.claimed = threading.Event()
+        self.future: Future | None = None
+
+
+class Prefetcher:
+    """
+    Generates (and optionally runs) the SQL for candidate questions on a small background pool, and stores
+    the results in the result cache under the id the click on that question will be given.
+
+    Work for a user is cancelled when new candidates are scheduled for them or when they ask a question,
+    since either means the conversation has moved on. Each user may start at most `budget` prefetches per
+    `budget_window` seconds, and prefetches wait until the server is idle before calling the LLM, unless
+    their question is clicked in the meantime.
+
+    A finished prefetch is also recorded in the cache under a key derived from the user and question, so
+    a click served by another worker process sharing the cache (see result_cache.SQLiteCache) still
+    finds it. Queued or running work is only visible to the process that scheduled it.
+
+    Args:
+        cache: The result cache the Flask app reads from.
+        generate_sql: Returns the SQL for a question and user key, as the generate_sql route would for that user.
+        run_sql: Runs validated SQL. Without one, only the SQL is prefetched.
+        is_sql_valid: Decides whether generated SQL is worth running.
+        is_idle: Returns True when the server has spare capacity.
+        top_n: How many candidates to prefetch from each list of questions.
+        workers: Size of the background pool.
+        budget: Prefetches one user may start per budget_window.
+        budget_window: Seconds over which the budget is counted.
+        idle_timeout: Seconds a prefetch waits for the server to become idle before it is dropped.
+    """
+    def __init__(
+            self,
+            cache: Cache,
+            generate_sql: Callable[[str, str], str],
+            run_sql: Callable[[str], pd.DataFrame] | None = None,
+            is_sql_valid: Callable[[str], bool] = lambda sql: True,
+            is_idle: Callable[[], bool] = lambda: True,
+            top_n: int = 3,
+            workers: int = 2,
+            budget: int = 30,
+            budget_window: float = 3600,
+            idle_timeout: float = 10.0,
+        ):
+        self.cache = cache
+        self.generate_sql = generate_sql
+        self.run_sql = run_sql
+        self.is_sql_valid = is_sql_valid
+        self.is_idle = is_idle
+        self.top_n = top_n
+        self.budget = budget
+        self.budget_window = budget_window
+        self.idle_timeout = idle_timeout
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+
+        self._lock = threading.Lock()
+        self._pending: dict[str, dict[str, Prefetch]] = {}
+        self._spent: dict[str, deque] = {}
+        self._counts = {"scheduled": 0, "over_budget": 0, "cancelled": 0, "completed": 0, "failed": 0, "hits": 0, "misses": 0}
+
+    @staticmethod
+    def pointer_id(user_key: str, question: str) -> str:
+        return "prefetch-" + hashlib.sha256(f"{user_key}\0{question.strip()}".encode("utf-8")).hexdigest()
+
+    def schedule(self, user_key: str, questions: list[str]):
+        """
+        Replaces the user's pending prefetches with the first top_n of `questions`, within their budget.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._cancel(user_key, self._pending.pop(user_key, {}).values())
+            spent = self._spent.setdefault(user_key, deque())
+            while spent and now - spent[0] > self.budget_window:
+                spent.popleft()
+
+            pending = {}
+            for question in questions[:self.top_n]:
+                question = question.strip()
+                if not question or question in pending:
+                    continue
+                if len(spent) >= self.budget:
+                    self._counts["over_budget"] += 1
+                    break
+                spent.append(now)
+                prefetch = Prefetch(question, self.cache.generate_id(question=question))
+                # The request's context goes along, e.g. the tenant its LLM calls are routed for
+                prefetch.future = self.pool.submit(contextvars.copy_context().run, self._run, user_key, prefetch)
+                pending[question] = prefetch
+                self._counts["scheduled"] += 1
+            self._pending[user_key] = pending
+
+    def claim(self, user_key: str, question: str, timeout: float = 60.0) -> str | None:
+        """
+        Returns the cache id holding a prefetched answer to `question`, waiting for the prefetch if it is
+        running. A prefetch that has not started yet is cancelled instead, since the caller generating the
+        answer itself is no slower. The user's other prefetches are cancelled. Returns None on a miss.
+        """
+        question = question.strip()
+        with self._lock:
+            pending = self._pending.pop(user_key, {})
+            prefetch = pending.pop(question, None)
+            self._cancel(user_key, pending.values())
+            if prefetch is not None and prefetch.future.cancel():
+                self._counts["cancelled"] += 1
+                self._refund(user_key)
+                prefetch = None
+
+        id = None
+        if prefetch is not None:
+            # The click is an active request itself, so waiting for the server to become idle would only
+            # run out idle_timeout
+            prefetch.claimed.set()
+            try:
+                id = prefetch.future.result(timeout=timeout)
+            except (CancelledError, FutureTimeoutError):
+                prefetch.stale.set()
+            except Exception:
+                pass
+
+        # Finished prefetches are also found through the shared cache, whichever worker ran them
+        pointer = self.pointer_id(user_key, question)
+        if id is None:
+            id = self.cache.get(id=pointer, field="id")
+        self.cache.delete(id=pointer)
+        if id is not None:
+            self.cache.set(id=id, field="question", value=question)
+
+        with self._lock:
+            self._counts["hits" if id is not None else "misses"] += 1
+        return id
+
+    def cancel(self, user_key: str):
+        """
+        Cancels the user's pending prefetches.
+        """
+        with self._lock:
+            self._cancel(user_key, self._pending.pop(user_key, {}).values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = sum(not prefetch.future.done() for pending in self._pending.values() for prefetch in pending.values())
+            return {**self._counts, "running": running}
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _cancel(self, user_key: str, prefetches):
+        # Called with the lock held
+        for prefetch in prefetches:
+            prefetch.stale.set()
+            if prefetch.future.cancel():
+                self._counts["cancelled"] += 1
+                self._refund(user_key)
+
+    def _refund(self, user_key: str):
+        # Called with the lock held; prefetches that never reached the LLM don't count against the budget
+        spent = self._spent.get(user_key)
+        if spent:
+            spent.pop()
+
+    def _run(self, user_key: str, prefetch: Prefetch) -> str | None:
+        deadline = time.monotonic() + self.idle_timeout
+
+        def may_start() -> bool:
+            return prefetch.claimed.is_set() or self.is_idle()
+
+        while not may_start() and not prefetch.stale.is_set() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if not may_start() or prefetch.stale.is_set():
+            with self._lock:
+                self._counts["cancelled"] += 1
+                self._refund(user_key)
+            return None
+
+        with tracer.span("prefetch", root=True, question=prefetch.question, id=prefetch.id) as span:
+            try:
+                sql = self.generate_sql(prefetch.question, user_key)
+            except Exception as e:
+                span.set_attribute("error", str(e))
+                with self._lock:
+                    self._counts["failed"] += 1
+                return None
+            # The question field is only written when the prefetch is claimed, so unclicked
+            # prefetches stay out of the question history
+            self.cache.set(id=prefetch.id, field="sql", value=sql)
+
+            if self.run_sql is not None and not prefetch.stale.is_set() and self.is_sql_valid(sql):
+                try:
+                    # Served once by the run_sql route; re-running the same id queries the database again
+                    self.cache.set(id=prefetch.id, field="prefetched_df", value=self.run_sql(sql))
+                    span.set_attribute("ran_sql", True)
+                except Exception as e:
+                    # The click still gets the SQL, and run_sql reports the error as usual
+                    span.set_attribute("error", str(e))
+
+        self.cache.set(id=self.pointer_id(user_key, prefetch.question), field="id", value=prefetch.id)
+        with self._lock:
+            self._counts["completed"] += 1
+        return prefetch.id
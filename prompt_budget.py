@@ -0,0 +1,122 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from itertools import zip_longest
+from typing import Callable
+
+# Approximate tokens the Llama-3 chat template adds around each message
+MESSAGE_OVERHEAD = 5
+# Tokens reserved for the response guidelines get_sql_prompt appends to the system message
+GUIDELINES_TOKENS = 200
+
+
+class TokenCounter:
+    """
+    Memoizes token counts by content hash, so the same DDL, documentation and example SQL
+    are only tokenized once.
+
+    Args:
+        encode: Returns the token ids for a string.
+        max_entries: The number of counts kept before the least recently used one is dropped.
+    """
+    def __init__(self, encode: Callable[[str], list], max_entries: int = 8192):
+        self.encode = encode
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._counts: OrderedDict[bytes, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return count
+
+        # Tokenize outside the lock; two threads racing on the same string just both compute it
+        count = len(self.encode(text))
+        with self._lock:
+            self.misses += 1
+            self._counts[key] = count
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._counts)}
+
+
+class PromptBudgeter:
+    """
+    Packs retrieved context into a token budget.
+
+    The vector store returns each list ordered by relevance, so items are taken round-robin by rank
+    (best DDL, best example, best doc, then the second of each, ...) and anything that does not fit
+    in the remaining budget is skipped.
+
+    Args:
+        counter: The TokenCounter used to measure each item.
+        context_window: The model's context length in tokens.
+        reserve: Tokens kept free for the completion, usually the request's max_tokens.
+    """
+    def __init__(self, counter: TokenCounter, context_window: int = 8192, reserve: int = 2048):
+        self.counter = counter
+        self.context_window = context_window
+        self.reserve = reserve
+
+    @property
+    def budget(self) -> int:
+        return self.context_window - self.reserve
+
+    def _example_tokens(self, example: dict) -> int:
+        return self.counter.count(example["question"]) + self.counter.count(example["sql"]) + 2 * MESSAGE_OVERHEAD
+
+    def pack(
+            self,
+            question: str,
+            initial_prompt: str | None,
+            question_sql_list: list,
+            ddl_list: list,
+            doc_list: list,
+            reserve: int | None = None,
+        ) -> tuple[list, list, list]:
+        """
+        Chooses which retrieved items to include in the SQL prompt.
+
+        Args:
+            reserve: Overrides the completion reserve for this prompt, e.g. a per-call max_tokens.
+
+        Returns:
+            tuple: The kept (question_sql_list, ddl_list, doc_list), each in its original order.
+        """
+        reserve = self.reserve if reserve is None else reserve
+        remaining = self.context_window - reserve - GUIDELINES_TOKENS - self.counter.count(question) - 2 * MESSAGE_OVERHEAD
+        if initial_prompt:
+            remaining -= self.counter.count(initial_prompt)
+
+        examples = [e for e in question_sql_list if e is not None and "question" in e and "sql" in e]
+        candidates = zip_longest(
+            [("ddl", i, self.counter.count(ddl)) for i, ddl in enumerate(ddl_list)],
+            [("example", i, self._example_tokens(e)) for i, e in enumerate(examples)],
+            [("doc", i, self.counter.count(doc)) for i, doc in enumerate(doc_list)],
+        )
+
+        kept = {"ddl": set(), "example": set(), "doc": set()}
+        for rank in candidates:
+            for item in rank:
+                if item is None:
+                    continue
+                kind, index, tokens = item
+                if tokens <= remaining:
+                    kept[kind].add(index)
+                    remaining -= tokens
+
+        return (
+            [e for i, e in enumerate(examples) if i in kept["example"]],
+            [ddl for i, ddl in enumerate(ddl_list) if i in kept["ddl"]],
+            [doc for i, doc in enumerate(doc_list) if i in kept["doc"]],
+        )
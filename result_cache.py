@@ -0,0 +1,314 @@
+import importlib.util
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+from vanna.flask import Cache
+
+logger = logging.getLogger(__name__)
+
+def sizeof(value) -> int:
+    """
+    Approximates the bytes a cached value holds. DataFrames are measured with memory_usage(deep=True).
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+class SpilledFrame:
+    """
+    Placeholder for a DataFrame that was written to disk to keep it out of memory.
+    """
+    def __init__(self, path: str, nbytes: int):
+        self.path = path
+        self.nbytes = nbytes
+
+
+class BoundedCache(Cache):
+    """
+    A Cache with a memory budget. Entries (all fields of one id) are evicted least recently used
+    first when the budget is exceeded or after `ttl` seconds. DataFrames larger than `spill_bytes`
+    are written to Parquet files and read back when they are next requested.
+
+    Args:
+        max_bytes: The memory budget across all entries.
+        ttl: Seconds an entry lives after it was last written. None keeps entries until they are evicted.
+        spill_bytes: DataFrames at least this large are spilled to disk. None disables spilling.
+        spill_dir: Where spilled DataFrames are written. Defaults to a temporary directory.
+        max_spill_bytes: The disk budget for spilled DataFrames.
+    """
+    def __init__(
+            self,
+            max_bytes: int = 512 * 1024 * 1024,
+            ttl: float | None = 24 * 3600,
+            spill_bytes: int | None = 32 * 1024 * 1024,
+            spill_dir: str | None = None,
+            max_spill_bytes: int = 4 * 1024 * 1024 * 1024,
+        ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # Parquet needs pyarrow; without it large frames simply count against the memory budget
+        if spill_bytes is not None and importlib.util.find_spec("pyarrow") is None:
+            logger.warning("pyarrow is not installed, BoundedCache will not spill DataFrames to disk")
+            spill_bytes = None
+        self.spill_bytes = spill_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="vanna-cache-")
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+        self.cache: OrderedDict[str, dict] = OrderedDict()
+        self.sizes: dict[str, dict[str, int]] = {}
+        self.written: dict[str, float] = {}
+        self.bytes_held = 0
+        self.spilled_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spills = 0
+        # The last spilled frame read back, as (path, frame, size); it counts against max_bytes while held
+        self._reloaded: tuple[str, pd.DataFrame, int] | None = None
+        self._lock = threading.RLock()
+
+    def generate_id(self, *args, **kwargs):
+        return str(uuid.uuid4())
+
+    def set(self, id, field, value):
+        with self._lock:
+            self._discard_field(id, field)
+
+            size = sizeof(value)
+            if self.spill_bytes is not None and isinstance(value, pd.DataFrame) and size >= self.spill_bytes:
+                spilled = self._spill(id, field, value)
+                if spilled is not None:
+                    value, size = spilled, 0
+
+            self.cache.setdefault(id, {})[field] = value
+            self.sizes.setdefault(id, {})[field] = size
+            self.cache.move_to_end(id)
+            self.written[id] = time.time()
+            self.bytes_held += size
+            self._evict()
+
+    def get(self, id, field):
+        with self._lock:
+            if id not in self.cache or self._expired(id):
+                self.misses += 1
+                return None
+            if field not in self.cache[id]:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.cache.move_to_end(id)
+            value = self._value(id, field)
+            # A frame read back from disk may have taken the cache over its budget
+            self._evict()
+            return value
+
+    def get_all(self, field_list) -> list:
+        # Listing every entry (e.g. the question history) is not a use of each one, so recency and the
+        # hit and miss counters are left alone
+        with self._lock:
+            entries = [
+                {"id": id, **{field: self._value(id, field) for field in field_list}}
+                for id in list(self.cache)
+                if not self._expired(id)
+            ]
+            self._evict()
+            return entries
+
+    def delete(self, id):
+        with self._lock:
+            for field in list(self.cache.get(id, {})):
+                self._discard_field(id, field)
+            self.cache.pop(id, None)
+            self.sizes.pop(id, None)
+            self.written.pop(id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self.cache),
+                "bytes_held": self.bytes_held,
+                "max_bytes": self.max_bytes,
+                "spilled_bytes": self.spilled_bytes,
+                "spills": self.spills,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _value(self, id, field):
+        value = self.cache[id].get(field)
+        if isinstance(value, SpilledFrame):
+            return self._reload(value)
+        return value
+
+    def _expired(self, id) -> bool:
+        if self.ttl is None or time.time() - self.written[id] <= self.ttl:
+            return False
+        self.delete(id)
+        self.evictions += 1
+        return True
+
+    def _evict(self):
+        # The most recently written entry is kept even if it alone exceeds the budget
+        while (self.bytes_held > self.max_bytes or self.spilled_bytes > self.max_spill_bytes) and len(self.cache) > 1:
+            id = next(iter(self.cache))
+            self.delete(id)
+            self.evictions += 1
+
+    def _discard_field(self, id, field):
+        if field not in self.cache.get(id, {}):
+            return
+        value = self.cache[id].pop(field)
+        self.bytes_held -= self.sizes[id].pop(field)
+        if isinstance(value, SpilledFrame):
+            self.spilled_bytes -= value.nbytes
+            if self._reloaded is not None and self._reloaded[0] == value.path:
+                self._hold_reloaded(None)
+            try:
+                os.remove(value.path)
+            except FileNotFoundError:
+                pass
+
+    def _spill(self, id, field, df: pd.DataFrame) -> SpilledFrame | None:
+        path = os.path.join(self.spill_dir, f"{id}-{field}.parquet")
+        try:
+            df.to_parquet(path)
+        except Exception as e:
+            # e.g. column types Parquet can't represent; keep the frame in memory instead
+            logger.warning("Could not spill %s/%s to disk: %s", id, field, e)
+            return None
+        nbytes = os.path.getsize(path)
+        self.spills += 1
+        self.spilled_bytes += nbytes
+        return SpilledFrame(path, nbytes)
+
+    def _reload(self, spilled: SpilledFrame) -> pd.DataFrame:
+        # Routes often read the same field twice in a row (requires_cache checks then fetches it)
+        if self._reloaded is None or self._reloaded[0] != spilled.path:
+            df = pd.read_parquet(spilled.path)
+            self._hold_reloaded((spilled.path, df, sizeof(df)))
+            return df
+        return self._reloaded[1]
+
+    def _hold_reloaded(self, reloaded: tuple[str, pd.DataFrame, int] | None):
+        if self._reloaded is not None:
+            self.bytes_held -= self._reloaded[2]
+        self._reloaded = reloaded
+        if reloaded is not None:
+            self.bytes_held += reloaded[2]
+
+
+class SQLiteCache(Cache):
+    """
+    A Cache in a SQLite file shared by every worker process on the host, so load_question, run_sql and
+    the other follow-up routes find what generate_sql stored whichever worker served it. Values are
+    pickled. Fields are evicted least recently used first past `max_bytes`, and `ttl` seconds after
+    they were written.
+
+    Args:
+        path: The SQLite database file. Every worker must be given the same path.
+        max_bytes: The budget for stored (pickled) values.
+        ttl: Seconds a field lives after it was written. None keeps fields until they are evicted.
+    """
+    def __init__(self, path: str = "result_cache.sqlite", max_bytes: int = 1024 * 1024 * 1024, ttl: float | None = 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # busy_timeout lets workers wait for each other's writes instead of failing
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "id TEXT NOT NULL, field TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, written REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (id, field))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    def generate_id(self, *args, **kwargs):
+        return str(uuid.uuid4())
+
+    def set(self, id, field, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock:
+            # Keep the entry's creation time so get_all lists questions in the order they were asked
+            created = self.conn.execute("SELECT MIN(created) FROM results WHERE id = ?", (id,)).fetchone()[0]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (id, field, value, size, created, written, accessed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (id, field, blob, len(blob), created or now, now, now),
+            )
+            self._evict(id, field)
+
+    def get(self, id, field):
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT value, written FROM results WHERE id = ? AND field = ?", (id, field)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE results SET accessed = ? WHERE id = ? AND field = ?", (now, id, field))
+        return pickle.loads(row[0])
+
+    def get_all(self, field_list) -> list:
+        with self._lock:
+            ids = [row[0] for row in self.conn.execute("SELECT id FROM results GROUP BY id ORDER BY MIN(created)")]
+        return [{"id": id, **{field: self.get(id=id, field=field) for field in field_list}} for id in ids]
+
+    def delete(self, id):
+        with self._lock:
+            self.conn.execute("DELETE FROM results WHERE id = ?", (id,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, bytes_held = self.conn.execute("SELECT COUNT(DISTINCT id), COALESCE(SUM(size), 0) FROM results").fetchone()
+            return {
+                "entries": entries,
+                "bytes_held": bytes_held,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self, id, field):
+        if self.ttl is not None:
+            self.evictions += self.conn.execute("DELETE FROM results WHERE written < ?", (time.time() - self.ttl,)).rowcount
+        overflow = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0] - self.max_bytes
+        # The field just written is kept even if it alone exceeds the budget
+        while overflow > 0:
+            row = self.conn.execute(
+                "SELECT id, field, size FROM results WHERE NOT (id = ? AND field = ?) ORDER BY accessed LIMIT 1", (id, field)
+            ).fetchone()
+            if row is None:
+                break
+            self.conn.execute("DELETE FROM results WHERE id = ? AND field = ?", row[:2])
+            self.evictions += 1
+            overflow -= row[2]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
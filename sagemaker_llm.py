@@ -1,16 +1,95 @@
 
 import os
 import re
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Iterator
+from urllib.parse import urlparse
 from pandas import DataFrame
-from transformers import AutoTokenizer
 from vanna.base import VannaBase
-import boto3
+from vanna.types import TrainingPlan, TrainingPlanItem
 import json
+import requests
+
+from df_summary import DataFrameSummarizer
+from prompt_budget import MESSAGE_OVERHEAD, PromptBudgeter, TokenCounter
+from sql_engine import SQLiteEngine
+from sql_validation import SQLValidator, ValidationResult
+from tracing import observe_llm_call, tracer
+
+# The table or view a DDL statement creates
+DDL_NAME = re.compile(r"CREATE\s+(?:TABLE|VIEW)\s+(?:IF\s+NOT\s+EXISTS\s+)?[\"'`\[]?(\w+)", re.IGNORECASE)
+INTROSPECTION_NOT_ALLOWED = (
+    "The LLM is not allowed to see the data in your database. Your question requires database introspection "
+    "to generate the necessary SQL. Please set allow_llm_to_see_data=True to enable this."
+)
+
+# transformers and boto3 are imported on first use; tokenizers and clients are shared process-wide
+_shared_lock = threading.Lock()
+_shared_tokenizers = {}
+_shared_clients = {}
+
+
+def get_tokenizer(model: str, tokenizer_path: str | None = None):
+    """
+    Returns the process-wide tokenizer for a model, loading it on first use.
+
+    Args:
+        model: The Hugging Face model id.
+        tokenizer_path: A local directory holding the tokenizer files. When set, the hub is never contacted.
+    """
+    key = tokenizer_path or model
+    with _shared_lock:
+        if key not in _shared_tokenizers:
+            from transformers import AutoTokenizer
+
+            if tokenizer_path:
+                _shared_tokenizers[key] = AutoTokenizer.from_pretrained(tokenizer_path, local_files_only=True)
+            else:
+                _shared_tokenizers[key] = AutoTokenizer.from_pretrained(model)
+        return _shared_tokenizers[key]
+
+
+def get_runtime_client(
+        region_name: str,
+        aws_access_key_id: str | None = None,
+        aws_secret_access_key: str | None = None,
+        max_pool_connections: int = 50,
+        retries: int = 3,
+    ):
+    """
+    Returns the process-wide 'sagemaker-runtime' client for a region and set of credentials.
+
+    boto3 clients are thread-safe, so one client with a large keep-alive connection pool is shared
+    by every request thread instead of each instance paying for client construction and TLS setup.
+    `retries` are botocore's own retries after the first attempt; 0 leaves retrying to the caller (see llm_router).
+    """
+    key = (region_name, aws_access_key_id, aws_secret_access_key, max_pool_connections, retries)
+    with _shared_lock:
+        if key not in _shared_clients:
+            import boto3
+            from botocore.config import Config
+
+            _shared_clients[key] = boto3.session.Session().client(
+                'sagemaker-runtime',
+                region_name=region_name,
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+                config=Config(
+                    max_pool_connections=max_pool_connections,
+                    tcp_keepalive=True,
+                    # Adaptive mode also rate-limits the client itself, which only helps when botocore retries
+                    retries={'max_attempts': retries, 'mode': 'adaptive' if retries else 'standard'},
+                ),
+            )
+        return _shared_clients[key]
+
 
 class SageMakerLLM(VannaBase):
     def __init__(self, config=None):
         super().__init__(config)
-        print(config)
         if config is None:
             raise ValueError("Config must be provided for SageMakerLLM(VannaBase):")
         
@@ -25,14 +104,94 @@ class SageMakerLLM(VannaBase):
         self.stop = config.get('stop', ['<|eot_id|>'])
         self.aws_access_key_id = config.get('aws_access_key_id')
         self.aws_secret_access_key = config.get('aws_secret_access_key')
+        # Optional llm_cache.ResponseCache / llm_cache.QuestionCache instances
+        self.response_cache = config.get('response_cache')
+        self.question_cache = config.get('question_cache')
+        # Optional llm_router.LLMRouter: per-tenant endpoints, models and limits. Without one, every call goes to endpoint_name
+        self.router = config.get('router')
+
+        # Vector store lookups run concurrently; a source that misses its timeout is left out of the context
+        self.retrieval_timeouts = {
+            'question_sql_list': 5.0,
+            'ddl_list': 5.0,
+            'doc_list': 2.0,
+            **config.get('retrieval_timeouts', {}),
+        }
+        self.retrieval_pool = ThreadPoolExecutor(
+            max_workers=config.get('retrieval_workers', 6),
+            thread_name_prefix='vanna-retrieval',
+        )
+        # Prompts that needn't hold up the request (chat titles, conversation summaries) run on this pool
+        self.llm_pool = ThreadPoolExecutor(
+            max_workers=config.get('llm_workers', 8),
+            thread_name_prefix='vanna-llm',
+        )
         
-        self.smr = boto3.client(
-            'sagemaker-runtime', 
-            region_name=self.region_name,
-            aws_access_key_id=self.aws_access_key_id,
-            aws_secret_access_key=self.aws_secret_access_key,
+        # A pre-built client (e.g. a local fake endpoint) can be injected through the config
+        self._smr = config.get('client')
+        self.max_pool_connections = config.get('max_pool_connections', 50)
+        self._tokenizer = None
+        self.tokenizer_path = config.get('tokenizer_path')
+        # Set by connect_to_sqlite; checks SQL against the schema and query plan before it runs
+        self.sql_validator = None
+        self.large_table_rows = config.get('large_table_rows', 100000)
+        self.strict_sql_validation = config.get('strict_sql_validation', False)
+
+        # self.max_tokens is the completion limit here, so the prompt is bounded by context_window - max_tokens
+        self.token_counter = TokenCounter(
+            lambda string: self.tokenizer.encode(string),
+            max_entries=config.get('token_cache_entries', 8192),
+        )
+        self.prompt_budgeter = PromptBudgeter(
+            self.token_counter,
+            context_window=config.get('context_window', 8192),
+            reserve=self.max_tokens,
         )
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model)
+        # Query results go into prompts as a bounded summary rather than the whole frame
+        self.df_summarizer = DataFrameSummarizer(self.token_counter, max_tokens=config.get('df_prompt_tokens', 1500))
+        # Earlier turns of a conversation go into prompts newest first, up to this many tokens
+        self.history_tokens = config.get('history_tokens', 1024)
+        # Prompts that fix failed SQL only carry the question, the failed attempts and this many tokens of DDL
+        self.repair_prompt_tokens = config.get('repair_prompt_tokens', 2048)
+
+    @property
+    def smr(self):
+        if self._smr is None:
+            self._smr = get_runtime_client(
+                self.region_name,
+                aws_access_key_id=self.aws_access_key_id,
+                aws_secret_access_key=self.aws_secret_access_key,
+                max_pool_connections=self.max_pool_connections,
+                # The router retries throttled calls on the tenant's other endpoints; botocore retrying each
+                # attempt as well would multiply the attempts and delay the failover
+                retries=0 if self.router is not None else 3,
+            )
+        return self._smr
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._tokenizer = get_tokenizer(self.model, self.tokenizer_path)
+        return self._tokenizer
+
+    def warmup(self):
+        """
+        Loads the tokenizer and SageMaker client ahead of the first request.
+        """
+        start = time.perf_counter()
+        self.tokenizer.encode("warmup")
+        self.smr  # Builds the shared client
+        self.log(title="Warmup", message=f"Tokenizer and SageMaker client ready in {time.perf_counter() - start:.2f}s")
+
+    def close(self):
+        """
+        Releases the thread pools and database connections, e.g. when a server worker shuts down.
+        Queued work is cancelled; requests already running are left to finish.
+        """
+        self.retrieval_pool.shutdown(wait=False, cancel_futures=True)
+        self.llm_pool.shutdown(wait=False, cancel_futures=True)
+        if getattr(self, 'sql_engine', None) is not None:
+            self.sql_engine.close()
 
     def system_message(self, message: str) -> dict:
         return {"role": "system", "content": message}
@@ -44,13 +203,103 @@ class SageMakerLLM(VannaBase):
         return {"role": "assistant", "content": message}
 
     def str_to_approx_token_count(self, string: str) -> int:
-        return len(self.tokenizer.encode(string))
+        return self.token_counter.count(string)
 
-    def submit_prompt(self, prompt, **kwargs) -> str:
+    def get_sql_prompt(
+            self,
+            initial_prompt: str,
+            question: str,
+            question_sql_list: list,
+            ddl_list: list,
+            doc_list: list,
+            chat_history: list | None = None,
+            **kwargs,
+        ):
+        """
+        Builds the SQL prompt from the highest-relevance context that fits in the prompt budget.
+
+        The conversation's history window, if any, goes between the examples and the question, and its
+        tokens are taken out of the budget for the retrieved context. So are those of the static
+        documentation, which vanna appends to the documentation after it has been packed.
+        """
+        with tracer.span("get_sql_prompt") as span:
+            history = self._fit_history(chat_history or [], self.history_tokens)
+            reserve = kwargs.get('max_tokens') or self.prompt_budgeter.reserve
+            reserve += self._count_prompt_tokens(history, overhead=True)
+            if self.static_documentation:
+                reserve += self.str_to_approx_token_count(self.static_documentation)
+            question_sql_list, ddl_list, doc_list = self.prompt_budgeter.pack(
+                question=question,
+                initial_prompt=initial_prompt,
+                question_sql_list=question_sql_list,
+                ddl_list=ddl_list,
+                doc_list=doc_list,
+                reserve=reserve,
+            )
+            prompt = super().get_sql_prompt(
+                initial_prompt=initial_prompt,
+                question=question,
+                question_sql_list=question_sql_list,
+                ddl_list=ddl_list,
+                doc_list=doc_list,
+                **kwargs,
+            )
+            prompt[-1:-1] = history
+            span.set_attribute("prompt_tokens", self._count_prompt_tokens(prompt))
+            span.set_attribute("history_messages", len(history))
+            span.set_attribute("question_sql_pairs", len(question_sql_list))
+            span.set_attribute("ddl", len(ddl_list))
+            span.set_attribute("documentation", len(doc_list))
+            return prompt
+
+    def _count_prompt_tokens(self, prompt: list, overhead: bool = False) -> int:
+        # Each message's content was usually counted (and memoized) while the prompt was packed
+        return sum(self.str_to_approx_token_count(message['content']) + (MESSAGE_OVERHEAD if overhead else 0) for message in prompt)
+
+    def _fit_history(self, chat_history: list, max_tokens: int) -> list:
+        """
+        Returns the newest messages of chat_history that fit in max_tokens, oldest first. Messages are
+        dropped in question and answer pairs, so the window never starts with a dangling answer.
+        """
+        kept, tokens = [], 0
+        for message in reversed(chat_history):
+            tokens += self.str_to_approx_token_count(message['content']) + MESSAGE_OVERHEAD
+            if tokens > max_tokens:
+                break
+            kept.append(message)
+        kept.reverse()
+        while kept and kept[0]['role'] == 'assistant':
+            kept.pop(0)
+        return kept
+
+    def _add_to_prompt(self, initial_prompt: str, header: str, items: list[str], max_tokens: int | None) -> str:
+        # Keeps a running token total instead of re-tokenizing the growing prompt for every item
+        if len(items) == 0:
+            return initial_prompt
+
+        limit = self.prompt_budgeter.context_window - (self.prompt_budgeter.reserve if max_tokens is None else max_tokens)
+        initial_prompt += header
+        prompt_tokens = self.str_to_approx_token_count(initial_prompt)
+        for item in items:
+            item_tokens = self.str_to_approx_token_count(item)
+            if prompt_tokens + item_tokens < limit:
+                initial_prompt += f"{item}\n\n"
+                prompt_tokens += item_tokens
+        return initial_prompt
+
+    # max_tokens is the completion limit, as everywhere in this class (vanna passes self.max_tokens), so the
+    # system prompt may grow to context_window - max_tokens
+    def add_ddl_to_prompt(self, initial_prompt: str, ddl_list: list[str], max_tokens: int | None = None) -> str:
+        return self._add_to_prompt(initial_prompt, "\n===Tables \n", ddl_list, max_tokens)
+
+    def add_documentation_to_prompt(self, initial_prompt: str, documentation_list: list[str], max_tokens: int | None = None) -> str:
+        return self._add_to_prompt(initial_prompt, "\n===Additional Context \n\n", documentation_list, max_tokens)
+
+    def _build_payload(self, prompt, **kwargs) -> dict:
         # Define default values
         default_params = {
             'messages': prompt,
-            'model': self.model,
+            'model': self.router.model_for(self.model) if self.router is not None else self.model,
             'stop': self.stop,
             'stream': False,
             'temperature': self.temperature,
@@ -63,50 +312,283 @@ class SageMakerLLM(VannaBase):
                 default_params[key] = kwargs.pop(key)
 
         # Merge the remaining kwargs
-        payload = {**default_params, **kwargs}
-        
-        response = self.smr.invoke_endpoint(
-            EndpointName=self.endpoint_name,
-            ContentType='application/json',
-            Body=json.dumps(payload),
-            CustomAttributes='accept_eula=true'
+        return {**default_params, **kwargs}
+
+    def _is_cacheable(self, payload: dict, cache: bool) -> bool:
+        # Sampled responses are only reused when the caller explicitly opts in
+        return self.response_cache is not None and (cache or payload.get('temperature') == 0)
+
+    def submit_prompt(self, prompt, **kwargs) -> str:
+        cache = kwargs.pop('cache', False)
+        payload = self._build_payload(prompt, **kwargs)
+
+        with tracer.span("submit_prompt") as span:
+            cacheable = self._is_cacheable(payload, cache)
+            if cacheable:
+                cached = self.response_cache.get(payload)
+                if cached is not None:
+                    span.set_attribute("cached", True)
+                    return cached
+
+            body = json.dumps(payload)
+
+            def invoke(endpoint_name: str) -> tuple[str, int]:
+                response = self.smr.invoke_endpoint(
+                    EndpointName=endpoint_name,
+                    ContentType='application/json',
+                    Body=body,
+                    CustomAttributes='accept_eula=true'
+                )
+
+                raw = response['Body'].read()
+                data = json.loads(raw.decode('utf-8'))
+                content = data['choices'][0]['message']['content']
+                span.set_attribute("endpoint", endpoint_name)
+                return content, self._observe_llm_call(prompt, content, data.get('usage'), len(body), len(raw))
+
+            if self.router is None:
+                content, _ = invoke(self.endpoint_name)
+            else:
+                # Identical prompts already in flight share one invocation
+                content = self.router.submit(payload, self._count_prompt_tokens(prompt), invoke)
+
+            if cacheable:
+                self.response_cache.set(payload, content)
+
+            return content
+
+    def _observe_llm_call(self, prompt: list, content: str, usage: dict | None, request_bytes: int, response_bytes: int, span=None) -> int:
+        # OpenAI-compatible endpoints report usage; otherwise count with the tokenizer
+        usage = usage or {}
+        response_tokens = usage.get('completion_tokens') or self.str_to_approx_token_count(content)
+        observe_llm_call(
+            prompt_tokens=usage.get('prompt_tokens') or self._count_prompt_tokens(prompt),
+            response_tokens=response_tokens,
+            request_bytes=request_bytes,
+            response_bytes=response_bytes,
+            span=span,
         )
-        
-        data = json.loads(response['Body'].read().decode('utf-8'))
-        content = data['choices'][0]['message']['content']
-        
-        return content
+        return response_tokens
+
+    def submit_prompt_stream(self, prompt, **kwargs) -> Iterator[str]:
+        """
+        Streams the completion for a prompt token by token using invoke_endpoint_with_response_stream.
+
+        Args:
+            prompt (list): The messages to send to the endpoint.
+
+        Yields:
+            str: The content deltas in the order the endpoint produces them.
+        """
+        cache = kwargs.pop('cache', False)
+        payload = self._build_payload(prompt, **kwargs)
+        # The consumer runs between tokens, so this span is recorded once the stream ends
+        parent = tracer.current()
+        start = time.perf_counter()
+
+        # The cache is keyed on the non-streaming payload so both paths share entries
+        cacheable = self._is_cacheable(payload, cache)
+        if cacheable:
+            cached = self.response_cache.get(payload)
+            if cached is not None:
+                tracer.record("submit_prompt_stream", start, parent, cached=True)
+                yield cached
+                return
+        cache_key = dict(payload)
+        payload['stream'] = True
+
+        body = json.dumps(payload)
+
+        def invoke(endpoint_name: str):
+            return self.smr.invoke_endpoint_with_response_stream(
+                EndpointName=endpoint_name,
+                ContentType='application/json',
+                Body=body,
+                CustomAttributes='accept_eula=true'
+            )
+
+        # The tenant's concurrency slot is held until the stream ends; throttling is only retried before the first token
+        with self.router.admit(self._count_prompt_tokens(prompt)) if self.router is not None else nullcontext() as tenant:
+            response = self.router.failover(invoke) if self.router is not None else invoke(self.endpoint_name)
+
+            first_token = True
+            time_to_first_token = None
+            response_bytes = 0
+            content_parts = []
+            for line in self._iter_stream_lines(response['Body']):
+                response_bytes += len(line) + 1
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+
+                choices = json.loads(data).get('choices') or [{}]
+                content = (choices[0].get('delta') or {}).get('content')
+                if not content:
+                    continue
+
+                if first_token:
+                    first_token = False
+                    time_to_first_token = time.perf_counter() - start
+                    self.log(title="Time To First Token", message=f"{time_to_first_token:.3f}s")
+                content_parts.append(content)
+                yield content
+
+            content = ''.join(content_parts)
+            span = tracer.record("submit_prompt_stream", start, parent, time_to_first_token=time_to_first_token)
+            response_tokens = self._observe_llm_call(prompt, content, None, len(body), response_bytes, span=span)
+            if tenant is not None:
+                tenant.charge(response_tokens)
+
+        if cacheable:
+            self.response_cache.set(cache_key, content)
+
+    @staticmethod
+    def _iter_stream_lines(event_stream) -> Iterator[str]:
+        # PayloadPart boundaries are arbitrary, so buffer bytes until a full line is available
+        buffer = b''
+        for event in event_stream:
+            part = event.get('PayloadPart')
+            if part is None:
+                continue
+            buffer += part['Bytes']
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                line = line.strip()
+                if line:
+                    yield line.decode('utf-8')
+        if buffer.strip():
+            yield buffer.strip().decode('utf-8')
+
+    def connect_to_sqlite(
+            self,
+            url: str,
+            check_same_thread: bool = False,
+            pool_size: int = 4,
+            timeout: float = 30.0,
+            row_limit: int | None = 10000,
+            **kwargs,
+        ):
+        """
+        Connects to a SQLite database through a pooled, read-only SQLiteEngine.
+
+        Args:
+            url: A local path, or a URL to download the database from if it isn't already on disk.
+            pool_size: The number of queries that can run at once.
+            timeout: Seconds a query may run before it is cancelled.
+            row_limit: The row cap for SELECTs without a LIMIT.
+        """
+        path = url
+        if not os.path.exists(path):
+            path = os.path.basename(urlparse(url).path)
+            if not os.path.exists(path):
+                response = requests.get(url)
+                response.raise_for_status()
+                with open(path, "wb") as f:
+                    f.write(response.content)
+
+        self.sql_engine = SQLiteEngine(path, pool_size=pool_size, timeout=timeout, row_limit=row_limit)
+        self.dialect = "SQLite"
+        self.run_sql = self.sql_engine.run_sql
+        self.run_sql_chunks = self.sql_engine.run_sql_chunks
+        self.run_sql_is_set = True
+        self.sql_validator = SQLValidator(
+            self.sql_engine,
+            large_table_rows=self.large_table_rows,
+            strict=self.strict_sql_validation,
+        )
+
+    def train(self, question: str = None, sql: str = None, ddl: str = None, documentation: str = None, plan: TrainingPlan = None) -> str:
+        """
+        Trains as VannaBase.train does. DDL trained on is also given to the SQL validator, so tables it
+        defines aren't reported as unknown.
+        """
+        id = super().train(question=question, sql=sql, ddl=ddl, documentation=documentation, plan=plan)
+        # VannaBase.train only adds the DDL when neither documentation nor SQL was given
+        ddl_list = [ddl] if ddl and not (documentation or sql) else []
+        if plan:
+            ddl_list += [item.item_value for item in plan._plan if item.item_type == TrainingPlanItem.ITEM_TYPE_DDL]
+        self.learn_ddl(ddl_list)
+        return id
+
+    def learn_ddl(self, ddl_list: list[str]):
+        """
+        Adds the tables defined by training DDL to the SQL validator's schema, if one is connected.
+        """
+        if self.sql_validator is not None and ddl_list:
+            self.sql_validator.add_ddl(ddl_list)
+
+    def validate_sql(self, sql: str) -> ValidationResult:
+        """
+        Validates SQL before it is run. Without a connected SQLValidator only is_sql_valid is checked.
+        """
+        if self.sql_validator is None:
+            return ValidationResult() if self.is_sql_valid(sql) else ValidationResult(["Only SELECT statements can be run"])
+        return self.sql_validator.validate(sql)
 
     def get_context(self, question: str, **kwargs):
         """
         Retrieves the context needed for generating SQL.
+
+        The similar question/SQL pairs, related DDL and related documentation are fetched concurrently.
+        A source that fails or exceeds its entry in retrieval_timeouts is returned as an empty list
+        and named in "degraded".
     
         Args:
             question (str): The question to generate a SQL query for.
-    
+
         Returns:
-            Context: A Context object containing the retrieved context.
+            dict: The retrieved context, with per-source durations in seconds under "timings".
         """
         if self.config is not None:
             initial_prompt = self.config.get("initial_prompt", None)
         else:
             initial_prompt = None
     
-        question_sql_list = self.get_similar_question_sql(question, **kwargs)
-        ddl_list = self.get_related_ddl(question, **kwargs)
-        doc_list = self.get_related_documentation(question, **kwargs)
-    
-        return {
-            "initial_prompt": initial_prompt,
-            "question_sql_list": question_sql_list,
-            "ddl_list": ddl_list,
-            "doc_list": doc_list
+        sources = {
+            "question_sql_list": self.get_similar_question_sql,
+            "ddl_list": self.get_related_ddl,
+            "doc_list": self.get_related_documentation,
         }
+
+        def timed(name, lookup):
+            start = time.perf_counter()
+            with tracer.span(name) as span:
+                result = lookup(question, **kwargs)
+                span.set_attribute("results", len(result))
+            return result, time.perf_counter() - start
+
+        with tracer.span("get_context") as span:
+            # Lookup spans opened on the retrieval pool become children of this one
+            timed = tracer.wrap(timed)
+            start = time.perf_counter()
+            futures = {name: self.retrieval_pool.submit(timed, name, lookup) for name, lookup in sources.items()}
+
+            context = {"initial_prompt": initial_prompt, "timings": {}, "degraded": []}
+            for name, future in futures.items():
+                # Every source's timeout is measured from when the lookups were submitted
+                remaining = self.retrieval_timeouts[name] - (time.perf_counter() - start)
+                try:
+                    context[name], context["timings"][name] = future.result(timeout=max(remaining, 0))
+                except FutureTimeoutError:
+                    future.cancel()
+                    self.log(title="Context Timeout", message=f"{name} took longer than {self.retrieval_timeouts[name]}s, continuing without it")
+                    context[name], context["timings"][name] = [], time.perf_counter() - start
+                    context["degraded"].append(name)
+                except Exception as e:
+                    self.log(title="Context Error", message=f"{name} failed: {e}")
+                    context[name], context["timings"][name] = [], time.perf_counter() - start
+                    context["degraded"].append(name)
+
+            context["timings"]["total"] = time.perf_counter() - start
+            span.set_attribute("degraded", ",".join(context["degraded"]))
+        return context
  
     def generate_sql(
             self, 
             question: str, 
-            # chat_history: list = [], 
+            chat_history: list | None = None, 
             context: dict | None = None, 
             allow_llm_to_see_data: bool = False, 
             **kwargs
@@ -117,12 +599,23 @@ class SageMakerLLM(VannaBase):
         Args:
             question (str): The question to generate a SQL query for.
             context (Context): The context containing related information for SQL generation.
-            # chat_history (list): The chat history of the current conversation.
+            chat_history (list, optional): Earlier messages of the conversation, oldest first. The newest that fit in history_tokens are sent.
             allow_llm_to_see_data (bool, optional): Whether to allow the LLM to see data. Defaults to False.
 
         Returns:
             str: The generated SQL query.
         """
+        with tracer.span("generate_sql"):
+            return self._generate_sql(question, context, allow_llm_to_see_data, chat_history=chat_history, **kwargs)
+
+    def _generate_sql(self, question: str, context: dict | None, allow_llm_to_see_data: bool, chat_history: list | None = None, **kwargs) -> str:
+        # A follow-up's SQL depends on the conversation, not just the question
+        if self.question_cache is not None and not chat_history:
+            cached_sql = self.question_cache.get(question)
+            if cached_sql is not None:
+                self.log(title="Question Cache Hit", message=cached_sql)
+                return cached_sql
+
         if context is None:
             context = self.get_context(question, **kwargs)
             
@@ -132,49 +625,197 @@ class SageMakerLLM(VannaBase):
             question_sql_list=context.get("question_sql_list", []),
             ddl_list=context.get("ddl_list", []),
             doc_list=context.get("doc_list", []),
-            # chat_history=chat_history,
+            chat_history=chat_history,
             **kwargs,
         )
         
         self.log(title="SQL Prompt", message=prompt)
-        llm_response = self.submit_prompt(prompt, **kwargs)
+        # SQL for the same prompt is served from the response cache, if there is one, even though it is sampled
+        llm_response = self.submit_prompt(prompt, cache=True, **kwargs)
         self.log(title="LLM Response", message=llm_response)
 
         if 'intermediate_sql' in llm_response:
             if not allow_llm_to_see_data:
-                return "The LLM is not allowed to see the data in your database. Your question requires database introspection to generate the necessary SQL. Please set allow_llm_to_see_data=True to enable this."
+                return INTROSPECTION_NOT_ALLOWED
 
-            if allow_llm_to_see_data:
-                intermediate_sql = self.extract_sql(llm_response)
+            try:
+                prompt = self._intermediate_sql_prompt(question, context, self.extract_sql(llm_response), chat_history, **kwargs)
+                llm_response = self.submit_prompt(prompt, cache=True, **kwargs)
+                self.log(title="LLM Response", message=llm_response)
+            except Exception as e:
+                return f"Error running intermediate SQL: {e}"
 
-                try:
-                    self.log(title="Running Intermediate SQL", message=intermediate_sql)
-                    df = self.run_sql(intermediate_sql)
-
-                    prompt = self.get_sql_prompt(
-                        initial_prompt=context.get("initial_prompt"),
-                        question_sql_list=context.get("question_sql_list", []),
-                        ddl_list=context.get("ddl_list", []),
-                        doc_list=context.get("doc_list", []) + [f"The following is a pandas DataFrame with the results of the intermediate SQL query {intermediate_sql}: \n" + df.to_markdown()],
-                        **kwargs,
-                    )
-                    self.log(title="Final SQL Prompt", message=prompt) # type: ignore
-                    llm_response = self.submit_prompt(prompt, **kwargs)
-                    self.log(title="LLM Response", message=llm_response)
-                except Exception as e:
-                    return f"Error running intermediate SQL: {e}"
+        sql = self.extract_sql(llm_response)
+        if not chat_history:
+            self._remember_question_sql(question, sql)
+        return sql
+
+    def _intermediate_sql_prompt(self, question: str, context: dict, intermediate_sql: str, chat_history: list | None, **kwargs) -> list:
+        # Runs the SQL the LLM asked for to see the data, and rebuilds the SQL prompt with a summary of the result
+        self.log(title="Running Intermediate SQL", message=intermediate_sql)
+        with tracer.span("intermediate_sql"):
+            df = self.run_sql(intermediate_sql)
 
-        return self.extract_sql(llm_response)
+        prompt = self.get_sql_prompt(
+            initial_prompt=context.get("initial_prompt"),
+            question=question,
+            question_sql_list=context.get("question_sql_list", []),
+            ddl_list=context.get("ddl_list", []),
+            doc_list=context.get("doc_list", []) + [f"The following describes the pandas DataFrame with the results of the intermediate SQL query {intermediate_sql}: \n" + self.df_summarizer.summarize(df)],
+            chat_history=chat_history,
+            **kwargs,
+        )
+        self.log(title="Final SQL Prompt", message=prompt)
+        return prompt
+
+    def extract_sql(self, llm_response: str) -> str:
+        with tracer.span("extract_sql"):
+            return super().extract_sql(llm_response)
+
+    def is_sql_valid(self, sql: str) -> bool:
+        with tracer.span("is_sql_valid") as span:
+            valid = super().is_sql_valid(sql)
+            span.set_attribute("valid", valid)
+            return valid
+
+    def _remember_question_sql(self, question: str, sql: str):
+        if self.question_cache is not None and self.is_sql_valid(sql):
+            self.question_cache.set(question, sql)
     
-    def generate_followup_questions(self, question: str, sql: str, df: DataFrame | None=None, n_questions: int = 5, **kwargs) -> list:
+    def generate_sql_stream(
+            self,
+            question: str,
+            context: dict | None = None,
+            chat_history: list | None = None,
+            allow_llm_to_see_data: bool = False,
+            **kwargs,
+        ) -> Iterator[dict]:
+        """
+        Streams the LLM response for a question, then yields the extracted SQL.
+
+        Args:
+            question (str): The question to generate a SQL query for.
+            context (dict, optional): The context returned by get_context. Retrieved if not provided.
+            chat_history (list, optional): Earlier messages of the conversation, as for generate_sql.
+            allow_llm_to_see_data (bool, optional): Whether intermediate SQL may be run, as for generate_sql.
+
+        Yields:
+            dict: {"type": "token", "text": ...} for every streamed token, followed by a single
+            {"type": "sql", "text": ...} (or {"type": "text", ...} if the response could not be used).
+            If the LLM asks to see the data first, {"type": "intermediate_sql", "text": ...} is yielded
+            after its tokens, and the tokens of the response to the second prompt follow.
+        """
+        if self.question_cache is not None and not chat_history:
+            cached_sql = self.question_cache.get(question)
+            if cached_sql is not None:
+                yield {"type": "sql", "text": cached_sql}
+                return
+
+        if context is None:
+            context = self.get_context(question, **kwargs)
+
+        prompt = self.get_sql_prompt(
+            initial_prompt=context.get("initial_prompt"),
+            question=question,
+            question_sql_list=context.get("question_sql_list", []),
+            ddl_list=context.get("ddl_list", []),
+            doc_list=context.get("doc_list", []),
+            chat_history=chat_history,
+            **kwargs,
+        )
+        self.log(title="SQL Prompt", message=prompt)
+
+        llm_response = ""
+        # Shares response cache entries with generate_sql
+        for token in self.submit_prompt_stream(prompt, cache=True, **kwargs):
+            llm_response += token
+            yield {"type": "token", "text": token}
+        self.log(title="LLM Response", message=llm_response)
+
+        if 'intermediate_sql' in llm_response:
+            if not allow_llm_to_see_data:
+                yield {"type": "text", "text": INTROSPECTION_NOT_ALLOWED}
+                return
+
+            intermediate_sql = self.extract_sql(llm_response)
+            yield {"type": "intermediate_sql", "text": intermediate_sql}
+            try:
+                prompt = self._intermediate_sql_prompt(question, context, intermediate_sql, chat_history, **kwargs)
+            except Exception as e:
+                yield {"type": "text", "text": f"Error running intermediate SQL: {e}"}
+                return
+
+            llm_response = ""
+            for token in self.submit_prompt_stream(prompt, cache=True, **kwargs):
+                llm_response += token
+                yield {"type": "token", "text": token}
+            self.log(title="LLM Response", message=llm_response)
+
+        sql = self.extract_sql(llm_response)
+        if not chat_history:
+            self._remember_question_sql(question, sql)
+        yield {"type": "sql", "text": sql}
+
+    def generate_sql_fix(self, question: str, attempts: list[tuple[str, str]], context: dict, chat_history: list | None = None, **kwargs) -> str:
+        """
+        Asks for a corrected query after SQL failed, in a prompt much smaller than the SQL prompt: the DDL
+        from the question's context (tables the failed SQL uses first), the question and the failed attempts
+        with their errors. Examples and documentation are left out.
+
+        Args:
+            question (str): The question the SQL answers.
+            attempts (list): (sql, error) for every failed attempt so far, oldest first.
+            context (dict): The context returned by get_context for the question.
+            chat_history (list, optional): Earlier messages of the conversation, as for generate_sql.
+
+        Returns:
+            str: The corrected SQL.
+        """
+        with tracer.span("generate_sql_fix", attempt=len(attempts)):
+            failed_sql = "\n".join(sql for sql, _ in attempts)
+
+            def mentioned(ddl: str) -> bool:
+                match = DDL_NAME.search(ddl)
+                return match is not None and re.search(rf"\b{re.escape(match.group(1))}\b", failed_sql, re.IGNORECASE) is not None
+
+            ddl_list = context.get("ddl_list", [])
+            ddl_list = [ddl for ddl in ddl_list if mentioned(ddl)] + [ddl for ddl in ddl_list if not mentioned(ddl)]
+            system = (
+                f"You are a {self.dialect} expert. A query written for the question below failed. "
+                "Respond with the corrected SQL only, without explanations.\n"
+            )
+            tokens = self.str_to_approx_token_count(system)
+            tables = []
+            for ddl in ddl_list:
+                ddl_tokens = self.str_to_approx_token_count(ddl)
+                if tokens + ddl_tokens > self.repair_prompt_tokens:
+                    continue
+                tables.append(ddl)
+                tokens += ddl_tokens
+            if tables:
+                system += "\n===Tables \n" + "\n\n".join(tables)
+
+            message_log = [self.system_message(system)]
+            message_log += self._fit_history(chat_history or [], self.history_tokens)
+            message_log.append(self.user_message(question))
+            for sql, error in attempts:
+                message_log.append(self.assistant_message(sql))
+                message_log.append(self.user_message(f"That query failed with this error:\n{error}\n\nRewrite the SQL to fix the error."))
+
+            self.log(title="SQL Fix Prompt", message=message_log)
+            llm_response = self.submit_prompt(message_log, **kwargs)
+            self.log(title="LLM Response", message=llm_response)
+            return self.extract_sql(llm_response)
+
+    def _followup_questions_prompt(self, question: str, sql: str, df: DataFrame | None, n_questions: int) -> list:
         system_message = (
             f"You are a helpful data assistant. The user asked the question: '{question}'\n\n"
             f"The SQL query generated for this question was:\n{sql}\n\n"
         )
         if df is not None:
             system_message += (
-                f"The following is a pandas DataFrame with the results of the query:\n"
-                f"{df.to_markdown()}\n\n"
+                f"The following describes the pandas DataFrame with the results of the query:\n"
+                f"{self.df_summarizer.summarize(df)}\n\n"
             )
         else:
             system_message += "However, this SQL query has not been executed yet.\n\n"
@@ -195,13 +836,110 @@ class SageMakerLLM(VannaBase):
                 self._response_language()
             ),
         ]
+        return message_log
 
-        llm_response = self.submit_prompt(message_log, **kwargs)
-        numbers_removed = re.sub(r"^\d+\.\s*", "", llm_response, flags=re.MULTILINE)
+    @staticmethod
+    def _followup_question(line: str) -> str | None:
+        # A line of the numbered list, without its number, if it is a question
+        line = re.sub(r"^\d+\.\s*", "", line)
+        return line if line.endswith('?') else None
+
+    def generate_followup_questions(self, question: str, sql: str, df: DataFrame | None=None, n_questions: int = 5, **kwargs) -> list:
+        llm_response = self.submit_prompt(self._followup_questions_prompt(question, sql, df, n_questions), cache=True, **kwargs)
+        return [q for q in map(self._followup_question, llm_response.split("\n")) if q is not None]
+
+    def generate_followup_questions_stream(self, question: str, sql: str, df: DataFrame | None = None, n_questions: int = 5, **kwargs) -> Iterator[str]:
+        """
+        Streams the follow-up questions, yielding each one as soon as its line of the response is complete.
+        """
+        line = ""
+        for token in self.submit_prompt_stream(self._followup_questions_prompt(question, sql, df, n_questions), cache=True, **kwargs):
+            line += token
+            *complete, line = line.split("\n")
+            for followup in map(self._followup_question, complete):
+                if followup is not None:
+                    yield followup
+        followup = self._followup_question(line)
+        if followup is not None:
+            yield followup
+
+    def generate_summary(self, question: str, df: DataFrame, **kwargs) -> str:
+        message_log = [
+            self.system_message(
+                f"You are a helpful data assistant. The user asked the question: '{question}'\n\n"
+                f"The following describes the pandas DataFrame with the results of the query:\n"
+                f"{self.df_summarizer.summarize(df)}\n\n"
+            ),
+            self.user_message(
+                "Briefly summarize the data based on the question that was asked. Do not respond with any additional explanation beyond the summary." +
+                self._response_language()
+            ),
+        ]
 
-        return [q for q in  numbers_removed.split("\n") if q.endswith('?')]
+        return self.submit_prompt(message_log, **kwargs)
 
     def generate_chat_title(self, chat_history: list) -> str:
-        messages = chat_history + \
+        messages = self._fit_history(chat_history, self.history_tokens) + \
             [{"role": "user", "content": "Given the following chat history, generate a brief, descriptive title for the conversation."}]
-        return self.submit_prompt(prompt=messages, max_tokens=10, temperature=1, frequency_penatly=1)
\ No newline at end of file
+        return self.submit_prompt(prompt=messages, max_tokens=10, temperature=1, frequency_penalty=1)
+
+    def summarize_conversation(self, summary: str | None, turns: list[dict]) -> str:
+        """
+        Folds turns that have left the history window into the conversation's rolling summary.
+
+        Args:
+            summary: The summary so far, or None.
+            turns: The turns to add, oldest first, each with a "question" and "sql".
+
+        Returns:
+            str: The new summary.
+        """
+        transcript = "\n\n".join(f"Question: {turn['question']}\nSQL: {turn['sql'] or '(none)'}" for turn in turns)
+        message_log = [
+            self.system_message(
+                "You keep a running summary of a conversation in which a user asks questions about a database and is answered with SQL.\n\n"
+                f"The summary so far:\n{summary or '(empty)'}\n\n"
+                f"The next turns of the conversation:\n{transcript}"
+            ),
+            self.user_message(
+                "Update the summary with these turns. Keep the tables, columns, filters and definitions the user settled on, "
+                "since later questions may refer back to them. Respond with the summary only, in at most 150 words."
+            ),
+        ]
+        return self.submit_prompt(message_log, max_tokens=256)
+
+    def generate_sql_bundle(
+            self,
+            question: str,
+            n_questions: int = 5,
+            allow_llm_to_see_data: bool = False,
+            chat_history: list | None = None,
+            generate_sql: Callable[[], str] | None = None,
+            **kwargs,
+        ) -> dict:
+        """
+        Generates the SQL, follow-up questions and chat title for a question in one call.
+
+        The title only depends on the question, so it is generated while the SQL is. The follow-up
+        questions are generated as soon as the SQL is available. `generate_sql` replaces the plain
+        generate_sql call, e.g. to answer from a prefetch or to validate and repair the SQL first.
+
+        Returns:
+            dict: {"sql": str, "followup_questions": list, "title": str}
+        """
+        title = self.llm_pool.submit(tracer.wrap(self.generate_chat_title), (chat_history or []) + [self.user_message(question)])
+        if generate_sql is not None:
+            sql = generate_sql()
+        else:
+            sql = self.generate_sql(question=question, allow_llm_to_see_data=allow_llm_to_see_data, chat_history=chat_history, **kwargs)
+
+        followup_questions = []
+        if self.is_sql_valid(sql):
+            # Nothing else is left to overlap with, so this runs on the calling thread
+            followup_questions = self.generate_followup_questions(question=question, sql=sql, n_questions=n_questions)[:n_questions]
+
+        return {
+            "sql": sql,
+            "followup_questions": followup_questions,
+            "title": title.result(),
+        }
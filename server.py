@@ -1,8 +1,14 @@
-from doctest import debug
-from flask import Flask
+import argparse
+import atexit
 from vanna.vannadb import VannaDB_VectorStore
+from local_vector_store import LocalVectorStore
 from sagemaker_llm import SageMakerLLM
+from conversation_store import ConversationStore
 from custom_vanna_flask import CustomVannaFlaskApp
+from llm_cache import MemoryResponseCache, SQLiteResponseCache
+from llm_router import LLMRouter
+from result_cache import SQLiteCache
+from tracing import tracer
 from dotenv import load_dotenv
 import os
 
@@ -12,6 +18,19 @@ llama_config = {
     "endpoint_name": "xifin-chat-llama3-8b-instruct-endpoint",
     "aws_access_key_id": os.getenv("AWS_ACCESS_KEY_ID"),
     "aws_secret_access_key": os.getenv("AWS_SECRET_ACCESS_KEY"),
+    # Point at a local copy of the tokenizer to start without Hugging Face hub access
+    "tokenizer_path": os.getenv("TOKENIZER_PATH"),
+    # Serves repeated SQL and follow-up question prompts without calling the endpoint (other prompts
+    # are sampled afresh). LLM_CACHE=memory keeps it in this process; LLM_CACHE_PATH shares it between
+    # worker processes (and keeps it across restarts)
+    "response_cache": (
+        SQLiteResponseCache(os.getenv("LLM_CACHE_PATH"), max_entries=10000, ttl=3600) if os.getenv("LLM_CACHE_PATH")
+        else MemoryResponseCache(max_entries=1024, ttl=3600) if os.getenv("LLM_CACHE") == "memory"
+        else None
+    ),
+    # LLM_ROUTES is a JSON file of per-tenant endpoints, models and limits (see llm_router.py);
+    # without it every user's calls go to endpoint_name
+    "router": LLMRouter.from_file(os.getenv("LLM_ROUTES")) if os.getenv("LLM_ROUTES") else None,
 }
 
 class MyVanna(VannaDB_VectorStore, SageMakerLLM):
@@ -26,18 +45,91 @@ class MyVanna(VannaDB_VectorStore, SageMakerLLM):
         SageMakerLLM.__init__(self, config=llama_config)
 
 
-vn = MyVanna()
-vn.connect_to_sqlite("https://vanna.ai/Chinook.sqlite")
-
-CustomVannaFlaskApp(
-    vn=vn,
-    logo="https://www.xifin.com/wp-content/themes/xifin/images/xifin-logo--color-blue-gradient.svg",
-    title="XiQuery",
-    # subtitle="Turn natural language into SQL",
-    # allow_llm_to_see_data=True,
-    # allow_llm_to_run_sql=True,
-    index_html_path="index.html",
-    assets_folder="assets",
-    static_folder="static",
-    
-).run()
\ No newline at end of file
+class MyLocalVanna(LocalVectorStore, SageMakerLLM):
+    def __init__(self, config=None):
+        LocalVectorStore.__init__(self, config={"path": os.getenv("VECTOR_STORE_PATH", "vector_store")})
+        SageMakerLLM.__init__(self, config=llama_config)
+
+
+def create_vanna():
+    # VECTOR_STORE=local keeps training data on this machine instead of the hosted VannaDB
+    vn = MyLocalVanna() if os.getenv("VECTOR_STORE") == "local" else MyVanna()
+    vn.connect_to_sqlite("Chinook.sqlite", pool_size=4, timeout=30.0, row_limit=10000)
+    return vn
+
+
+def configure_tracing():
+    # SLOW_REQUEST_SECONDS keeps the span tree of slower requests, appended to SLOW_REQUEST_LOG if set
+    slow_request_seconds = os.getenv("SLOW_REQUEST_SECONDS")
+    tracer.configure(
+        otel=os.getenv("OTEL_TRACING") == "1",
+        slow_threshold=float(slow_request_seconds) if slow_request_seconds else None,
+        slow_log_path=os.getenv("SLOW_REQUEST_LOG"),
+    )
+
+
+def build_app(vn, cache=None, debug=True) -> CustomVannaFlaskApp:
+    return CustomVannaFlaskApp(
+        vn=vn,
+        cache=cache,
+        debug=debug,
+        logo="https://www.xifin.com/wp-content/themes/xifin/images/xifin-logo--color-blue-gradient.svg",
+        title="XiQuery",
+        # subtitle="Turn natural language into SQL",
+        # allow_llm_to_see_data=True,
+        # allow_llm_to_run_sql=True,
+        index_html_path="index.html",
+        assets_folder="assets",
+        static_folder="static",
+        # PREFETCH_QUESTIONS generates SQL for the first few suggested and follow-up questions before they are clicked
+        prefetch_questions=int(os.getenv("PREFETCH_QUESTIONS", "0")),
+        # CONVERSATION_STORE_PATH keeps conversations in a SQLite file, so follow-up questions are answered
+        # in context and chats can be reloaded after a restart
+        conversation_store=ConversationStore(os.getenv("CONVERSATION_STORE_PATH")) if os.getenv("CONVERSATION_STORE_PATH") else None,
+        # SQL_FIX_LOG collects queries the server fixed automatically, for promoting into training data
+        sql_fix_log_path=os.getenv("SQL_FIX_LOG"),
+    )
+
+
+def close_on_exit(vn, app: CustomVannaFlaskApp):
+    # Cancel queued LLM work and close database connections when the process exits
+    atexit.register(vn.close)
+    if app.prefetcher is not None:
+        atexit.register(app.prefetcher.close)
+    if app.conversations is not None:
+        # Writes still queued are flushed before the process exits
+        atexit.register(app.conversations.close)
+
+
+def create_app():
+    """
+    The WSGI app factory for production servers; each worker process calls it once.
+
+        gunicorn -c gunicorn.conf.py "server:create_app()"
+        uvicorn --factory --interface wsgi --workers 4 --port 8084 server:create_app
+
+    RESULT_CACHE_PATH (set by gunicorn.conf.py) puts cached results in a SQLite file every worker
+    shares, so follow-up requests can be served by any worker.
+    """
+    configure_tracing()
+    vn = create_vanna()
+    vn.warmup()
+    cache = SQLiteCache(os.getenv("RESULT_CACHE_PATH")) if os.getenv("RESULT_CACHE_PATH") else None
+    app = build_app(vn, cache=cache, debug=False)
+    close_on_exit(vn, app)
+    return app.flask_app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--warmup", action="store_true", help="Load the tokenizer and SageMaker client before accepting traffic")
+    args = parser.parse_args()
+
+    configure_tracing()
+    vn = create_vanna()
+    if args.warmup:
+        vn.warmup()
+
+    app = build_app(vn)
+    close_on_exit(vn, app)
+    app.run()
\ No newline at end of file
@@ -0,0 +1,180 @@
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import pandas as pd
+import sqlparse
+
+from metrics import registry
+from tracing import tracer
+
+LIMIT_PATTERN = re.compile(r"\blimit\s+\d+(\s*(,|\boffset\b)\s*\d+)?\s*$", re.IGNORECASE)
+
+
+def inject_limit(sql: str, row_limit: int) -> str:
+    """
+    Appends a LIMIT to a SELECT (or WITH ... SELECT) statement that doesn't already end with one.
+    Anything else is returned unchanged.
+    """
+    statement = sqlparse.format(sql, strip_comments=True).strip().rstrip(";").strip()
+    if not re.match(r"^\s*(select|with)\b", statement, re.IGNORECASE):
+        return sql
+    if LIMIT_PATTERN.search(statement):
+        return statement
+    return f"{statement}\nLIMIT {row_limit}"
+
+
+class SQLiteEngine:
+    """
+    Runs SQL against a local SQLite file through a pool of read-only connections.
+
+    Connections are opened with mode=ro and PRAGMA query_only, use memory-mapped I/O, and are interrupted
+    through a progress handler once a query runs past its timeout. SELECTs without a LIMIT are capped
+    at row_limit rows; the returned DataFrame has attrs["truncated"] set when the cap was hit.
+
+    Args:
+        path: The SQLite database file.
+        pool_size: The number of pooled connections, i.e. the number of queries that can run at once.
+        timeout: Seconds a query may run before it is interrupted.
+        row_limit: The row cap injected into SELECTs that have no LIMIT. None disables it.
+        stream_timeout: Seconds a streamed download may run. None disables it.
+        mmap_size: Bytes of the database file to memory-map.
+    """
+    def __init__(
+            self,
+            path: str,
+            pool_size: int = 4,
+            timeout: float = 30.0,
+            row_limit: int | None = 10000,
+            stream_timeout: float | None = 300.0,
+            mmap_size: int = 256 * 1024 * 1024,
+        ):
+        self.path = path
+        self.timeout = timeout
+        self.row_limit = row_limit
+        self.stream_timeout = stream_timeout
+        self.mmap_size = mmap_size
+        self.execution_time = registry.histogram("vanna_sql_execution_seconds", "Wall-clock time of SQL queries", database=path)
+        self.timeouts = 0
+        self.truncated = 0
+        self.closed = False
+        self._lock = threading.Lock()
+        self._pool: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a pooled connection for the duration of a with block.
+        """
+        try:
+            conn = self._pool.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No database connection became available within {self.timeout}s")
+        try:
+            yield conn
+        finally:
+            if self.closed:
+                conn.close()
+            else:
+                self._pool.put(conn)
+
+    @contextmanager
+    def _deadline(self, conn: sqlite3.Connection, timeout: float | None):
+        if timeout is None:
+            yield
+            return
+
+        deadline = time.monotonic() + timeout
+        conn.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if time.monotonic() > deadline:
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError(f"The query was cancelled after running for more than {timeout}s") from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def run_sql(self, sql: str) -> pd.DataFrame:
+        with tracer.span("run_sql") as span:
+            df = self._run_sql(sql)
+            span.set_attribute("rows", len(df))
+            span.set_attribute("truncated", df.attrs["truncated"])
+            return df
+
+    def _run_sql(self, sql: str) -> pd.DataFrame:
+        if self.row_limit is not None:
+            # Ask for one extra row to tell a capped result from one that is exactly row_limit long
+            sql = inject_limit(sql, self.row_limit + 1)
+
+        start = time.perf_counter()
+        try:
+            with self.connection() as conn, self._deadline(conn, self.timeout):
+                cursor = conn.execute(sql)
+                columns = [column[0] for column in cursor.description or []]
+                # fetchmany also caps statements whose own LIMIT is larger than row_limit
+                rows = cursor.fetchall() if self.row_limit is None else cursor.fetchmany(self.row_limit + 1)
+        finally:
+            self.execution_time.observe(time.perf_counter() - start)
+
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        df.attrs["truncated"] = self.row_limit is not None and len(df) > self.row_limit
+        if df.attrs["truncated"]:
+            with self._lock:
+                self.truncated += 1
+            df = df.iloc[:self.row_limit]
+        return df
+
+    def close(self):
+        """
+        Closes the pooled connections. Queries still holding a connection close it when they return it.
+        """
+        self.closed = True
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def run_sql_chunks(self, sql: str, chunk_size: int = 5000) -> Iterator[pd.DataFrame]:
+        """
+        Yields the full result in chunks, reading from the cursor as the consumer asks for more rows.
+        """
+        # A dedicated connection, so a long download doesn't hold one of the pooled ones
+        conn = self._connect()
+        try:
+            with self._deadline(conn, self.stream_timeout):
+                cursor = conn.execute(sql)
+                columns = [column[0] for column in cursor.description or []]
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield pd.DataFrame.from_records(rows, columns=columns)
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pool_available": self._pool.qsize(),
+                "timeouts": self.timeouts,
+                "truncated": self.truncated,
+                "execution_time": self.execution_time.stats(),
+                "p50": self.execution_time.quantile(0.5),
+                "p99": self.execution_time.quantile(0.99),
+            }
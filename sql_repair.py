@@ -0,0 +1,145 @@
+"""
+Server-side repair of SQL that failed validation or errored in the database.
+
+Each attempt is one small LLM call (SageMakerLLM.generate_sql_fix) made from the question's cached
+context, instead of a new trip through get_context and the full SQL prompt. Fixes that worked are
+kept, and appended to a file if one is given, so they can be reviewed and promoted into training data.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, TypeVar
+
+from metrics import registry
+from tracing import tracer
+
+T = TypeVar("T")
+
+
+class SQLRepairer:
+    """
+    Args:
+        vn: The Vanna instance that generates the fixes.
+        max_attempts: LLM calls per repair.
+        time_budget: Seconds a repair may take. No attempt is started after that, though one in flight finishes.
+        keep: Successful fixes kept in memory for review.
+        log_path: A file successful fixes are appended to, one JSON object per line.
+    """
+    def __init__(self, vn, max_attempts: int = 3, time_budget: float = 30.0, keep: int = 500, log_path: str | None = None):
+        self.vn = vn
+        self.max_attempts = max_attempts
+        self.time_budget = time_budget
+        self.log_path = log_path
+        self.fixes: deque[dict] = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._counts = {"repairs": 0, "repaired": 0, "failed": 0, "timed_out": 0, "attempts": 0, "promoted": 0}
+        self.duration = registry.histogram("vanna_sql_repair_seconds", "Time spent repairing failed SQL")
+
+    def repair(
+            self,
+            question: str,
+            sql: str,
+            error: str,
+            context: dict,
+            check: Callable[[str], T],
+            chat_history: list | None = None,
+            owner: str | None = None,
+        ) -> tuple[str, T] | None:
+        """
+        Asks for fixes until one passes `check` or the attempts or time run out.
+
+        Args:
+            question: The question the SQL answers.
+            sql: The SQL that failed.
+            error: Why it failed.
+            context: The question's context from get_context.
+            check: Raises if the fixed SQL still fails (e.g. by validating or running it), else returns a result.
+            chat_history: Earlier messages of the conversation, if any.
+            owner: The user whose question this is. A successful fix is only listed to them.
+
+        Returns:
+            tuple: The fixed SQL and what check returned for it, or None if no fix worked.
+        """
+        start = time.monotonic()
+        attempts = [(sql, error)]
+        with self._lock:
+            self._counts["repairs"] += 1
+
+        with tracer.span("repair_sql") as span:
+            try:
+                while len(attempts) <= self.max_attempts:
+                    if time.monotonic() - start > self.time_budget:
+                        with self._lock:
+                            self._counts["timed_out"] += 1
+                        break
+                    with self._lock:
+                        self._counts["attempts"] += 1
+                    fixed_sql = self.vn.generate_sql_fix(question, attempts, context, chat_history=chat_history)
+                    if not self.vn.is_sql_valid(fixed_sql):
+                        attempts.append((fixed_sql, "The response is not a SQL query."))
+                        continue
+                    try:
+                        result = check(fixed_sql)
+                    except Exception as e:
+                        attempts.append((fixed_sql, str(e)))
+                        continue
+
+                    self._record(question, attempts, fixed_sql, time.monotonic() - start, owner)
+                    span.set_attribute("attempts", len(attempts))
+                    return fixed_sql, result
+            finally:
+                self.duration.observe(time.monotonic() - start)
+
+            span.set_attribute("attempts", len(attempts) - 1)
+            span.set_attribute("error", attempts[-1][1])
+            with self._lock:
+                self._counts["failed"] += 1
+            return None
+
+    def get(self, fix_id: str, owner: str | None = None) -> dict | None:
+        """
+        Returns a fix by id, or None if there is none or, when owner is given, it belongs to someone else.
+        """
+        with self._lock:
+            return next((fix for fix in self.fixes if fix["id"] == fix_id and owner in (None, fix["owner"])), None)
+
+    def mark_promoted(self, fix_id: str):
+        with self._lock:
+            for fix in self.fixes:
+                if fix["id"] == fix_id and not fix["promoted"]:
+                    fix["promoted"] = True
+                    self._counts["promoted"] += 1
+
+    def list_fixes(self, owner: str | None = None) -> list[dict]:
+        """
+        Returns the successful fixes still in memory, newest first. Given an owner, only theirs are returned,
+        since fixes contain the questions and SQL of the user who asked.
+        """
+        with self._lock:
+            return [dict(fix) for fix in reversed(self.fixes) if owner in (None, fix["owner"])]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counts, "p50_seconds": self.duration.quantile(0.5), "p95_seconds": self.duration.quantile(0.95)}
+
+    def _record(self, question: str, attempts: list[tuple[str, str]], sql: str, seconds: float, owner: str | None):
+        fix = {
+            "id": str(uuid.uuid4()),
+            "owner": owner,
+            "question": question,
+            "failed_sql": attempts[0][0],
+            "error": attempts[0][1],
+            "sql": sql,
+            "attempts": len(attempts),
+            "seconds": round(seconds, 3),
+            "created": time.time(),
+            "promoted": False,
+        }
+        with self._lock:
+            self.fixes.append(fix)
+            self._counts["repaired"] += 1
+        if self.log_path is not None:
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(fix) + "\n")
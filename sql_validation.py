@@ -0,0 +1,191 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import sqlparse
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # Optional: without sqlglot only the statement type is checked
+    sqlglot = None
+
+from sql_engine import SQLiteEngine
+
+
+class ValidationResult:
+    """
+    The outcome of validating one SQL statement. Errors make the SQL invalid; warnings are reported only.
+    """
+    def __init__(self, errors: list[str] | None = None, warnings: list[str] | None = None):
+        self.errors = errors or []
+        self.warnings = warnings or []
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def to_dict(self) -> dict:
+        return {"valid": self.valid, "errors": self.errors, "warnings": self.warnings}
+
+
+class SQLValidator:
+    """
+    Checks generated SQL before it reaches the database: it must parse, be a single SELECT, and only
+    reference known tables and columns. With a SQLiteEngine, EXPLAIN QUERY PLAN is used to flag full
+    scans of large tables, and the schema is introspected from the database itself.
+
+    Parsed statements and results are cached per SQL hash, since the same SQL is validated by
+    generate_sql and again by run_sql.
+
+    Args:
+        engine: The SQLiteEngine the SQL will run on.
+        dialect: The sqlglot dialect to parse with.
+        large_table_rows: Tables with at least this many rows are "large" for full-scan checks.
+        strict: Treat warnings (full scans, cartesian joins) as errors.
+        max_entries: The number of validation results kept.
+    """
+    def __init__(
+            self,
+            engine: SQLiteEngine | None = None,
+            dialect: str = "sqlite",
+            large_table_rows: int = 100000,
+            strict: bool = False,
+            max_entries: int = 2048,
+        ):
+        self.engine = engine
+        self.dialect = dialect
+        self.large_table_rows = large_table_rows
+        self.strict = strict
+        self.max_entries = max_entries
+        self.schema: dict[str, set[str]] = {}
+        self.row_counts: dict[str, int] = {}
+        self._results: OrderedDict[str, ValidationResult] = OrderedDict()
+        self._lock = threading.Lock()
+        if engine is not None:
+            self.load_schema_from_engine()
+
+    def load_schema_from_engine(self):
+        """
+        Reads table and column names and row counts from the database.
+        """
+        with self.engine.connection() as conn:
+            tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")]
+            for table in tables:
+                columns = {row[1].lower() for row in conn.execute(f'PRAGMA table_info("{table}")')}
+                self.schema[table.lower()] = columns
+                self.row_counts[table.lower()] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        self._clear()
+
+    def add_ddl(self, ddl_list: list[str]):
+        """
+        Adds the tables defined by CREATE TABLE statements, e.g. the DDL used as training data.
+        """
+        if sqlglot is None:
+            return
+        for ddl in ddl_list:
+            try:
+                statements = sqlglot.parse(ddl, read=self.dialect)
+            except sqlglot.errors.ParseError:
+                continue
+            for create in statements:
+                if not isinstance(create, exp.Create) or not isinstance(create.this, exp.Schema):
+                    continue
+                table = create.this.this.name.lower()
+                columns = {column.name.lower() for column in create.this.expressions if isinstance(column, exp.ColumnDef)}
+                self.schema.setdefault(table, set()).update(columns)
+        self._clear()
+
+    def validate(self, sql: str) -> ValidationResult:
+        key = hashlib.sha1(sql.encode("utf-8")).hexdigest()
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+        result = self._validate(sql)
+        if self.strict:
+            result = ValidationResult(result.errors + result.warnings)
+
+        with self._lock:
+            self._results[key] = result
+            if len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return result
+
+    def _clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def _validate(self, sql: str) -> ValidationResult:
+        statements = [s for s in sqlparse.parse(sql) if s.get_type() != "UNKNOWN" or s.value.strip()]
+        if len(statements) != 1:
+            return ValidationResult([f"Expected a single SQL statement, found {len(statements)}"])
+        if statements[0].get_type() != "SELECT":
+            return ValidationResult(["Only SELECT statements can be run"])
+        if sqlglot is None:
+            return ValidationResult()
+
+        try:
+            tree = sqlglot.parse_one(sql, read=self.dialect)
+        except sqlglot.errors.ParseError as e:
+            return ValidationResult([f"The SQL could not be parsed: {e}"])
+
+        result = ValidationResult()
+        aliases = self._aliases(tree)
+        if self.schema:
+            self._check_references(tree, aliases, result)
+        self._check_joins(tree, result)
+        if self.engine is not None and result.valid:
+            self._check_plan(sql, aliases, result)
+        return result
+
+    def _aliases(self, tree) -> dict[str, str]:
+        # Maps each alias (or bare name) of a real table to the table name; CTEs are excluded
+        ctes = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+        return {
+            (table.alias or table.name).lower(): table.name.lower()
+            for table in tree.find_all(exp.Table)
+            if table.name.lower() not in ctes
+        }
+
+    def _check_references(self, tree, aliases: dict[str, str], result: ValidationResult):
+        for table in sorted(set(aliases.values())):
+            if table not in self.schema:
+                result.errors.append(f"Unknown table {table}")
+
+        # Unqualified names may refer to projection aliases or derived tables, so only qualified ones are checked
+        for column in tree.find_all(exp.Column):
+            table = aliases.get(column.table.lower())
+            if table in self.schema and column.name.lower() not in self.schema[table]:
+                result.errors.append(f"Unknown column {column.table}.{column.name}")
+
+    def _check_joins(self, tree, result: ValidationResult):
+        for select in tree.find_all(exp.Select):
+            where = select.args.get("where")
+            linked = {c.table.lower() for c in where.find_all(exp.Column)} if where is not None else set()
+            for join in select.args.get("joins") or []:
+                if join.args.get("on") is not None or join.args.get("using"):
+                    continue
+                table = join.this.alias_or_name
+                if table.lower() not in linked:
+                    result.warnings.append(f"Cartesian join with {table}: no join condition links it to the other tables")
+
+    def _check_plan(self, sql: str, aliases: dict[str, str], result: ValidationResult):
+        try:
+            with self.engine.connection() as conn:
+                plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        except Exception as e:
+            result.errors.append(f"The database rejected the SQL: {e}")
+            return
+
+        for row in plan:
+            detail = row[-1]
+            match = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+            if match is None or "INDEX" in detail:
+                continue
+            table = aliases.get(match.group(1).lower(), match.group(1).lower())
+            rows = self.row_counts.get(table, 0)
+            if rows >= self.large_table_rows:
+                result.warnings.append(f"Full scan of {table} ({rows} rows)")
@@ -0,0 +1,21 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from charts import _encode, build_figure, recommend_chart
+
+
+def test_encode_maps_non_finite_floats_to_none():
+    assert _encode([1.5, np.inf, -np.inf, np.nan]) == [1.5, None, None, None]
+
+
+def test_encode_maps_non_finite_objects_to_none():
+    assert _encode(pd.Series(["a", float("inf"), None], dtype=object)) == ["a", None, None]
+
+
+def test_figure_with_infinities_is_valid_json():
+    df = pd.DataFrame({"genre": ["Rock", "Jazz", "Metal"], "total": [10.0, np.inf, -np.inf]})
+    spec = recommend_chart(df, "Total by genre")
+    assert spec is not None
+    json.dumps(build_figure(df, spec, max_points=2000), allow_nan=False)
@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+from conversation_store import ConversationStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "conversations.sqlite")
+
+
+def test_writes_are_batched_and_reach_disk(path):
+    store = ConversationStore(path, flush_interval=0.2)
+    id = store.start("alice", title="Artists")
+    store.add_turn(id, question="How many artists?", sql="SELECT COUNT(*) FROM Artist", question_id="q1")
+    store.add_turn(id, question="And albums?", sql="SELECT COUNT(*) FROM Album", question_id="q2")
+    store.update_sql(id, "q2", "SELECT COUNT(*) AS albums FROM Album")
+    store.set_title(id, "Catalogue size")
+    store.flush()
+    # Everything queued within one flush interval went in one transaction
+    assert store.stats()["batches"] == 1
+    store.close()
+
+    reopened = ConversationStore(path)
+    conversation = reopened.get_conversation(id)
+    assert conversation["user_key"] == "alice"
+    assert conversation["title"] == "Catalogue size"
+    assert [turn["sql"] for turn in conversation["turns"]] == ["SELECT COUNT(*) FROM Artist", "SELECT COUNT(*) AS albums FROM Album"]
+    assert reopened.history(id)[-1] == {"role": "assistant", "content": "SELECT COUNT(*) AS albums FROM Album"}
+    reopened.close()
+
+
+def test_history_window_and_summary(path):
+    store = ConversationStore(path, keep_turns=2)
+    id = store.start("alice")
+    for i in range(3):
+        store.add_turn(id, question=f"q{i}", sql=f"SELECT {i}")
+    summary, overflow = store.turns_to_summarize(id)
+    assert summary is None
+    assert [turn["question"] for turn in overflow] == ["q0"]
+
+    store.set_summary(id, "Asked q0.", folded=1)
+    assert [message["content"] for message in store.history(id)] == [
+        "Summarize our conversation so far.", "Asked q0.", "q1", "SELECT 1", "q2", "SELECT 2",
+    ]
+    store.close()
+
+
+def test_bad_write_does_not_lose_the_rest_of_the_batch(path):
+    store = ConversationStore(path, flush_interval=0.2)
+    id = store.start("alice")
+    store._enqueue("INSERT INTO missing_table VALUES (?)", (1,))
+    store.add_turn(id, question="q", sql="SELECT 1")
+    store.flush()
+    assert store.stats()["failed_writes"] == 1
+    assert len(store.get_conversation(id)["turns"]) == 1
+    store.close()
+
+
+def test_writer_survives_a_failed_rollback(path):
+    store = ConversationStore(path, flush_interval=0.2)
+    id = store.start("alice")
+    # Ends the batch's transaction early, so its COMMIT fails and there is nothing to roll back
+    store._enqueue("COMMIT", ())
+    store.add_turn(id, question="q", sql="SELECT 1")
+    store.flush(timeout=5)
+    assert store._writer.is_alive()
+
+    store.add_turn(id, question="q2", sql="SELECT 2")
+    store.flush(timeout=5)
+    assert [turn["question"] for turn in store.get_conversation(id)["turns"]] == ["q", "q2"]
+    store.close()
+
+
+def test_another_process_sees_new_turns(path):
+    first = ConversationStore(path)
+    second = ConversationStore(path)
+    id = first.start("alice")
+    first.add_turn(id, question="q1", sql="SELECT 1")
+    first.flush()
+    assert second.owner(id) == "alice"
+    assert len(second.history(id)) == 2
+
+    first.add_turn(id, question="q2", sql="SELECT 2")
+    first.flush()
+    # owner() is the first call for a question, and reloads a conversation changed elsewhere
+    assert second.owner(id) == "alice"
+    assert len(second.history(id)) == 4
+    first.close()
+    second.close()
+
+
+def test_concurrent_turns_keep_their_sequence(path):
+    store = ConversationStore(path)
+    id = store.start("alice")
+    threads = [threading.Thread(target=store.add_turn, args=(id, f"q{i}", f"SELECT {i}")) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store.get_conversation(id)["turns"]) == 20
+    store.close()
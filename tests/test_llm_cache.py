@@ -0,0 +1,67 @@
+import pytest
+
+from benchmarks.fakes import BenchVanna, FakeSageMakerRuntime, canned_llama_response
+from llm_cache import MemoryResponseCache, QuestionCache
+from local_vector_store import HashingEmbedder
+
+
+@pytest.fixture
+def cache():
+    embedder = HashingEmbedder()
+    return QuestionCache(lambda question: embedder([question])[0], threshold=0.95, max_entries=4)
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("top 5 customers by total sales in 2021", "top 5 customers by total sales in 2022"),
+    ("top 5 customers by total sales in 2021", "top 10 customers by total sales in 2021"),
+    ("tracks in the 'Rock' genre", "tracks in the 'Jazz' genre"),
+    ("invoices over 1.99", "invoices over 0.99"),
+])
+def test_near_miss_with_different_literals_is_not_a_hit(cache, cached, asked):
+    cache.set(cached, "SELECT 5")
+    assert cache.get(asked) is None
+
+
+def test_normalized_exact_match_is_a_hit(cache):
+    cache.set("Top 5 customers by total sales in 2021?", "SELECT 5")
+    assert cache.get("top 5   customers by total sales in 2021") == "SELECT 5"
+
+
+def test_similar_question_with_same_literals_is_a_hit():
+    embedder = HashingEmbedder()
+    cache = QuestionCache(lambda question: embedder([question])[0], threshold=0.8)
+    cache.set("top 5 customers by total sales in 2021", "SELECT 5")
+    assert cache.get("the top 5 customers by total sales in 2021") == "SELECT 5"
+
+
+def test_set_dedupes_and_updates(cache):
+    cache.set("how many artists?", "SELECT 1")
+    cache.set("How many artists", "SELECT 2")
+    assert cache.stats()["entries"] == 1
+    assert cache.get("how many artists") == "SELECT 2"
+
+
+def test_oldest_question_is_evicted(cache):
+    for i in range(5):
+        cache.set(f"question number {i}", f"SELECT {i}")
+    assert cache.stats()["entries"] == 4
+    assert cache.get("question number 0") is None
+    assert cache.get("question number 4") == "SELECT 4"
+
+
+def test_sql_and_followup_prompts_are_served_from_the_response_cache():
+    client = FakeSageMakerRuntime(response=canned_llama_response, ttft=0, token_latency=0)
+    vn = BenchVanna(config={
+        "endpoint_name": "fake-endpoint", "client": client, "fake_tokenizer": True, "response_cache": MemoryResponseCache(),
+    })
+    vn.log = lambda message, title="Info": None
+    question = "How many artists are there?"
+
+    sql = vn.generate_sql(question)
+    assert vn.generate_sql(question) == sql
+    assert [event for event in vn.generate_sql_stream(question) if event["type"] == "sql"] == [{"type": "sql", "text": sql}]
+    assert client.invocations == 1
+
+    followups = vn.generate_followup_questions(question, sql)
+    assert list(vn.generate_followup_questions_stream(question, sql)) == followups
+    assert client.invocations == 2
@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+from llm_router import LLMRouter, RateLimitExceeded
+
+
+class Throttled(Exception):
+    # Shaped like the botocore ClientError SageMaker raises when an endpoint throttles
+    response = {"Error": {"Code": "ThrottlingException"}, "ResponseMetadata": {"HTTPStatusCode": 429}}
+
+
+def router(**kwargs) -> LLMRouter:
+    return LLMRouter({
+        "default": {"endpoints": ["a", "b"]},
+        "acme": {"endpoints": ["a", "b"], "tokens_per_minute": 600},
+    }, backoff=0.001, **kwargs)
+
+
+def test_identical_prompts_are_coalesced_within_a_tenant_only():
+    llm = router()
+    release = threading.Event()
+    calls = []
+
+    def invoke(endpoint):
+        calls.append(endpoint)
+        release.wait(5)
+        return "SELECT 1", 3
+
+    def submit(tenant, results):
+        with llm.using(tenant):
+            results.append(llm.submit({"messages": "same"}, 10, invoke))
+
+    results = []
+    threads = [threading.Thread(target=submit, args=(tenant, results)) for tenant in ("default", "default", "acme")]
+    for thread in threads:
+        thread.start()
+    # Both tenants' leaders are in flight; the second default call waits on the first
+    deadline = time.monotonic() + 5
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["SELECT 1"] * 3
+    assert len(calls) == 2
+    stats = llm.stats()
+    assert stats["default"]["coalesced"] == 1
+    assert stats["acme"]["coalesced"] == 0
+    assert stats["acme"]["calls"] == 1
+
+
+def test_throttled_calls_fail_over_to_the_next_endpoint():
+    llm = router()
+    calls = []
+
+    def invoke(endpoint):
+        calls.append(endpoint)
+        if endpoint == "a":
+            raise Throttled()
+        return "SELECT 1", 3
+
+    assert llm.submit({"messages": "q"}, 10, invoke) == "SELECT 1"
+    assert calls == ["a", "b"]
+    assert llm.stats()["default"]["failovers"] == 1
+
+
+def test_other_errors_are_not_retried():
+    llm = router()
+    calls = []
+
+    def invoke(endpoint):
+        calls.append(endpoint)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        llm.submit({"messages": "q"}, 10, invoke)
+    assert calls == ["a"]
+
+
+def test_throttling_on_every_attempt_is_raised():
+    llm = router(retries=3)
+    calls = []
+
+    def invoke(endpoint):
+        calls.append(endpoint)
+        raise Throttled()
+
+    with pytest.raises(Throttled):
+        llm.submit({"messages": "q"}, 10, invoke)
+    assert calls == ["a", "b", "a"]
+
+
+def test_token_bucket_rejects_calls_over_the_rate():
+    llm = router(wait_timeout=0.05)
+    with llm.using("acme"):
+        # The completion is charged after the call, emptying the bucket
+        assert llm.submit({"messages": "first"}, 100, lambda endpoint: ("SELECT 1", 500)) == "SELECT 1"
+        with pytest.raises(RateLimitExceeded):
+            llm.submit({"messages": "second"}, 100, lambda endpoint: ("SELECT 2", 10))
+    assert llm.stats()["acme"]["rejected"] == 1
+    # Other tenants have their own limits
+    assert llm.submit({"messages": "second"}, 100, lambda endpoint: ("SELECT 2", 10)) == "SELECT 2"
+
+
+def test_token_bucket_refills_over_time():
+    llm = router(wait_timeout=2)
+    tenant = llm.tenants["acme"]
+    tenant.tokens = 0
+    start = time.monotonic()
+    # 600 tokens per minute refill 10 per second
+    assert tenant.take_tokens(5, start + 2)
+    assert 0.3 < time.monotonic() - start < 2
+
+
+def test_runtime_client_leaves_retries_to_the_router():
+    pytest.importorskip("boto3")
+    from sagemaker_llm import get_runtime_client
+
+    retrying = get_runtime_client("us-west-2", "fake", "fake")
+    single = get_runtime_client("us-west-2", "fake", "fake", retries=0)
+    assert retrying.meta.config.retries["total_max_attempts"] == 4
+    assert single.meta.config.retries["total_max_attempts"] == 1
+
+
+def test_llm_with_a_router_gets_a_client_without_retries():
+    pytest.importorskip("boto3")
+    from benchmarks.fakes import BenchVanna
+
+    config = {"endpoint_name": "a", "fake_tokenizer": True, "aws_access_key_id": "fake", "aws_secret_access_key": "fake"}
+    assert BenchVanna(config={**config, "router": router()}).smr.meta.config.retries["total_max_attempts"] == 1
+    assert BenchVanna(config=config).smr.meta.config.retries["total_max_attempts"] == 4
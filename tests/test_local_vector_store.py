@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+from local_vector_store import Collection, HashingEmbedder
+
+embed = HashingEmbedder(dim=64)
+
+
+def test_batch_keeps_last_occurrence_of_an_id():
+    collection = Collection("ddl", 64)
+    collection.add(["a", "b", "a"], ["first", "b", "last"], embed(["first", "b", "last"]))
+    assert sorted(collection.items()) == [("a", "last"), ("b", "b")]
+
+
+def test_journal_is_replayed_and_folded_in_by_save(tmp_path):
+    path = str(tmp_path)
+    collection = Collection("sql", 64, path=path)
+    collection.add(["a", "b"], ["a", "b"], embed(["a", "b"]), journal=True)
+    collection.remove(["a"], journal=True)
+    assert os.listdir(path) == ["sql.journal"]
+
+    reloaded = Collection("sql", 64, path=path)
+    assert reloaded.items() == [("b", "b")]
+
+    reloaded.add(["c"], ["c"], embed(["c"]), journal=True)
+    reloaded.save()
+    assert not os.path.exists(os.path.join(path, "sql.journal"))
+    assert sorted(Collection("sql", 64, path=path).items()) == [("b", "b"), ("c", "c")]
+
+
+def test_journal_compacts_once_it_outgrows_the_matrix(tmp_path):
+    collection = Collection("doc", 64, path=str(tmp_path), compact_rows=4)
+    for i in range(5):
+        collection.add([str(i)], [str(i)], embed([str(i)]), journal=True)
+    assert collection.journal_rows == 0
+    assert len(collection.base) == 5
+    assert np.isclose(collection.search(embed(["3"]), 1)[0][0][1], 1.0)
+
+
+def test_search_documents_after_compaction(tmp_path):
+    collection = Collection("doc", 64, path=str(tmp_path), compact_rows=2)
+    collection.add(["a", "b"], ["a", "b"], embed(["a", "b"]), journal=True)
+    collection.remove(["a"], journal=True)
+    # Compaction renumbers "b" from row 1 to row 0
+    collection.add(["c"], ["c"], embed(["c"]), journal=True)
+    assert collection.search_documents(embed(["b"]), 1) == ["b"]
+    assert collection.search_documents(embed(["c"]), 1) == ["c"]
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from vanna.flask import MemoryCache
+
+from prefetch import Prefetcher
+
+
+def make(**kwargs):
+    calls = []
+
+    def generate_sql(question, user_key):
+        calls.append((question, user_key))
+        return f"SELECT '{question}'"
+
+    return Prefetcher(MemoryCache(), generate_sql=generate_sql, **kwargs), calls
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_finished_prefetch_is_claimed():
+    prefetcher, calls = make()
+    prefetcher.schedule("u", ["How many artists?"])
+    assert wait_for(lambda: prefetcher.stats()["completed"] == 1)
+
+    id = prefetcher.claim("u", "How many artists?")
+    assert prefetcher.cache.get(id=id, field="sql") == "SELECT 'How many artists?'"
+    assert prefetcher.cache.get(id=id, field="question") == "How many artists?"
+    assert calls == [("How many artists?", "u")]
+
+
+def test_claim_of_a_prefetch_that_has_not_started_returns_at_once():
+    prefetcher, calls = make(workers=1)
+    blocker = threading.Event()
+    prefetcher.pool.submit(blocker.wait)
+    prefetcher.schedule("u", ["How many artists?"])
+
+    start = time.monotonic()
+    assert prefetcher.claim("u", "How many artists?") is None
+    assert time.monotonic() - start < 0.5
+    blocker.set()
+    prefetcher.pool.shutdown(wait=True)
+    assert calls == []
+    assert prefetcher.stats()["cancelled"] == 1
+
+
+def test_claim_skips_the_idle_wait():
+    # The click is an active request itself, so the server never looks idle while the claim waits
+    prefetcher, calls = make(is_idle=lambda: False, idle_timeout=30)
+    prefetcher.schedule("u", ["How many artists?"])
+    assert wait_for(lambda: prefetcher.stats()["running"] == 1)
+
+    start = time.monotonic()
+    id = prefetcher.claim("u", "How many artists?")
+    assert id is not None
+    assert time.monotonic() - start < 2
+    assert calls == [("How many artists?", "u")]
+
+
+def test_busy_server_drops_unclaimed_prefetches():
+    prefetcher, calls = make(is_idle=lambda: False, idle_timeout=0.1)
+    prefetcher.schedule("u", ["How many artists?"])
+    assert wait_for(lambda: prefetcher.stats()["cancelled"] == 1)
+    assert calls == []
+
+
+def test_scheduling_cancels_the_users_earlier_prefetches():
+    prefetcher, calls = make(is_idle=lambda: False, idle_timeout=30)
+    prefetcher.schedule("u", ["First?"])
+    prefetcher.schedule("u", ["Second?"])
+    assert wait_for(lambda: prefetcher.stats()["cancelled"] == 1)
+    prefetcher.cancel("u")
+    assert wait_for(lambda: prefetcher.stats()["cancelled"] == 2)
+    assert calls == []
+
+
+def test_budget_limits_prefetches_per_user():
+    prefetcher, _ = make(budget=2, top_n=5)
+    prefetcher.schedule("u", ["A?", "B?", "C?"])
+    stats = prefetcher.stats()
+    assert stats["scheduled"] == 2
+    assert stats["over_budget"] == 1
+
+
+def test_claim_finds_prefetches_of_another_worker_through_the_cache():
+    prefetcher, _ = make()
+    prefetcher.schedule("u", ["How many artists?"])
+    assert wait_for(lambda: prefetcher.stats()["completed"] == 1)
+
+    other, _ = make()
+    other.cache = prefetcher.cache
+    assert other.claim("u", "How many artists?") is not None
+    assert other.claim("u", "How many artists?") is None
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from result_cache import BoundedCache, sizeof
+
+
+def test_get_all_leaves_recency_and_counters_alone():
+    cache = BoundedCache(spill_bytes=None)
+    cache.set(id="old", field="question", value="first")
+    cache.set(id="new", field="question", value="second")
+
+    assert cache.get_all(["question"]) == [{"id": "old", "question": "first"}, {"id": "new", "question": "second"}]
+    assert cache.stats()["hits"] == 0
+    assert cache.stats()["misses"] == 0
+
+    # "old" is still the least recently used entry, so it is evicted first
+    cache.max_bytes = cache.stats()["bytes_held"] - 1
+    cache.set(id="new", field="question", value="second")
+    assert cache.get(id="old", field="question") is None
+    assert cache.get(id="new", field="question") == "second"
+
+
+def test_reloaded_frame_counts_against_the_budget(tmp_path):
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame({"n": range(10000)})
+    cache = BoundedCache(spill_bytes=1, spill_dir=str(tmp_path))
+    cache.set(id="a", field="df", value=df)
+    assert cache.stats()["bytes_held"] == 0
+
+    assert cache.get(id="a", field="df").equals(df)
+    assert cache.stats()["bytes_held"] == sizeof(df)
+
+    cache.delete("a")
+    assert cache.stats()["bytes_held"] == 0
+
+
+def test_reloaded_frame_evicts_older_entries(tmp_path):
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame({"n": range(10000)})
+    cache = BoundedCache(max_bytes=sizeof(df), spill_bytes=sizeof(df) // 2, spill_dir=str(tmp_path))
+    cache.set(id="a", field="df", value=df)
+    cache.set(id="b", field="sql", value="SELECT 1")
+
+    cache.get(id="a", field="df")
+    assert cache.get(id="b", field="sql") is None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,138 @@
+import json
+import os
+
+import flask
+import pandas as pd
+import pytest
+
+from benchmarks.fakes import BenchVanna, FakeSageMakerRuntime
+from custom_vanna_flask import CustomVannaFlaskApp
+
+pytest.importorskip("sqlglot")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_app(respond, **kwargs):
+    client = FakeSageMakerRuntime(response=respond, ttft=0, token_latency=0)
+    vn = BenchVanna(config={"endpoint_name": "fake-endpoint", "client": client, "fake_tokenizer": True})
+    vn.log = lambda message, title="Info": None
+    vn.connect_to_sqlite(os.path.join(ROOT, "Chinook.sqlite"))
+    app = CustomVannaFlaskApp(vn=vn, debug=False, **kwargs)
+    return app, app.flask_app.test_client()
+
+
+def respond_with_repair(payload):
+    # Generation references a column Artist doesn't have; the repair prompt gets it right
+    messages = payload["messages"]
+    if "failed" in messages[0]["content"]:
+        return "SELECT Name FROM Artist"
+    if "follow-up" in messages[-1]["content"]:
+        return "1. How many artists are there?"
+    if "title" in messages[-1]["content"]:
+        return "Artist names"
+    return "SELECT Nme FROM Artist"
+
+
+def stream_events(test_client, question):
+    body = test_client.get("/api/v0/generate_sql_stream", query_string={"question": question}).get_data(as_text=True)
+    return [json.loads(line[len("data: "):]) for line in body.split("\n\n") if line.startswith("data: ")]
+
+
+def test_stream_sends_tokens_then_sql():
+    app, test_client = make_app(lambda payload: "SELECT Name FROM Artist LIMIT 5")
+    events = stream_events(test_client, "Artist names")
+
+    assert {event["type"] for event in events[:-1]} == {"token"}
+    assert "".join(event["text"] for event in events[:-1]).strip() == "SELECT Name FROM Artist LIMIT 5"
+    final = events[-1]
+    assert final["type"] == "sql"
+    assert final["warnings"] == []
+    assert app.cache.get(id=final["id"], field="sql") == final["text"]
+
+
+def test_stream_repairs_invalid_sql_before_caching():
+    app, test_client = make_app(respond_with_repair)
+    final = stream_events(test_client, "Artist names")[-1]
+
+    assert final["type"] == "sql"
+    assert final["text"] == "SELECT Name FROM Artist"
+    assert app.cache.get(id=final["id"], field="sql") == "SELECT Name FROM Artist"
+
+
+def test_stream_sends_text_that_is_not_sql():
+    app, test_client = make_app(lambda payload: "I can only answer questions about the music store.")
+    final = stream_events(test_client, "What's the weather?")[-1]
+
+    assert final["type"] == "text"
+    assert "warnings" not in final
+
+
+def test_bundle_repairs_invalid_sql():
+    app, test_client = make_app(respond_with_repair)
+    bundle = test_client.get("/api/v0/generate_sql_bundle", query_string={"question": "Artist names"}).get_json()
+
+    assert bundle["type"] == "sql_bundle"
+    assert bundle["sql"]["type"] == "sql"
+    assert bundle["sql"]["text"] == "SELECT Name FROM Artist"
+    assert bundle["sql"]["warnings"] == []
+    assert app.cache.get(id=bundle["id"], field="sql") == "SELECT Name FROM Artist"
+
+
+def test_generate_sql_repairs_invalid_sql():
+    app, test_client = make_app(respond_with_repair)
+    response = test_client.get("/api/v0/generate_sql", query_string={"question": "Artist names"}).get_json()
+
+    assert response["type"] == "sql"
+    assert response["text"] == "SELECT Name FROM Artist"
+    assert response["warnings"] == []
+
+
+@pytest.mark.parametrize("route", ["generate_sql", "generate_sql_stream", "generate_sql_bundle"])
+def test_routes_answer_from_prefetch(route):
+    generated = []
+
+    def respond(payload):
+        last = payload["messages"][-1]["content"]
+        if "follow-up" in last:
+            return "1. How many artists are there?"
+        if "title" in last:
+            return "Artist names"
+        generated.append(last)
+        return "SELECT Name FROM Artist"
+
+    app, test_client = make_app(respond, prefetch_questions=1)
+    # The test client's requests come from 127.0.0.1, which is the anonymous user's key
+    app.prefetcher.schedule("127.0.0.1", ["Artist names"])
+    prefetch = app.prefetcher._pending["127.0.0.1"]["Artist names"]
+    prefetch.future.result(timeout=10)
+    assert len(generated) == 1
+
+    if route == "generate_sql_stream":
+        answer = stream_events(test_client, "Artist names")[-1]
+    else:
+        response = test_client.get(f"/api/v0/{route}", query_string={"question": "Artist names"}).get_json()
+        answer = response["sql"] if route == "generate_sql_bundle" else response
+
+    assert answer["type"] == "sql"
+    assert answer["id"] == prefetch.id
+    assert len(generated) == 1
+    assert app.prefetcher.stats()["hits"] == 1
+
+
+def test_df_page_sorts_mixed_type_columns_as_text():
+    app, test_client = make_app(lambda payload: "SELECT 1")
+    app.cache.set(id="q", field="df", value=pd.DataFrame({"value": [10, "b", 2, "a"]}))
+    response = test_client.get("/api/v0/df_page", query_string={"id": "q", "sort": "value"})
+
+    assert response.status_code == 200
+    assert json.loads(response.get_json()["df"]) == [{"value": 10}, {"value": 2}, {"value": "a"}, {"value": "b"}]
+
+
+def test_prefetch_candidates_ignores_non_object_json():
+    app, test_client = make_app(lambda payload: "SELECT 1", prefetch_questions=1)
+    app.flask_app.add_url_rule("/api/v0/list", "list", lambda: flask.jsonify(["How many artists are there?"]))
+
+    response = test_client.get("/api/v0/list")
+    assert response.status_code == 200
+    assert app.prefetcher.stats()["scheduled"] == 0
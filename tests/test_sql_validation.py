@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from benchmarks.fakes import CHINOOK_QUESTIONS, BenchVanna
+from sql_engine import SQLiteEngine
+from sql_validation import SQLValidator
+
+pytest.importorskip("sqlglot")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def validator():
+    return SQLValidator(SQLiteEngine(os.path.join(ROOT, "Chinook.sqlite"), pool_size=1), large_table_rows=1000)
+
+
+def test_dummy_sql_is_rejected():
+    # A truncated fragment mixing SQL Server hints with standard SQL, several statements long
+    with open(os.path.join(ROOT, "dummy.sql")) as f:
+        result = SQLValidator().validate(f.read())
+    assert not result.valid
+
+
+def test_valid_chinook_query(validator):
+    result = validator.validate(
+        "SELECT ar.Name, COUNT(*) AS albums FROM Artist ar JOIN Album al ON al.ArtistId = ar.ArtistId GROUP BY ar.Name"
+    )
+    assert result.valid
+    assert result.warnings == []
+
+
+def test_unknown_table(validator):
+    result = validator.validate("SELECT * FROM Customers")
+    assert "Unknown table customers" in result.errors
+
+
+def test_unknown_column(validator):
+    result = validator.validate("SELECT a.Title, a.Year FROM Album a")
+    assert result.errors == ["Unknown column a.Year"]
+
+
+def test_cartesian_join_warning(validator):
+    result = validator.validate("SELECT ar.Name, al.Title FROM Artist ar, Album al LIMIT 5")
+    assert result.valid
+    assert any("Cartesian join with al" in warning for warning in result.warnings)
+
+
+def test_joined_through_where_is_not_cartesian(validator):
+    result = validator.validate("SELECT ar.Name, al.Title FROM Artist ar, Album al WHERE al.ArtistId = ar.ArtistId")
+    assert not any("Cartesian" in warning for warning in result.warnings)
+
+
+def test_full_scan_warning(validator):
+    result = validator.validate("SELECT * FROM Track WHERE Composer LIKE '%Page%'")
+    assert result.valid
+    assert any(warning.startswith("Full scan of track") for warning in result.warnings)
+
+
+def test_strict_turns_warnings_into_errors():
+    strict = SQLValidator(SQLiteEngine(os.path.join(ROOT, "Chinook.sqlite"), pool_size=1), large_table_rows=1000, strict=True)
+    assert not strict.validate("SELECT * FROM Track WHERE Composer LIKE '%Page%'").valid
+
+
+def test_only_select_is_allowed(validator):
+    assert validator.validate("DELETE FROM Artist").errors == ["Only SELECT statements can be run"]
+
+
+@pytest.mark.parametrize("sql", CHINOOK_QUESTIONS.values())
+def test_corpus_queries_are_valid(validator, sql):
+    assert validator.validate(sql).errors == []
+
+
+def test_ddl_defines_tables_and_columns():
+    validator = SQLValidator()
+    validator.add_ddl(["CREATE TABLE Staging (Id INTEGER PRIMARY KEY, Amount REAL)"])
+    assert validator.validate("SELECT s.Amount FROM Staging s").valid
+    assert validator.validate("SELECT s.Total FROM Staging s").errors == ["Unknown column s.Total"]
+    assert "Unknown table invoices" in validator.validate("SELECT * FROM Invoices").errors
+
+
+def test_trained_ddl_reaches_the_validator():
+    vn = BenchVanna(config={"endpoint_name": "fake-endpoint", "fake_tokenizer": True})
+    vn.connect_to_sqlite(os.path.join(ROOT, "Chinook.sqlite"), pool_size=1)
+    vn.train(ddl="CREATE TABLE Staging (Id INTEGER PRIMARY KEY, Amount REAL)")
+    assert vn.sql_validator.schema["staging"] == {"id", "amount"}
+    # Tables from the database itself are still known
+    assert "artist" in vn.sql_validator.schema
@@ -0,0 +1,81 @@
+import pytest
+
+import tracing
+from tracing import Tracer
+
+
+class RecordingSpan:
+    # Stands in for the context manager start_as_current_span returns
+    def __init__(self, exits):
+        self.exits = exits
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.exits.append(exc_info)
+
+    def set_attribute(self, key, value):
+        pass
+
+
+class RecordingTrace:
+    def __init__(self):
+        self.exits = []
+
+    def get_tracer(self, name):
+        return self
+
+    def start_as_current_span(self, name):
+        return RecordingSpan(self.exits)
+
+
+@pytest.fixture
+def otel(monkeypatch):
+    trace = RecordingTrace()
+    monkeypatch.setattr(tracing, "otel_trace", trace)
+    return trace
+
+
+def test_otel_span_is_closed_with_the_exception(otel):
+    tracer = Tracer()
+    tracer.configure(otel=True)
+    with pytest.raises(ValueError):
+        with tracer.span("generate_sql"):
+            raise ValueError("bad")
+
+    [(exc_type, exc, traceback)] = otel.exits
+    assert exc_type is ValueError
+    assert str(exc) == "bad"
+    assert traceback is not None
+
+
+def test_otel_span_is_closed_cleanly_without_one(otel):
+    tracer = Tracer()
+    tracer.configure(otel=True)
+    with tracer.span("outer") as outer:
+        with tracer.span("inner"):
+            pass
+    assert otel.exits == [(None, None, None), (None, None, None)]
+    assert [child.name for child in outer.children] == ["inner"]
+
+
+def test_error_is_recorded_on_the_span():
+    tracer = Tracer()
+    with pytest.raises(KeyError):
+        with tracer.span("lookup") as span:
+            raise KeyError("id")
+    assert span.attributes["error"] == "KeyError('id')"
+    assert span.duration is not None
+
+
+def test_otel_span_opened_while_handling_an_error_is_not_failed(otel):
+    # e.g. a fallback run from an except block; the error being handled isn't the span's
+    tracer = Tracer()
+    tracer.configure(otel=True)
+    try:
+        raise ValueError("handled")
+    except ValueError:
+        with tracer.span("fallback"):
+            pass
+    assert otel.exits == [(None, None, None)]
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from local_vector_store import HashingEmbedder, LocalVectorStore
+from training_ingest import Ingester, TrainingItem
+
+
+class Store(LocalVectorStore):
+    # LocalVectorStore leaves the LLM methods to a mixin; ingestion without question generation needs none
+    def system_message(self, message):
+        return message
+
+    def user_message(self, message):
+        return message
+
+    def assistant_message(self, message):
+        return message
+
+    def submit_prompt(self, prompt, **kwargs):
+        raise NotImplementedError
+
+
+def test_training_during_an_ingest_is_journaled(tmp_path):
+    path = str(tmp_path)
+    vn = Store(config={"path": path, "embedding_function": HashingEmbedder(dim=64)})
+
+    def train_meanwhile(stats):
+        # A /train request served while the job runs
+        assert vn.autosave
+        vn.add_documentation("Written through the UI")
+
+    items = [TrainingItem("ddl", f"CREATE TABLE t{i} (id INTEGER)") for i in range(3)]
+    Ingester(vn, chunk_size=2, save_every=100, progress=train_meanwhile).ingest(items)
+
+    assert vn.autosave
+    assert os.path.exists(os.path.join(path, "documentation.journal"))
+    assert not os.path.exists(os.path.join(path, "ddl.journal"))
+    reloaded = Store(config={"path": path, "embedding_function": HashingEmbedder(dim=64)})
+    assert len(reloaded.collections["ddl"].items()) == 3
+    assert [document for _, document in reloaded.collections["documentation"].items()] == ["Written through the UI"]
+
+
+def test_failed_chunk_is_retried_then_raised(tmp_path):
+    vn = Store(config={"path": str(tmp_path), "embedding_function": HashingEmbedder(dim=64)})
+    calls = []
+
+    def fail(ddl_list, journal=None):
+        calls.append(ddl_list)
+        raise OSError("disk full")
+
+    vn.add_ddl_batch = fail
+    # Two attempts back off once, for a second
+    ingester = Ingester(vn, retries=2, progress=lambda stats: None)
+    with pytest.raises(OSError):
+        ingester.ingest([TrainingItem("ddl", "CREATE TABLE t (id INTEGER)")])
+    assert len(calls) == 2
@@ -0,0 +1,186 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable
+
+from metrics import registry
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # Optional: spans are only recorded locally without it
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("vanna_span", default=None)
+
+
+class Span:
+    """
+    One timed step of a request, with attributes such as token counts and the steps it was made of.
+    """
+    def __init__(self, name: str, parent: "Span | None" = None, attributes: dict | None = None, start: float | None = None):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.children: list[Span] = []
+        self.start = time.perf_counter() if start is None else start
+        self.started_at = time.time() - (time.perf_counter() - self.start)
+        self.duration: float | None = None
+        self._otel = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+        if self._otel is not None and isinstance(value, (str, bool, int, float)):
+            self._otel.set_attribute(key, value)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+class Tracer:
+    """
+    Records spans for the request pipeline. Every finished span is observed in the
+    vanna_span_duration_seconds histogram on /metrics. Optionally, spans are also sent to
+    OpenTelemetry, and requests slower than a threshold are kept (and appended to a JSONL file)
+    with their full span tree. Both are off until configure() turns them on.
+    """
+    def __init__(self):
+        self.otel = False
+        self.slow_threshold: float | None = None
+        self.slow_log_path: str | None = None
+        self.slow_requests: deque[dict] = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    def configure(self, otel: bool = False, slow_threshold: float | None = None, slow_log_path: str | None = None, keep: int = 100):
+        """
+        Args:
+            otel: Mirror spans to the OpenTelemetry tracer provider. Needs opentelemetry-api.
+            slow_threshold: Seconds after which a top-level span counts as a slow request. None disables the slow log.
+            slow_log_path: A file slow requests are appended to, one JSON span tree per line.
+            keep: The number of slow requests kept in memory.
+        """
+        if otel and otel_trace is None:
+            logger.warning("opentelemetry is not installed, spans will not be exported")
+        self.otel = otel and otel_trace is not None
+        self.slow_threshold = slow_threshold
+        self.slow_log_path = slow_log_path
+        with self._lock:
+            self.slow_requests = deque(self.slow_requests, maxlen=keep)
+
+    def current(self) -> Span | None:
+        return _current_span.get()
+
+    def set_attribute(self, key: str, value):
+        span = self.current()
+        if span is not None:
+            span.set_attribute(key, value)
+
+    @contextmanager
+    def span(self, name: str, root: bool = False, **attributes):
+        """
+        Times the enclosed block as a child of the current span, or as a new trace if `root` is set
+        (for background work started from a request that won't wait for it).
+        """
+        parent = None if root else self.current()
+        span = Span(name, parent, attributes)
+        if parent is not None:
+            parent.children.append(span)
+
+        otel_span = None
+        if self.otel:
+            otel_span = otel_trace.get_tracer("vanna-svelte").start_as_current_span(name)
+            span._otel = otel_span.__enter__()
+            for key, value in attributes.items():
+                span.set_attribute(key, value)
+
+        token = _current_span.set(span)
+        # Passed to the OpenTelemetry span on exit, which records it and sets the span's status to error
+        exc_info = (None, None, None)
+        try:
+            yield span
+        except Exception as e:
+            span.set_attribute("error", repr(e))
+            exc_info = (type(e), e, e.__traceback__)
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Ended from a different context than it started in, e.g. a streamed Flask response
+                _current_span.set(parent)
+            if otel_span is not None:
+                otel_span.__exit__(*exc_info)
+            self._finish(span)
+
+    def record(self, name: str, start: float, parent: Span | None = None, **attributes) -> Span:
+        """
+        Records a span that has already finished, for work that can't be wrapped in span(), e.g. a generator
+        whose consumer yields control between tokens.
+
+        Args:
+            start: The time.perf_counter() value the work started at.
+            parent: The span it belongs to. Defaults to the current span.
+        """
+        parent = parent if parent is not None else self.current()
+        span = Span(name, parent, attributes, start=start)
+        if parent is not None:
+            parent.children.append(span)
+        self._finish(span)
+        return span
+
+    def wrap(self, fn: Callable) -> Callable:
+        """
+        Binds fn to the current span, so spans it opens on a worker thread become children of it.
+        """
+        context = contextvars.copy_context()
+
+        def run(*args, **kwargs):
+            return context.copy().run(fn, *args, **kwargs)
+        return run
+
+    def _finish(self, span: Span):
+        span.duration = time.perf_counter() - span.start
+        registry.histogram(
+            "vanna_span_duration_seconds", "Time spent in each step of the request pipeline", span=span.name
+        ).observe(span.duration)
+        if span.parent is None and self.slow_threshold is not None and span.duration >= self.slow_threshold:
+            self._log_slow(span.to_dict())
+
+    def _log_slow(self, trace: dict):
+        with self._lock:
+            self.slow_requests.append(trace)
+            if self.slow_log_path is not None:
+                with open(self.slow_log_path, "a") as f:
+                    f.write(json.dumps(trace, default=str) + "\n")
+
+
+tracer = Tracer()
+
+
+def observe_llm_call(prompt_tokens: int, response_tokens: int, request_bytes: int, response_bytes: int, span: Span | None = None):
+    """
+    Records the size of one LLM call on its span (by default the current one) and in the /metrics histograms.
+    """
+    span = span if span is not None else tracer.current()
+    if span is not None:
+        span.set_attribute("prompt_tokens", prompt_tokens)
+        span.set_attribute("response_tokens", response_tokens)
+        span.set_attribute("request_bytes", request_bytes)
+        span.set_attribute("response_bytes", response_bytes)
+    registry.histogram("vanna_llm_prompt_tokens", "Prompt tokens per LLM call", TOKEN_BUCKETS).observe(prompt_tokens)
+    registry.histogram("vanna_llm_response_tokens", "Completion tokens per LLM call", TOKEN_BUCKETS).observe(response_tokens)
+    registry.histogram("vanna_llm_request_bytes", "Request payload bytes per LLM call", BYTE_BUCKETS).observe(request_bytes)
+    registry.histogram("vanna_llm_response_bytes", "Response payload bytes per LLM call", BYTE_BUCKETS).observe(response_bytes)
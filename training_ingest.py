@@ -0,0 +1,355 @@
+"""
+Bulk loading of training data: DDL, documentation and question/SQL pairs from a SQL file,
+a JSONL file or the connected database's schema.
+
+    python training_ingest.py --sql dummy.sql --jsonl pairs.jsonl --schema --checkpoint .ingest
+"""
+import argparse
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+import sqlparse
+from vanna.base import VannaBase
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingItem:
+    """
+    One piece of training data. `kind` is "sql", "ddl" or "documentation"; `question` is only set for
+    "sql" items, and may be None if it should be generated from the SQL.
+    """
+    def __init__(self, kind: str, content: str, question: str | None = None):
+        self.kind = kind
+        self.content = content
+        self.question = question
+
+    @property
+    def key(self) -> str:
+        # The question is left out, so SQL whose question was generated on an earlier run still matches
+        return hashlib.sha256(f"{self.kind}\0{self.content}".encode("utf-8")).hexdigest()
+
+
+class IngestStats:
+    """
+    Counters for one ingestion run.
+    """
+    def __init__(self):
+        self.read = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self.written = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def to_dict(self) -> dict:
+        return {
+            "read": self.read,
+            "duplicates": self.duplicates,
+            "skipped": self.skipped,
+            "written": self.written,
+            "failed": self.failed,
+            "elapsed": round(self.elapsed, 3),
+            "items_per_second": round(self.written / self.elapsed, 1) if self.elapsed else 0.0,
+        }
+
+
+def items_from_sql(lines: Iterable[str]) -> Iterator[TrainingItem]:
+    """
+    Splits a stream of SQL into statements without reading it all into memory. CREATE statements become DDL
+    and SELECT statements question/SQL pairs; a `-- comment` directly above a SELECT is used as its question.
+    Other statements are skipped.
+    """
+    for statement in sqlparse.parsestream(lines):
+        text = str(statement).strip()
+        if not text:
+            continue
+        comments = re.findall(r"^\s*--\s*(.+)$", text, flags=re.MULTILINE)
+        content = sqlparse.format(text, strip_comments=True).strip()
+        kind = statement.get_type()
+        if kind == "CREATE":
+            yield TrainingItem("ddl", content)
+        elif kind == "SELECT":
+            yield TrainingItem("sql", content, question=comments[0].strip() if comments else None)
+        else:
+            yield TrainingItem("unsupported", content)
+
+
+def items_from_jsonl(lines: Iterable[str]) -> Iterator[TrainingItem]:
+    """
+    Reads one object per line: {"question", "sql"}, {"sql"}, {"ddl"} or {"documentation"}.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.get("sql"):
+            yield TrainingItem("sql", record["sql"], question=record.get("question"))
+        elif record.get("ddl"):
+            yield TrainingItem("ddl", record["ddl"])
+        elif record.get("documentation"):
+            yield TrainingItem("documentation", record["documentation"])
+        else:
+            yield TrainingItem("unsupported", line.strip())
+
+
+def items_from_schema(vn: VannaBase) -> Iterator[TrainingItem]:
+    """
+    Introspects the connected database: each table's CREATE statement on SQLite, otherwise
+    vanna's generic training plan built from INFORMATION_SCHEMA.COLUMNS.
+    """
+    if vn.dialect == "SQLite":
+        df = vn.run_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND sql IS NOT NULL")
+        for ddl in df["sql"]:
+            yield TrainingItem("ddl", ddl)
+        return
+
+    plan = vn.get_training_plan_generic(vn.run_sql("SELECT * FROM INFORMATION_SCHEMA.COLUMNS"))
+    for item in plan._plan:
+        yield TrainingItem("documentation", item.item_value)
+
+
+class Checkpoint:
+    """
+    The content hashes already written, appended to a file so an interrupted run can be resumed.
+    """
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.keys: set[str] = set()
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.keys = {line.strip() for line in f if line.strip()}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def add(self, keys: list[str]):
+        self.keys.update(keys)
+        if self.path is None:
+            return
+        with open(self.path, "a") as f:
+            f.writelines(f"{key}\n" for key in keys)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class Ingester:
+    """
+    Writes training items to a vector store in chunks. Items are deduplicated by content hash, questions
+    missing from question/SQL pairs are generated concurrently, and each chunk goes to the store's batch
+    methods (add_question_sql_batch etc.) when it has them, or to concurrent single-item calls otherwise.
+    Stores with a save() method (LocalVectorStore) are written without journaling and saved, with the
+    checkpoint advanced, every `save_every` chunks rather than after every write.
+
+    Args:
+        vn: The Vanna instance to train.
+        chunk_size: Items written per chunk.
+        checkpoint_path: File recording written items; reusing it skips them on the next run.
+        generate_questions: Generate questions for SQL without one. Otherwise such SQL is skipped.
+        workers: Threads for question generation and single-item writes.
+        retries: Attempts per chunk before the run fails.
+        save_every: Chunks between saves for stores with a save() method.
+        progress: Called with the stats after every chunk.
+    """
+    def __init__(
+            self,
+            vn: VannaBase,
+            chunk_size: int = 256,
+            checkpoint_path: str | None = None,
+            generate_questions: bool = True,
+            workers: int = 8,
+            retries: int = 3,
+            save_every: int = 8,
+            progress: Callable[[IngestStats], None] | None = None,
+        ):
+        self.vn = vn
+        self.chunk_size = chunk_size
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.generate_questions = generate_questions
+        self.workers = workers
+        self.retries = retries
+        self.save_every = save_every if hasattr(vn, "save") else 1
+        self.progress = progress or (lambda stats: logger.info("Ingested: %s", stats.to_dict()))
+
+    def ingest(self, items: Iterable[TrainingItem]) -> IngestStats:
+        stats = IngestStats()
+        seen: set[str] = set()
+        chunk: list[TrainingItem] = []
+        pending: list[str] = []
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for item in items:
+                stats.read += 1
+                if item.kind == "unsupported":
+                    stats.skipped += 1
+                    continue
+                if item.key in seen or item.key in self.checkpoint:
+                    stats.duplicates += 1
+                    continue
+                seen.add(item.key)
+                chunk.append(item)
+                if len(chunk) >= self.chunk_size:
+                    pending += self._write_chunk(chunk, pool, stats)
+                    chunk = []
+                    if len(pending) >= self.chunk_size * self.save_every:
+                        self._commit(pending)
+                        pending = []
+                    self.progress(stats)
+            if chunk:
+                pending += self._write_chunk(chunk, pool, stats)
+            self._commit(pending)
+            self.progress(stats)
+        return stats
+
+    def _commit(self, keys: list[str]):
+        if hasattr(self.vn, "save"):
+            self.vn.save()
+        self.checkpoint.add(keys)
+
+    def _write_chunk(self, chunk: list[TrainingItem], pool: ThreadPoolExecutor, stats: IngestStats) -> list[str]:
+        missing = [item for item in chunk if item.kind == "sql" and not item.question]
+        if missing and self.generate_questions:
+            for item, question in zip(missing, pool.map(lambda item: self.vn.generate_question(item.content), missing)):
+                item.question = question
+        writable = [item for item in chunk if item.kind != "sql" or item.question]
+        stats.skipped += len(chunk) - len(writable)
+
+        for attempt in range(self.retries):
+            try:
+                self._write(writable, pool)
+                break
+            except Exception as e:
+                if attempt == self.retries - 1:
+                    stats.failed += len(writable)
+                    raise
+                logger.warning("Ingest chunk failed (%s), retrying", e)
+                time.sleep(2 ** attempt)
+
+        # Writing to the store directly bypasses vn.train, which is where DDL reaches the SQL validator
+        if hasattr(self.vn, "learn_ddl"):
+            self.vn.learn_ddl([item.content for item in writable if item.kind == "ddl"])
+        stats.written += len(writable)
+        return [item.key for item in writable]
+
+    def _write(self, items: list[TrainingItem], pool: ThreadPoolExecutor):
+        by_kind = {kind: [item for item in items if item.kind == kind] for kind in ("sql", "ddl", "documentation")}
+        if hasattr(self.vn, "add_question_sql_batch"):
+            # Saved by _commit, so journaling each chunk would only write it twice. Only this call skips the
+            # journal: training done through the UI meanwhile is still journaled
+            journal = not hasattr(self.vn, "save")
+            self.vn.add_question_sql_batch([(item.question, item.content) for item in by_kind["sql"]], journal=journal)
+            self.vn.add_ddl_batch([item.content for item in by_kind["ddl"]], journal=journal)
+            self.vn.add_documentation_batch([item.content for item in by_kind["documentation"]], journal=journal)
+            return
+
+        writers = {
+            "sql": lambda item: self.vn.add_question_sql(question=item.question, sql=item.content),
+            "ddl": lambda item: self.vn.add_ddl(item.content),
+            "documentation": lambda item: self.vn.add_documentation(item.content),
+        }
+        list(pool.map(lambda item: writers[item.kind](item), items))
+
+
+class IngestJobs:
+    """
+    Runs ingestion in the background, one job at a time, so an upload returns as soon as it is
+    received. Finished jobs are kept, up to `keep`, for their stats to be polled.
+    """
+    def __init__(self, vn: VannaBase, keep: int = 100, **ingester_kwargs):
+        self.vn = vn
+        self.keep = keep
+        self.ingester_kwargs = ingester_kwargs
+        self.jobs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+
+    def submit(self, items: Iterable[TrainingItem], owner: str | None = None, cleanup: Callable[[], None] | None = None) -> str:
+        """
+        Queues the items for ingestion and returns the job's id. `cleanup` is called when the job ends,
+        e.g. to remove the spooled upload the items are read from.
+        """
+        job = {"id": str(uuid.uuid4()), "owner": owner, "status": "queued", "stats": None, "error": None, "created": time.time()}
+        with self._lock:
+            self.jobs[job["id"]] = job
+            finished = [id for id, other in self.jobs.items() if other["status"] in ("done", "failed")]
+            for id in finished[:max(0, len(self.jobs) - self.keep)]:
+                del self.jobs[id]
+        # In the caller's context, so the LLM calls are routed for its tenant
+        self._pool.submit(contextvars.copy_context().run, self._run, job, items, cleanup)
+        return job["id"]
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _run(self, job: dict, items: Iterable[TrainingItem], cleanup: Callable[[], None] | None):
+        def progress(stats: IngestStats):
+            job["stats"] = stats.to_dict()
+
+        job["status"] = "running"
+        try:
+            stats = Ingester(self.vn, progress=progress, **self.ingester_kwargs).ingest(items)
+            job["stats"] = stats.to_dict()
+            job["status"] = "done"
+        except Exception as e:
+            logger.exception("Ingest job %s failed", job["id"])
+            job["error"] = str(e)
+            job["status"] = "failed"
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+
+def main():
+    from server import create_vanna
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sql", action="append", default=[], help="A file of SQL statements")
+    parser.add_argument("--jsonl", action="append", default=[], help="A file of question/sql, ddl or documentation objects")
+    parser.add_argument("--schema", action="store_true", help="Introspect the connected database")
+    parser.add_argument("--checkpoint", help="Resume from (and record progress in) this file")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--no-generate-questions", action="store_true", help="Skip SQL that has no question")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    vn = create_vanna()
+    ingester = Ingester(
+        vn,
+        chunk_size=args.chunk_size,
+        checkpoint_path=args.checkpoint,
+        generate_questions=not args.no_generate_questions,
+        workers=args.workers,
+    )
+
+    def items():
+        if args.schema:
+            yield from items_from_schema(vn)
+        for path in args.sql:
+            with open(path) as f:
+                yield from items_from_sql(f)
+        for path in args.jsonl:
+            with open(path) as f:
+                yield from items_from_jsonl(f)
+
+    stats = ingester.ingest(items())
+    print(json.dumps(stats.to_dict()))
+
+
+if __name__ == "__main__":
+    main()